@@ -0,0 +1,507 @@
+"""Benchmarks for the mind map editor.
+
+Runs under the offscreen Qt platform, so no display is needed:
+
+    python benchmarks.py save --sizes 1000 10000 100000
+    python benchmarks.py arrange --sizes 10000 100000 --mode radial
+    python benchmarks.py suite --sizes 1000 10000 --output new.json
+    python benchmarks.py compare old.json new.json
+    python benchmarks.py generate map.mmb --size 50000 --depth 8 --fan-out 6
+
+suite times the editor's hot paths (see BENCHMARKS) on maps made by
+generate_map, which are the same for the same seed and parameters, and
+writes the timings, peak memory and scene item counts as JSON. Each
+benchmark and size runs in a process of its own, so the peak RSS is its
+own. compare reads two such files and exits with 1 if any timing got
+slower by more than --threshold.
+"""
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import resource
+except ImportError:  # Not on Windows
+    resource = None
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "the code.py")
+
+
+def load_app():
+    """Import the editor module (its file name is not a valid module name)"""
+    spec = importlib.util.spec_from_file_location("mindmap_app", APP_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def generate_map(n, seed=0, depth=None, fan_out=None, link_density=0.05):
+    """Random tree of n nodes in the save_mindmap JSON schema.
+
+    Nodes hang below a random earlier node, at most depth levels below the
+    root and fan_out children to a node if given. link_density is the
+    number of cross-links per node. The same arguments give the same map.
+    """
+    rng = random.Random(seed)
+    nodes = []
+    for i in range(n):
+        nodes.append({
+            "id": i,
+            "x": rng.uniform(-5000, 5000),
+            "y": rng.uniform(-5000, 5000),
+            "text": "Idea %d" % i,
+            "color": "#%06x" % rng.randint(0, 0xffffff),
+            "node_type": "ellipse" if rng.random() < 0.8 else "rectangle",
+            "width": 90,
+            "height": 50,
+            "level": 0,
+            "notes": "",
+            "collapsed": False,
+            "children": []
+        })
+    if depth is None and fan_out is None:
+        for i in range(1, n):
+            parent = rng.randrange(i)
+            nodes[parent]["children"].append(i)
+            nodes[i]["level"] = nodes[parent]["level"] + 1
+    else:
+        growing = [0] if n and depth != 0 else []  # Nodes that may take more children
+        for i in range(1, n):
+            if not growing:
+                raise ValueError("%d nodes do not fit in %s levels of %s children" % (n, depth, fan_out))
+            k = rng.randrange(len(growing))
+            parent = nodes[growing[k]]
+            parent["children"].append(i)
+            nodes[i]["level"] = parent["level"] + 1
+            if fan_out is not None and len(parent["children"]) >= fan_out:
+                growing[k] = growing[-1]
+                growing.pop()
+            if depth is None or nodes[i]["level"] < depth:
+                growing.append(i)
+    connections = []
+    for _ in range(int(n * link_density)):
+        i, j = rng.randrange(n), rng.randrange(n)
+        if i != j:
+            connections.append([min(i, j), max(i, j)])
+    return {"nodes": nodes, "connections": connections, "root_node_index": 0 if n else -1}
+
+
+def replay_script(steps, seed=0):
+    """Seeded drag, zoom and pan steps for replay.
+
+    ("drag", where, dx, dy) drags the visible node at fraction where of
+    them by (dx, dy) pixels, ("zoom", clicks) turns the wheel and
+    ("pan", dx, dy) scrolls by pixels.
+    """
+    rng = random.Random(seed)
+    script = []
+    for _ in range(steps):
+        kind = rng.choice(("drag", "drag", "zoom", "pan"))
+        if kind == "drag":
+            script.append(("drag", rng.random(), rng.randint(-200, 200), rng.randint(-200, 200)))
+        elif kind == "zoom":
+            script.append(("zoom", rng.choice((-3, -2, -1, 1, 2, 3))))
+        else:
+            script.append(("pan", rng.randint(-400, 400), rng.randint(-300, 300)))
+    return script
+
+
+def grab_point(view, node):
+    """Viewport point on a node's body, not on its text (a click there edits the text)"""
+    rect = node.sceneBoundingRect()
+    text_top = node.text_item.sceneBoundingRect().top()
+    return view.mapFromScene(rect.center().x(), (rect.top() + max(rect.top(), text_top)) / 2 + 1)
+
+
+def replay(app, view, script, moves_per_drag=10):
+    """Play a replay_script on a shown view with real mouse and wheel events.
+
+    Every event is followed by the repaint it causes. Returns the frame
+    times in seconds per kind of step.
+    """
+    from PyQt5.QtCore import QEvent, QPoint, QPointF
+    from PyQt5.QtGui import QMouseEvent, QWheelEvent
+    qt_app = app.QApplication.instance()
+    Qt = app.Qt
+    viewport = view.viewport()
+    frames = {"drag": [], "zoom": [], "pan": []}
+
+    def frame(kind, event=None):
+        start = time.perf_counter()
+        if event is not None:
+            qt_app.sendEvent(viewport, event)
+        qt_app.processEvents()
+        frames[kind].append(time.perf_counter() - start)
+
+    def mouse(kind, pos, button, buttons):
+        # The scene finds the item under the screen position, not QCursor.pos() as by default
+        return QMouseEvent(kind, QPointF(pos), QPointF(viewport.mapTo(view.window(), pos)),
+                           QPointF(viewport.mapToGlobal(pos)), button, buttons, Qt.NoModifier)
+
+    for step in script:
+        if step[0] == "drag":
+            _, where, dx, dy = step
+            shown = sorted(view.nodes_in_rect(view.mapToScene(viewport.rect()).boundingRect()),
+                           key=lambda node: node.node_id)
+            if not shown:
+                # Scrolled off the map, go back to one of its nodes
+                shown = sorted((node for node in view.nodes.values() if node.isVisible()),
+                               key=lambda node: node.node_id)
+                if not shown:
+                    continue
+                view.centerOn(shown[int(where * len(shown))])
+                qt_app.processEvents()
+            pos = grab_point(view, shown[int(where * len(shown))])
+            frame("drag", mouse(QEvent.MouseButtonPress, pos, Qt.LeftButton, Qt.LeftButton))
+            for k in range(1, moves_per_drag + 1):
+                to = pos + QPoint(dx * k // moves_per_drag, dy * k // moves_per_drag)
+                frame("drag", mouse(QEvent.MouseMove, to, Qt.NoButton, Qt.LeftButton))
+            frame("drag", mouse(QEvent.MouseButtonRelease, to, Qt.LeftButton, Qt.NoButton))
+        elif step[0] == "zoom":
+            center = QPointF(viewport.rect().center())
+            for _ in range(abs(step[1])):
+                angle = QPoint(0, 120 if step[1] > 0 else -120)
+                frame("zoom", QWheelEvent(center, QPointF(viewport.mapToGlobal(center.toPoint())), QPoint(),
+                                          angle, Qt.NoButton, Qt.NoModifier, Qt.NoScrollPhase, False))
+        else:
+            _, dx, dy = step
+            view.horizontalScrollBar().setValue(view.horizontalScrollBar().value() + dx)
+            view.verticalScrollBar().setValue(view.verticalScrollBar().value() + dy)
+            frame("pan")
+    return frames
+
+
+def bench_save(app, sizes, repeat):
+    """Time MindMapView.save_mindmap for maps of increasing size"""
+    qt_app = app.QApplication.instance() or app.QApplication(sys.argv)
+    print("%10s %12s %14s" % ("nodes", "save (s)", "us per node"))
+    with tempfile.TemporaryDirectory() as tmp:
+        src = os.path.join(tmp, "in.json")
+        out = os.path.join(tmp, "out.json")
+        for n in sizes:
+            with open(src, "w") as f:
+                json.dump(generate_map(n), f)
+            view = app.MindMapView()
+            view.load_mindmap(src)
+            best = float("inf")
+            for _ in range(repeat):
+                start = time.perf_counter()
+                view.save_mindmap(out)
+                best = min(best, time.perf_counter() - start)
+            print("%10d %12.3f %14.2f" % (n, best, best / n * 1e6))
+            view.clear_mindmap()
+            qt_app.processEvents()
+
+
+def bench_arrange(app, sizes, repeat, mode, layout_only):
+    """Time the tidy tree layout alone and MindMapView.auto_arrange_nodes as a whole"""
+    from mindmap_layout import tidy_layout
+    qt_app = None if layout_only else app.QApplication.instance() or app.QApplication(sys.argv)
+    print("%10s %12s %12s %14s" % ("nodes", "layout (s)", "arrange (s)", "us per node"))
+    with tempfile.TemporaryDirectory() as tmp:
+        src = os.path.join(tmp, "in.json")
+        for n in sizes:
+            data = generate_map(n)
+            children = [node["children"] for node in data["nodes"]]
+            widths = [node["width"] for node in data["nodes"]]
+            heights = [node["height"] for node in data["nodes"]]
+            layout = arrange = float("inf")
+            for _ in range(repeat):
+                start = time.perf_counter()
+                tidy_layout(children, widths, heights, 0, mode)
+                layout = min(layout, time.perf_counter() - start)
+            if not layout_only:
+                with open(src, "w") as f:
+                    json.dump(data, f)
+                view = app.MindMapView()
+                view.load_mindmap(src)
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    view.auto_arrange_nodes(mode)
+                    arrange = min(arrange, time.perf_counter() - start)
+                view.clear_mindmap()
+                qt_app.processEvents()
+            total = layout if layout_only else arrange
+            print("%10d %12.3f %12s %14.2f" % (n, layout, "-" if layout_only else "%.3f" % arrange,
+                                               total / n * 1e6))
+
+
+def peak_rss_kb():
+    """Peak resident memory of this process in KiB, None where unknown"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == "darwin" else peak  # Bytes on macOS
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+# The benchmarks of suite. Each gets a view with the generated map loaded
+# (but load, which loads it) and the options, and returns the seconds
+# taken, the number of operations timed and any extra results.
+
+def suite_load(app, view, options):
+    start = time.perf_counter()
+    view.load_mindmap(options["map_path"])
+    return time.perf_counter() - start, 1, {}
+
+
+def suite_save(app, view, options):
+    start = time.perf_counter()
+    view.save_mindmap(os.path.join(options["tmp"], "saved.json"))
+    return time.perf_counter() - start, 1, {}
+
+
+def suite_add_child(app, view, options):
+    rng = random.Random(options["seed"])
+    nodes = sorted(view.nodes.values(), key=lambda node: node.node_id)
+    parents = [nodes[rng.randrange(len(nodes))] for _ in range(options["ops"])]
+    start = time.perf_counter()
+    for parent in parents:
+        view.add_child_node(parent)
+    return time.perf_counter() - start, len(parents), {}
+
+
+def suite_collapse(app, view, options):
+    """Fold and unfold branches, as the context menu does"""
+    rng = random.Random(options["seed"])
+    branches = sorted((node for node in view.nodes.values() if node.children), key=lambda node: node.node_id)
+    picked = [branches[rng.randrange(len(branches))] for _ in range(options["ops"] // 2)] if branches else []
+    start = time.perf_counter()
+    for node in picked:
+        for _ in range(2):
+            node.toggle_collapse()
+            view.record_edit(app.CollapseCommand(view, node))
+    return time.perf_counter() - start, 2 * len(picked), {}
+
+
+def suite_arrange(app, view, options):
+    start = time.perf_counter()
+    view.auto_arrange_nodes(options["mode"])
+    return time.perf_counter() - start, 1, {}
+
+
+def suite_export(app, view, options):
+    start = time.perf_counter()
+    view.export_to_image(os.path.join(options["tmp"], "export.png"), scale=options["scale"])
+    return time.perf_counter() - start, 1, {}
+
+
+def suite_plan(app, view, options):
+    """Plan loading the map with the branches below level 2 folded, as the parse thread does"""
+    with open(options["map_path"]) as f:
+        data = json.load(f)
+    for node_data in data["nodes"]:
+        node_data["collapsed"] = node_data["level"] == 2
+    start = time.perf_counter()
+    app.MindMapLoader.plan(data)
+    return time.perf_counter() - start, 1, {}
+
+
+def suite_search(app, view, options):
+    """The first search after loading, which indexes every node"""
+    start = time.perf_counter()
+    view.find("idea 1")
+    return time.perf_counter() - start, 1, {}
+
+
+def suite_replay(app, view, options):
+    """Scripted drags, zooms and pans, see replay"""
+    view.centerOn(view.root_node)
+    app.QApplication.instance().processEvents()
+    frames = replay(app, view, replay_script(options["steps"], options["seed"]))
+    stats = {kind: {"frames": len(times), "mean_ms": 1000 * sum(times) / len(times),
+                    "p95_ms": 1000 * _percentile(times, 0.95), "max_ms": 1000 * max(times)}
+             for kind, times in frames.items() if times}
+    return sum(sum(times) for times in frames.values()), sum(len(times) for times in frames.values()), \
+        {"frames": stats}
+
+
+BENCHMARKS = {"load": suite_load, "save": suite_save, "add_child": suite_add_child,
+              "collapse": suite_collapse, "arrange": suite_arrange, "export": suite_export,
+              "plan": suite_plan, "search": suite_search, "replay": suite_replay}
+
+
+def run_case(name, n, options, app=None):
+    """Run one benchmark on a generated map of n nodes, best of options["repeat"] runs.
+
+    Returns the result as a dict fit for JSON.
+    """
+    app = app or load_app()
+    qt_app = app.QApplication.instance() or app.QApplication([sys.argv[0]])
+    runs, ops, extra, items = [], 0, {}, 0
+    with tempfile.TemporaryDirectory() as tmp:
+        map_path = os.path.join(tmp, "map.json")
+        with open(map_path, "w") as f:
+            json.dump(generate_map(n, options["seed"], options["depth"], options["fan_out"],
+                                   options["link_density"]), f)
+        case_options = dict(options, map_path=map_path, tmp=tmp)
+        for _ in range(options["repeat"]):
+            view = app.MindMapView()
+            view.resize(1024, 768)
+            view.show()
+            if name != "load":
+                view.load_mindmap(map_path)
+            qt_app.processEvents()
+            seconds, ops, extra = BENCHMARKS[name](app, view, case_options)
+            runs.append(seconds)
+            qt_app.processEvents()
+            items = len(view.scene.items())
+            view.close()
+            view.clear_mindmap()
+            view.deleteLater()
+            qt_app.processEvents()
+    best = min(runs)
+    result = {"benchmark": name, "nodes": n, "seconds": best, "runs": runs, "ops": ops,
+              "ms_per_op": 1000 * best / ops if ops else None, "scene_items": items,
+              "peak_rss_kb": peak_rss_kb()}
+    result.update(extra)
+    return result
+
+
+def _qt_version():
+    from PyQt5.QtCore import QT_VERSION_STR
+    return QT_VERSION_STR
+
+
+def run_suite(names, sizes, options, isolate=True, report=None):
+    """Run the named benchmarks on every size, returns the results file contents.
+
+    With isolate, every case runs in a new process, so that its peak RSS
+    and caches are its own. report, if given, is called with each result.
+    """
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(APP_PATH),
+                                capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    app = None if isolate else load_app()
+    results = []
+    for n in sizes:
+        for name in names:
+            if isolate:
+                with ProcessPoolExecutor(1) as pool:
+                    result = pool.submit(run_case, name, n, options).result()
+            else:
+                result = run_case(name, n, options, app)
+            results.append(result)
+            if report:
+                report(result)
+    if isolate:
+        with ProcessPoolExecutor(1) as pool:
+            qt_version = pool.submit(_qt_version).result()
+    else:
+        qt_version = _qt_version()
+    return {"commit": commit, "time": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(),
+            "qt": qt_version, "platform": platform.platform(), "options": options, "results": results}
+
+
+def compare_results(old, new, threshold=0.1):
+    """Pair up the results of two suite runs, returns rows of
+    (benchmark, nodes, old seconds, new seconds, slower by more than threshold)"""
+    before = {(result["benchmark"], result["nodes"]): result for result in old["results"]}
+    rows = []
+    for result in new["results"]:
+        previous = before.get((result["benchmark"], result["nodes"]))
+        if previous is not None:
+            rows.append((result["benchmark"], result["nodes"], previous["seconds"], result["seconds"],
+                         result["seconds"] > previous["seconds"] * (1 + threshold)))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest="benchmark", required=True)
+    save = sub.add_parser("save", help="save_mindmap time against map size")
+    save.add_argument("--sizes", type=int, nargs="+",
+                      default=[1000, 2000, 5000, 10000, 20000, 50000, 100000])
+    save.add_argument("--repeat", type=int, default=3)
+    arrange = sub.add_parser("arrange", help="auto_arrange_nodes time against map size")
+    arrange.add_argument("--sizes", type=int, nargs="+", default=[10000, 20000, 50000, 100000])
+    arrange.add_argument("--repeat", type=int, default=3)
+    arrange.add_argument("--mode", default="balanced", help="layout mode, see mindmap_layout")
+    arrange.add_argument("--layout-only", action="store_true",
+                         help="time only the layout computation, without building the scene")
+    suite = sub.add_parser("suite", help="time the hot paths and write the results as JSON")
+    suite.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000])
+    suite.add_argument("--benchmarks", nargs="+", choices=list(BENCHMARKS), default=list(BENCHMARKS))
+    suite.add_argument("--repeat", type=int, default=3)
+    suite.add_argument("--ops", type=int, default=200, help="edits timed by add_child and collapse")
+    suite.add_argument("--steps", type=int, default=40, help="steps of the replay script")
+    suite.add_argument("--mode", default="balanced", help="layout mode of arrange")
+    suite.add_argument("--scale", type=float, default=0.1, help="pixels per scene unit of export")
+    suite.add_argument("--in-process", action="store_true", help="run every case in this process")
+    suite.add_argument("--output", "-o", help="JSON results file")
+    compare = sub.add_parser("compare", help="compare two suite results files")
+    compare.add_argument("old")
+    compare.add_argument("new")
+    compare.add_argument("--threshold", type=float, default=0.1, help="slowdown reported as a regression")
+    generate = sub.add_parser("generate", help="write a generated map to a .json or .mmb file")
+    generate.add_argument("file")
+    generate.add_argument("--size", type=int, default=10000)
+    for command_parser in (suite, generate):
+        command_parser.add_argument("--seed", type=int, default=0)
+        command_parser.add_argument("--depth", type=int, help="most levels below the root")
+        command_parser.add_argument("--fan-out", type=int, help="most children of a node")
+        command_parser.add_argument("--link-density", type=float, default=0.05, help="cross-links per node")
+    args = parser.parse_args(argv)
+
+    if args.benchmark == "compare":
+        with open(args.old) as f:
+            old = json.load(f)
+        with open(args.new) as f:
+            new = json.load(f)
+        rows = compare_results(old, new, args.threshold)
+        print("%-10s %10s %12s %12s %8s" % ("benchmark", "nodes", "old (s)", "new (s)", "ratio"))
+        for name, n, before, after, slower in rows:
+            print("%-10s %10d %12.4f %12.4f %8.2f%s" % (name, n, before, after, after / before if before else 0,
+                                                       "  slower" if slower else ""))
+        return 1 if any(row[4] for row in rows) else 0
+    if args.benchmark == "generate":
+        from mindmap_format import write_mindmap_file
+        write_mindmap_file(generate_map(args.size, args.seed, args.depth, args.fan_out, args.link_density),
+                           args.file)
+        return 0
+    if args.benchmark == "suite":
+        options = {name: getattr(args, name) for name in ("seed", "depth", "fan_out", "link_density", "repeat",
+                                                           "ops", "steps", "mode", "scale")}
+        print("%-10s %10s %12s %12s %12s %10s" % ("benchmark", "nodes", "best (s)", "ms per op", "peak KiB",
+                                                  "items"))
+
+        def report(result):
+            print("%-10s %10d %12.4f %12.3f %12s %10d" % (result["benchmark"], result["nodes"], result["seconds"],
+                                                         result["ms_per_op"], result["peak_rss_kb"],
+                                                         result["scene_items"]))
+            for kind, stats in result.get("frames", {}).items():
+                print("    %-6s %5d frames, mean %.2f ms, p95 %.2f ms, max %.2f ms"
+                      % (kind, stats["frames"], stats["mean_ms"], stats["p95_ms"], stats["max_ms"]))
+
+        results = run_suite(args.benchmarks, args.sizes, options, not args.in_process, report)
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(results, f, indent=1)
+        return 0
+
+    app = load_app()
+    if args.benchmark == "save":
+        bench_save(app, args.sizes, args.repeat)
+    elif args.benchmark == "arrange":
+        bench_arrange(app, args.sizes, args.repeat, args.mode, args.layout_only)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,142 @@
+"""Batch processing of mind map files, without a display or PyQt widgets.
+
+    python mindmap_cli.py info maps/*.json
+    python mindmap_cli.py convert maps/*.json --format .mmb --output-dir out
+    python mindmap_cli.py arrange maps/*.mmb --mode radial --output-dir out
+    python mindmap_cli.py render maps/*.json --format .png --scale 0.5 --output-dir out
+
+Files are handled in parallel on a pool of --jobs processes, one per CPU
+by default (--jobs 0 handles them one by one in this process). Maps are
+loaded as mindmap_model.MindMap; only render needs PyQt, and only its
+QtGui part, running on the offscreen platform (see mindmap_render).
+Outputs go next to their inputs unless --output-dir is given. A failed
+file is reported and the others go on, the exit status is 1 if any failed.
+"""
+import argparse
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from mindmap_format import BINARY_EXTENSION
+from mindmap_layout import LAYOUT_MODES
+from mindmap_model import MindMap
+
+
+def output_path(file_path, extension, output_dir):
+    """Where the output for an input file goes, with the given extension"""
+    base = os.path.splitext(os.path.basename(file_path))[0] + extension
+    return os.path.join(output_dir if output_dir else os.path.dirname(file_path), base)
+
+
+def info(file_path, options):
+    mindmap = MindMap.load(file_path)
+    links = sum(len(record.links) for record in mindmap.records.values()) // 2
+    hidden = len(mindmap.records) - len(mindmap.shown())
+    return "%d nodes, %d connections, %d hidden" % (len(mindmap), links, hidden)
+
+
+def convert(file_path, options):
+    target = output_path(file_path, options["format"], options["output_dir"])
+    if os.path.abspath(target) == os.path.abspath(file_path):
+        raise ValueError("already %s" % options["format"])
+    MindMap.load(file_path).save(target)
+    return target
+
+
+def arrange(file_path, options):
+    extension = options["format"] or os.path.splitext(file_path)[1]
+    target = output_path(file_path, extension, options["output_dir"])
+    if os.path.abspath(target) == os.path.abspath(file_path) and not options["in_place"]:
+        raise ValueError("would overwrite the input, give --output-dir or --in-place")
+    mindmap = MindMap.load(file_path)
+    mindmap.arrange(options["mode"])
+    mindmap.save(target)
+    return target
+
+
+def render(file_path, options):
+    from mindmap_render import render_mindmap  # Loads Qt, in the worker process
+    target = output_path(file_path, options["format"], options["output_dir"])
+    mindmap = MindMap.load(file_path)
+    if options["mode"]:
+        mindmap.arrange(options["mode"])
+    width, height = render_mindmap(mindmap, target, options["theme"], scale=options["scale"], dpi=options["dpi"])
+    return "%s (%dx%d)" % (target, width, height)
+
+
+COMMANDS = {"info": info, "convert": convert, "arrange": arrange, "render": render}
+
+
+def run_task(command, file_path, options):
+    """Run one command on one file, returns (file_path, message, ok)"""
+    try:
+        return file_path, COMMANDS[command](file_path, options), True
+    except Exception as e:  # Whatever a broken file throws, the batch goes on
+        return file_path, "%s: %s" % (type(e).__name__, e), False
+
+
+def run_batch(command, files, options, jobs=None, report=None):
+    """Run a command on many files, jobs processes at a time.
+
+    jobs defaults to the number of CPUs, 0 runs everything in this
+    process. report, if given, is called with every (file_path, message,
+    ok) as files finish. Returns the results in the order of files.
+    """
+    results = {}
+    if jobs == 0:
+        for file_path in files:
+            results[file_path] = run_task(command, file_path, options)
+            if report:
+                report(*results[file_path])
+    else:
+        with ProcessPoolExecutor(jobs) as pool:
+            futures = [pool.submit(run_task, command, file_path, options) for file_path in files]
+            for future in as_completed(futures):
+                result = future.result()
+                results[result[0]] = result
+                if report:
+                    report(*result)
+    return [results[file_path] for file_path in files]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--jobs", "-j", type=int, default=None,
+                        help="worker processes (default: one per CPU, 0: none)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("info", help="count the nodes and connections of maps")
+    convert_parser = sub.add_parser("convert", help="convert maps between JSON and the binary format")
+    convert_parser.add_argument("--format", choices=(".json", BINARY_EXTENSION), default=BINARY_EXTENSION)
+    arrange_parser = sub.add_parser("arrange", help="lay maps out like Auto-Arrange Nodes")
+    arrange_parser.add_argument("--mode", choices=LAYOUT_MODES, default="balanced")
+    arrange_parser.add_argument("--format", choices=(".json", BINARY_EXTENSION),
+                                help="output format (default: the input's)")
+    arrange_parser.add_argument("--in-place", action="store_true", help="overwrite the input files")
+    render_parser = sub.add_parser("render", help="render maps to images")
+    render_parser.add_argument("--format", default=".png", help="image file extension (.png, .svg, .pdf, ...)")
+    render_parser.add_argument("--scale", type=float, default=1.0, help="pixels per scene unit")
+    render_parser.add_argument("--dpi", type=int, default=96)
+    render_parser.add_argument("--mode", choices=LAYOUT_MODES, help="arrange in this layout mode first")
+    render_parser.add_argument("--theme", default="Classic", help="theme to draw in (Classic, Night or Pastel)")
+    for command_parser in (convert_parser, arrange_parser, render_parser):
+        command_parser.add_argument("--output-dir", help="directory for the outputs (default: next to the inputs)")
+    for command_parser in sub.choices.values():
+        command_parser.add_argument("files", nargs="+")
+    args = parser.parse_args(argv)
+
+    options = {name: value for name, value in vars(args).items() if name not in ("command", "files", "jobs")}
+    options.setdefault("output_dir", None)
+    if options.get("format") and not options["format"].startswith("."):
+        options["format"] = "." + options["format"]
+    if options["output_dir"]:
+        os.makedirs(options["output_dir"], exist_ok=True)
+
+    def report(file_path, message, ok):
+        print("%s: %s" % (file_path, message), file=sys.stdout if ok else sys.stderr)
+
+    results = run_batch(args.command, args.files, options, args.jobs, report)
+    return 0 if all(ok for _, _, ok in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,123 @@
+"""PNG output written a band of rows at a time, for exports of any size.
+
+Qt can only write an image it holds completely in memory. PngStreamWriter
+writes a PNG a band of rows at a time instead, so MindMapView's tiled
+export never needs more than one band of pixels, however large the map.
+"""
+import struct
+import zlib
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+def _adler32_combine(adler1, adler2, length2):
+    """Adler-32 of two byte strings joined, from their checksums and the second length"""
+    base = 65521
+    rem = length2 % base
+    sum1 = adler1 & 0xffff
+    sum2 = (rem * sum1) % base
+    sum1 += (adler2 & 0xffff) + base - 1
+    sum2 += (adler1 >> 16) + (adler2 >> 16) + base - rem
+    return ((sum2 % base) << 16) | (sum1 % base)
+
+
+def encode_rows(rows, level=6):
+    """Compress a band of PNG rows on its own, returns a band for PngStreamWriter.write_band.
+
+    The band is a raw deflate stream ending on a byte boundary, so bands
+    encoded separately (on worker threads, say) can be written one after
+    the other. zlib works without holding the GIL, so this runs in parallel.
+    """
+    filtered = b"".join(b"\0" + row for row in rows)  # Filter type None on every row
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    data = compressor.compress(filtered) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    return data, zlib.adler32(filtered), len(filtered), len(rows)
+
+
+class PngStreamWriter:
+    """Write an 8-bit RGB PNG band by band.
+
+    Every band of rows is compressed separately (see encode_rows) and
+    written out as IDAT chunks of about chunk_size bytes, so memory use
+    does not depend on the image height. dpi, if given, is stored as the
+    physical pixel size.
+    """
+
+    def __init__(self, file_path, width, height, dpi=None, level=6, chunk_size=1 << 20):
+        if width <= 0 or height <= 0:
+            raise ValueError("PNG size must be positive, got %dx%d" % (width, height))
+        self.width = width
+        self.height = height
+        self.level = level
+        self.rows = 0
+        self.adler = 1  # Adler-32 of no data
+        self.chunk_size = chunk_size
+        self.pending = [b"\x78\x9c"]  # zlib header, 32K window
+        self.pending_size = 2
+        self.file = open(file_path, "wb")
+        self.file.write(PNG_SIGNATURE)
+        self._chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+        if dpi:
+            per_meter = int(round(dpi / 0.0254))
+            self._chunk(b"pHYs", struct.pack(">IIB", per_meter, per_meter, 1))
+
+    def _chunk(self, kind, data):
+        self.file.write(struct.pack(">I", len(data)))
+        self.file.write(kind)
+        self.file.write(data)
+        self.file.write(struct.pack(">I", zlib.crc32(data, zlib.crc32(kind)) & 0xffffffff))
+
+    def _emit(self, data):
+        if data:
+            self.pending.append(data)
+            self.pending_size += len(data)
+            if self.pending_size >= self.chunk_size:
+                self._flush_pending()
+
+    def _flush_pending(self):
+        if self.pending:
+            self._chunk(b"IDAT", b"".join(self.pending))
+            self.pending = []
+            self.pending_size = 0
+
+    def write_rows(self, rows):
+        """Append rows, each width * 3 bytes of RGB"""
+        row_size = self.width * 3
+        rows = list(rows)
+        for row in rows:
+            if len(row) != row_size:
+                raise ValueError("Expected a %d byte row, got %d" % (row_size, len(row)))
+        self.write_band(encode_rows(rows, self.level))
+
+    def write_band(self, band):
+        """Append a band made by encode_rows, bands must come in top to bottom order"""
+        data, adler, length, rows = band
+        if length != rows * (self.width * 3 + 1):
+            raise ValueError("Band rows are not %d pixels wide" % self.width)
+        if self.rows + rows > self.height:
+            raise ValueError("More rows than the %d the PNG was created with" % self.height)
+        self._emit(data)
+        self.adler = _adler32_combine(self.adler, adler, length)
+        self.rows += rows
+
+    def close(self):
+        if self.file.closed:
+            return
+        try:
+            if self.rows != self.height:
+                raise ValueError("PNG got %d of its %d rows" % (self.rows, self.height))
+            # Empty final block, then the checksum of all the filtered rows
+            self._emit(b"\x03\x00" + struct.pack(">I", self.adler))
+            self._flush_pending()
+            self._chunk(b"IEND", b"")
+        finally:
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
+        else:
+            self.file.close()
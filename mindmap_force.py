@@ -0,0 +1,164 @@
+"""Force-directed mind map layout with NumPy, on plain arrays a worker thread can own.
+
+Nodes repel each other and every edge (parent-child or manual connection)
+pulls its ends together, as in Fruchterman-Reingold. Repulsion uses a
+Barnes-Hut quadtree so one step costs O(n log n) instead of O(n^2); the
+tree is built level by level from integer cell coordinates, and both the
+build and the traversal work on whole arrays of nodes at a time.
+"""
+import numpy as np
+
+
+def _quadtree_levels(pos, depth):
+    """Cell tables of a quadtree over pos, one per level from the root down.
+
+    Each level is (inverse, count, sum_x, sum_y, child_offsets, child_cells):
+    inverse maps every node to its cell, count and the sums give the mass
+    and centre of mass of every cell, and the children of cell c are
+    child_cells[child_offsets[c]:child_offsets[c + 1]] on the next level.
+    """
+    low = pos.min(axis=0)
+    extent = max(float((pos.max(axis=0) - low).max()), 1e-9) * (1 + 1e-9)
+    scale = 1 << depth
+    q = np.minimum(((pos - low) / extent * scale).astype(np.int64), scale - 1)
+    levels, keys = [], []
+    for level in range(depth + 1):
+        shift = depth - level
+        key = ((q[:, 0] >> shift) << level) | (q[:, 1] >> shift)
+        cells, inverse, count = np.unique(key, return_inverse=True, return_counts=True)
+        sum_x = np.bincount(inverse, weights=pos[:, 0], minlength=len(cells))
+        sum_y = np.bincount(inverse, weights=pos[:, 1], minlength=len(cells))
+        levels.append([inverse, count, sum_x, sum_y, None, None])
+        keys.append(cells)
+    for level in range(depth):
+        child_keys = keys[level + 1]
+        mask = (1 << (level + 1)) - 1
+        parent_keys = ((child_keys >> (level + 2)) << level) | ((child_keys & mask) >> 1)
+        parents = np.searchsorted(keys[level], parent_keys)
+        order = np.argsort(parents, kind="stable")
+        offsets = np.zeros(len(keys[level]) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(parents, minlength=len(keys[level])), out=offsets[1:])
+        levels[level][4] = offsets
+        levels[level][5] = order
+    return levels, extent
+
+
+def barnes_hut_repulsion(pos, strength, theta=0.8, chunk=20000):
+    """Repulsive force strength * mass / distance on every node, as an (n, 2) array.
+
+    A cell is treated as one mass at its centre of mass once it is smaller
+    than theta times its distance; nodes are processed chunk at a time to
+    bound the size of the (node, cell) pair arrays.
+    """
+    n = len(pos)
+    forces = np.zeros((n, 2))
+    if n < 2:
+        return forces
+    depth = int(min(16, max(1, np.log2(n) / 2 + 4)))
+    levels, extent = _quadtree_levels(pos, depth)
+    theta2 = theta * theta
+    for start in range(0, n, chunk):
+        nodes = np.arange(start, min(n, start + chunk))
+        cells = np.zeros(len(nodes), dtype=np.int64)
+        for level, (inverse, count, sum_x, sum_y, offsets, children) in enumerate(levels):
+            px, py = pos[nodes, 0], pos[nodes, 1]
+            own = inverse[nodes] == cells
+            # Leave a node out of the mass of its own cell
+            mass = count[cells] - own
+            mx = sum_x[cells] - np.where(own, px, 0.0)
+            my = sum_y[cells] - np.where(own, py, 0.0)
+            valid = mass > 0
+            safe_mass = np.maximum(mass, 1)
+            dx = px - mx / safe_mass
+            dy = py - my / safe_mass
+            d2 = dx * dx + dy * dy
+            size = extent / (1 << level)
+            accept = valid & ((mass == 1) | (level == depth) | (~own & (size * size < theta2 * d2)))
+            if accept.any():
+                factor = strength * mass[accept] / np.maximum(d2[accept], 1e-6)
+                targets = nodes[accept]
+                forces[:, 0] += np.bincount(targets, weights=factor * dx[accept], minlength=n)
+                forces[:, 1] += np.bincount(targets, weights=factor * dy[accept], minlength=n)
+            expand = valid & ~accept
+            if level == depth or not expand.any():
+                break
+            nodes, cells = nodes[expand], cells[expand]
+            first = offsets[cells]
+            counts = offsets[cells + 1] - first
+            nodes = np.repeat(nodes, counts)
+            # Index of each pair within its cell's children
+            within = np.arange(len(nodes)) - np.repeat(np.cumsum(counts) - counts, counts)
+            cells = children[np.repeat(first, counts) + within]
+    return forces
+
+
+def spring_attraction(pos, edges, ideal_length):
+    """Force distance^2 / ideal_length pulling the ends of every edge together"""
+    n = len(pos)
+    forces = np.zeros((n, 2))
+    if len(edges) == 0:
+        return forces
+    a, b = edges[:, 0], edges[:, 1]
+    delta = pos[b] - pos[a]
+    distance = np.sqrt((delta * delta).sum(axis=1))
+    pull = delta * (distance / ideal_length)[:, None]
+    for axis in (0, 1):
+        forces[:, axis] += np.bincount(a, weights=pull[:, axis], minlength=n)
+        forces[:, axis] -= np.bincount(b, weights=pull[:, axis], minlength=n)
+    return forces
+
+
+class ForceLayout:
+    """Iterative force-directed layout of node centres.
+
+    positions is an (n, 2) array of starting centres and edges an (m, 2)
+    array of node index pairs. Every step() moves each node along its net
+    force by at most the current temperature, which cools linearly to zero
+    over the given number of iterations. The fixed node, if any, stays put
+    and acts as the anchor of the layout.
+    """
+
+    def __init__(self, positions, edges, fixed=None, ideal_length=150.0, theta=0.8,
+                 gravity=0.01, iterations=300, seed=0):
+        start = np.array(positions, dtype=float).reshape(-1, 2)
+        self.positions = start.copy()
+        self.edges = np.array(edges, dtype=np.int64).reshape(-1, 2)
+        self.fixed = fixed
+        self.ideal_length = ideal_length
+        self.theta = theta
+        self.gravity = gravity
+        self.iterations = iterations
+        self.iteration = 0
+        n = len(self.positions)
+        # Spread out nodes sitting on top of each other, they would never separate
+        rng = np.random.default_rng(seed)
+        self.positions += rng.uniform(-1.0, 1.0, (n, 2)) * ideal_length * 0.01
+        if fixed is not None:
+            self.positions[fixed] = start[fixed]
+        spread = float(np.ptp(self.positions, axis=0).max()) if n else 0.0
+        self.start_temperature = max(spread / 10, ideal_length)
+
+    def done(self):
+        return self.iteration >= self.iterations
+
+    def step(self):
+        """Run one iteration, returns the largest distance a node moved"""
+        pos = self.positions
+        if len(pos) < 2 or self.done():
+            self.iteration = self.iterations
+            return 0.0
+        k = self.ideal_length
+        forces = barnes_hut_repulsion(pos, k * k, self.theta)
+        forces += spring_attraction(pos, self.edges, k)
+        # Weak pull towards the anchor keeps unconnected parts from drifting off
+        center = pos[self.fixed] if self.fixed is not None else pos.mean(axis=0)
+        forces -= (pos - center) * self.gravity
+
+        temperature = self.start_temperature * (1 - self.iteration / self.iterations)
+        length = np.sqrt((forces * forces).sum(axis=1))
+        step = forces * (np.minimum(length, temperature) / np.maximum(length, 1e-9))[:, None]
+        if self.fixed is not None:
+            step[self.fixed] = 0.0
+        pos += step
+        self.iteration += 1
+        return float(np.sqrt((step * step).sum(axis=1)).max())
@@ -0,0 +1,293 @@
+"""Compact binary mind map format and conversion to and from JSON.
+
+The binary format stores the same information as the JSON written by
+MindMapView.save_mindmap, but as column arrays instead of one object per
+node:
+
+    header      magic, version, node/connection/string counts, root index
+    sections    table of (offset, length) pairs, one per column below
+    x, y        float64 per node
+    width       float64 per node
+    height      float64 per node
+    color       uint32 per node, 0xRRGGBB, or STRING_COLOR | string index
+                for colors that are not written as "#rrggbb"
+    level       int32 per node
+    text        uint32 string index per node
+    notes       uint32 string index per node
+    node_type   uint32 string index per node
+    collapsed   uint8 per node
+    int_fields  uint8 per node, a bit (INT_X, INT_Y, INT_WIDTH, INT_HEIGHT)
+                for each of x, y, width and height written as a JSON int,
+                so reading gives back exactly the numbers written
+    child_offsets, child_indices
+                children in CSR form: the children of node i are
+                child_indices[child_offsets[i]:child_offsets[i + 1]]
+    connections uint32 pairs
+    string_offsets, string_data
+                deduplicated UTF-8 string table
+
+All numbers are little-endian and every section starts on an 8-byte
+boundary, so a reader can map the file and use the columns in place.
+
+Convert between the formats from the command line with
+
+    python mindmap_format.py map.json map.mmb
+"""
+import array
+import json
+import mmap
+import os
+import struct
+import sys
+
+MAGIC = b"MMBN"
+VERSION = 1
+BINARY_EXTENSION = ".mmb"
+
+STRING_COLOR = 0x80000000
+INT_X, INT_Y, INT_WIDTH, INT_HEIGHT = 1, 2, 4, 8
+
+_HEADER = struct.Struct("<4sIIIIi")
+_SECTION = struct.Struct("<QQ")
+
+# (name, array typecode) in file order
+_SECTIONS = (
+    ("x", "d"),
+    ("y", "d"),
+    ("width", "d"),
+    ("height", "d"),
+    ("color", "I"),
+    ("level", "i"),
+    ("text", "I"),
+    ("notes", "I"),
+    ("node_type", "I"),
+    ("collapsed", "B"),
+    ("int_fields", "B"),
+    ("child_offsets", "I"),
+    ("child_indices", "I"),
+    ("connections", "I"),
+    ("string_offsets", "I"),
+    ("string_data", "B"),
+)
+
+
+def is_binary_path(file_path):
+    """True if the file name asks for the binary format"""
+    return os.path.splitext(file_path)[1].lower() == BINARY_EXTENSION
+
+
+def _pack_color(color, intern):
+    if len(color) == 7 and color[0] == "#":
+        try:
+            value = int(color[1:], 16)
+        except ValueError:
+            value = -1
+        if value >= 0 and "#%06x" % value == color:
+            return value
+    return STRING_COLOR | intern(color)
+
+
+def write_binary_mindmap(data, file_path):
+    """Write a mind map dict (the JSON schema) in the binary format"""
+    strings = {}
+
+    def intern(text):
+        index = strings.get(text)
+        if index is None:
+            index = strings[text] = len(strings)
+        return index
+
+    nodes = data["nodes"]
+    columns = {name: array.array(code) for name, code in _SECTIONS}
+    columns["child_offsets"].append(0)
+    for node in nodes:
+        columns["x"].append(node["x"])
+        columns["y"].append(node["y"])
+        columns["width"].append(node["width"])
+        columns["height"].append(node["height"])
+        columns["color"].append(_pack_color(node["color"], intern))
+        columns["level"].append(node["level"])
+        columns["text"].append(intern(node["text"]))
+        columns["notes"].append(intern(node["notes"]))
+        columns["node_type"].append(intern(node["node_type"]))
+        columns["collapsed"].append(1 if node["collapsed"] else 0)
+        columns["int_fields"].append((INT_X if isinstance(node["x"], int) else 0)
+                                     | (INT_Y if isinstance(node["y"], int) else 0)
+                                     | (INT_WIDTH if isinstance(node["width"], int) else 0)
+                                     | (INT_HEIGHT if isinstance(node["height"], int) else 0))
+        columns["child_indices"].extend(node["children"])
+        columns["child_offsets"].append(len(columns["child_indices"]))
+    for i, j in data["connections"]:
+        columns["connections"].append(i)
+        columns["connections"].append(j)
+
+    blob = bytearray()
+    columns["string_offsets"].append(0)
+    for text in strings:  # dicts keep insertion order, i.e. index order
+        blob += text.encode("utf-8")
+        columns["string_offsets"].append(len(blob))
+    columns["string_data"] = array.array("B", blob)
+
+    if sys.byteorder != "little":
+        for column in columns.values():
+            column.byteswap()
+
+    header = _HEADER.pack(MAGIC, VERSION, len(nodes), len(data["connections"]),
+                          len(strings), data.get("root_node_index", -1))
+    offset = _align(_HEADER.size + _SECTION.size * len(_SECTIONS))
+    table = []
+    for name, _ in _SECTIONS:
+        length = len(columns[name]) * columns[name].itemsize
+        table.append((offset, length))
+        offset = _align(offset + length)
+
+    with open(file_path, "wb") as f:
+        f.write(header)
+        for entry in table:
+            f.write(_SECTION.pack(*entry))
+        for (name, _), (start, _) in zip(_SECTIONS, table):
+            f.write(b"\0" * (start - f.tell()))
+            columns[name].tofile(f)
+
+
+def _align(offset):
+    return (offset + 7) & ~7
+
+
+class BinaryMindMap:
+    """Memory-mapped, read-only view of a binary mind map file.
+
+    Columns are exposed as memoryviews straight into the mapping (named as
+    in the module docstring) and strings are decoded on demand, so opening
+    even a very large file costs almost nothing until the data is used.
+    """
+
+    def __init__(self, file_path):
+        self._file = open(file_path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # Empty file
+            self._file.close()
+            raise ValueError("Not a binary mind map: %s" % file_path)
+        self._views = []
+        buf = memoryview(self._map)
+        self._views.append(buf)
+        if len(buf) < _HEADER.size:
+            self.close()
+            raise ValueError("Not a binary mind map: %s" % file_path)
+        magic, version, self.node_count, self.connection_count, self.string_count, \
+            self.root_node_index = _HEADER.unpack_from(buf, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError("Not a binary mind map: %s" % file_path)
+        if version > VERSION:
+            self.close()
+            raise ValueError("Binary mind map version %d is newer than supported (%d)" % (version, VERSION))
+
+        try:
+            for k, (name, code) in enumerate(_SECTIONS):
+                start, length = _SECTION.unpack_from(buf, _HEADER.size + k * _SECTION.size)
+                if start + length > len(buf):
+                    raise ValueError("section %s runs past the end of the file" % name)
+                raw = buf[start:start + length]
+                self._views.append(raw)
+                if sys.byteorder == "little":
+                    column = raw.cast(code)  # TypeError unless whole items
+                    self._views.append(column)
+                else:
+                    column = array.array(code, raw.tobytes())
+                    column.byteswap()
+                setattr(self, name, column)
+        except (struct.error, TypeError, ValueError):  # Truncated or corrupt section table
+            self.close()
+            raise ValueError("Not a binary mind map: %s" % file_path) from None
+
+    def close(self):
+        for view in reversed(self._views):
+            view.release()
+        self._views = []
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def string(self, index):
+        start, end = self.string_offsets[index], self.string_offsets[index + 1]
+        return bytes(self.string_data[start:end]).decode("utf-8")
+
+    def children(self, i):
+        return self.child_indices[self.child_offsets[i]:self.child_offsets[i + 1]].tolist()
+
+    def to_data(self):
+        """Build the same dict load_mindmap reads from JSON"""
+        strings = [self.string(k) for k in range(self.string_count)]
+        x, y = self.x.tolist(), self.y.tolist()
+        width, height = self.width.tolist(), self.height.tolist()
+        level, collapsed = self.level.tolist(), self.collapsed.tolist()
+        text, notes, node_type = self.text.tolist(), self.notes.tolist(), self.node_type.tolist()
+        offsets, child_indices = self.child_offsets.tolist(), self.child_indices.tolist()
+        colors = self.color.tolist()
+        for i, fields in enumerate(self.int_fields.tolist()):
+            if fields:
+                for column, flag in ((x, INT_X), (y, INT_Y), (width, INT_WIDTH), (height, INT_HEIGHT)):
+                    if fields & flag:
+                        column[i] = int(column[i])
+        nodes = []
+        for i in range(self.node_count):
+            color = colors[i]
+            nodes.append({
+                "id": i,
+                "x": x[i],
+                "y": y[i],
+                "text": strings[text[i]],
+                "color": strings[color & ~STRING_COLOR] if color & STRING_COLOR else "#%06x" % color,
+                "node_type": strings[node_type[i]],
+                "width": width[i],
+                "height": height[i],
+                "level": level[i],
+                "notes": strings[notes[i]],
+                "collapsed": bool(collapsed[i]),
+                "children": child_indices[offsets[i]:offsets[i + 1]]
+            })
+        pairs = self.connections.tolist()
+        connections = [[pairs[k], pairs[k + 1]] for k in range(0, len(pairs), 2)]
+        return {"nodes": nodes, "connections": connections, "root_node_index": self.root_node_index}
+
+
+def read_binary_mindmap(file_path):
+    """Read a binary mind map file into the JSON schema dict"""
+    with BinaryMindMap(file_path) as binary:
+        return binary.to_data()
+
+
+def read_mindmap_file(file_path):
+    """Read a mind map in either format, chosen by file extension"""
+    if is_binary_path(file_path):
+        return read_binary_mindmap(file_path)
+    with open(file_path, "r") as f:
+        return json.load(f)
+
+
+def write_mindmap_file(data, file_path):
+    """Write a mind map in either format, chosen by file extension"""
+    if is_binary_path(file_path):
+        write_binary_mindmap(data, file_path)
+    else:
+        # json.dumps uses the C encoder, json.dump would encode chunk by chunk in Python
+        with open(file_path, "w") as f:
+            f.write(json.dumps(data))
+
+
+def convert_mindmap(source_path, target_path):
+    """Convert a mind map file between the JSON and binary formats"""
+    write_mindmap_file(read_mindmap_file(source_path), target_path)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        sys.exit("usage: python mindmap_format.py SOURCE TARGET  (.json or %s)" % BINARY_EXTENSION)
+    convert_mindmap(sys.argv[1], sys.argv[2])
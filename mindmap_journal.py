@@ -0,0 +1,278 @@
+"""Crash-safe autosave of mind maps as a snapshot and a journal of changes.
+
+Next to a map file map.json, autosave keeps two files:
+
+    map.json.autosave   full snapshot, a header line and then one node per line
+    map.json.journal    append-only batches of changes made since that snapshot
+
+Every line is a JSON object. Nodes are keyed by MindMapNode.node_id and
+hold the fields of a node in the saved JSON, with children and links as
+lists of node ids. A batch {"set": [nodes], "remove": [ids]}, plus
+"root": id when the root changed, replaces or removes whole nodes. Both
+files start with {"snapshot": token}; a journal only applies to the
+snapshot with the same token, so a crash between writing a snapshot and
+starting its journal loses nothing.
+
+AutosaveWriter does all of the file work on a background thread and keeps
+its own copy of the map up to date from the batches, so compaction does
+not need the GUI thread either.
+"""
+import collections
+import json
+import os
+import queue
+import threading
+import uuid
+
+SNAPSHOT_SUFFIX = ".autosave"
+JOURNAL_SUFFIX = ".journal"
+NODE_FIELDS = ("x", "y", "text", "color", "node_type", "width", "height", "level", "notes", "collapsed")
+
+
+def autosave_paths(file_path):
+    """Return the snapshot and journal paths kept for a map file"""
+    return file_path + SNAPSHOT_SUFFIX, file_path + JOURNAL_SUFFIX
+
+
+def has_autosave(file_path):
+    """Whether a map file has an autosave at least as new as the file itself.
+
+    A user save removes the autosave, so an older one can only be left
+    over from before the file was replaced by other means.
+    """
+    snapshot_path = autosave_paths(file_path)[0]
+    if not os.path.exists(snapshot_path):
+        return False
+    if not os.path.exists(file_path):
+        return True
+    return os.path.getmtime(snapshot_path) >= os.path.getmtime(file_path)
+
+
+def remove_autosave(file_path):
+    for path in autosave_paths(file_path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def _read_lines(path):
+    """Yield the JSON objects of a file, stopping at a line cut short by a crash"""
+    with open(path, "r") as f:
+        for line in f:
+            if not line.endswith("\n"):
+                return
+            try:
+                yield json.loads(line)
+            except ValueError:
+                return
+
+
+class AutosaveState:
+    """A mind map as node dicts keyed by node id, see the module docstring"""
+
+    def __init__(self, nodes=(), root=None):
+        self.nodes = {node["id"]: node for node in nodes}
+        self.root = root
+
+    @classmethod
+    def from_data(cls, data, ids):
+        """Build the state of a mind map dict, ids[i] being the node id of data["nodes"][i]"""
+        nodes = []
+        for node_id, node_data in zip(ids, data["nodes"]):
+            node = {field: node_data[field] for field in NODE_FIELDS}
+            node["id"] = node_id
+            node["children"] = [ids[child_idx] for child_idx in node_data["children"]]
+            node["links"] = []
+            nodes.append(node)
+        for i, j in data["connections"]:
+            nodes[i]["links"].append(ids[j])
+            nodes[j]["links"].append(ids[i])
+        root_idx = data.get("root_node_index", -1)
+        return cls(nodes, ids[root_idx] if 0 <= root_idx < len(ids) else None)
+
+    def apply(self, batch):
+        nodes = self.nodes
+        for node_id in batch.get("remove", ()):
+            nodes.pop(node_id, None)
+        for node in batch.get("set", ()):
+            nodes[node["id"]] = node
+        if "root" in batch:
+            self.root = batch["root"]
+
+    def to_data(self):
+        """Build the mind map dict, dropping references to nodes that are gone"""
+        index_of = {node_id: i for i, node_id in enumerate(self.nodes)}
+        data = {
+            "nodes": [],
+            "connections": [],
+            "root_node_index": index_of.get(self.root, -1)
+        }
+        listed = collections.Counter()  # (i, j) -> times node i lists a connection to j
+        for i, node in enumerate(self.nodes.values()):
+            node_data = {"id": i}
+            for field in NODE_FIELDS:
+                node_data[field] = node[field]
+            node_data["children"] = [index_of[child] for child in node["children"] if child in index_of]
+            data["nodes"].append(node_data)
+            for other in node["links"]:
+                j = index_of.get(other)
+                if j is not None and j != i:
+                    listed[(i, j)] += 1
+        # Both ends list a connection, but only one of them may be up to date
+        for (i, j), count in sorted(listed.items()):
+            if i < j or (j, i) not in listed:
+                count = max(count, listed.get((j, i), 0))
+                data["connections"].extend([min(i, j), max(i, j)] for _ in range(count))
+        return data
+
+
+def read_autosave(file_path):
+    """Replay the snapshot and journal of a map file, returns the mind map dict.
+
+    Returns None if the map has no autosave (see has_autosave). A journal
+    left over from an older snapshot is ignored, and so is a last batch cut
+    short by a crash.
+    """
+    if not has_autosave(file_path):
+        return None
+    snapshot_path, journal_path = autosave_paths(file_path)
+    lines = _read_lines(snapshot_path)
+    header = next(lines, None)
+    if header is None:
+        return None
+    state = AutosaveState(lines, header.get("root"))
+    if os.path.exists(journal_path):
+        batches = _read_lines(journal_path)
+        journal_header = next(batches, None)
+        if journal_header is not None and journal_header.get("snapshot") == header["snapshot"]:
+            for batch in batches:
+                state.apply(batch)
+    return state.to_data()
+
+
+class AutosaveWriter:
+    """Keep the autosave files of a map file up to date from a background thread.
+
+    Starts from a mind map dict and the node ids of its nodes; append()
+    queues a batch and returns at once. Each batch is applied to the
+    writer's own AutosaveState and appended to the journal, which is
+    compacted into a new snapshot once it outgrows the last one, so
+    recovery never reads much more than the map itself.
+
+    saved says the map is exactly as saved in file_path. Its autosave is
+    then removed, and a snapshot is only written at the first change.
+    """
+
+    def __init__(self, file_path, data, ids, saved=True, min_journal_size=1 << 20):
+        self.file_path = file_path
+        self.snapshot_path, self.journal_path = autosave_paths(file_path)
+        self.min_journal_size = min_journal_size
+        self.state = None
+        self.journal = None  # Open journal file, None until the next snapshot
+        self.journal_size = 0
+        self.snapshot_size = 0
+        self.error = None  # Last error, the writer goes on with a new snapshot
+        self.queue = queue.Queue()
+        self.queue.put(("reset", data, ids, saved))
+        self.thread = threading.Thread(target=self._run, name="autosave", daemon=True)
+        self.thread.start()
+
+    def append(self, batch):
+        """Queue a batch of changes, never blocks"""
+        self.queue.put(("batch", batch))
+
+    def reset(self, data, ids, saved=True):
+        """Start over from a whole mind map dict, as after saving or loading the map"""
+        self.queue.put(("reset", data, ids, saved))
+
+    def close(self, discard=False):
+        """Write out everything queued and stop the thread; discard removes the autosave"""
+        if self.thread.is_alive():
+            self.queue.put(("close", discard))
+            self.thread.join()
+
+    def _run(self):
+        while True:
+            message = self.queue.get()
+            batches = []
+            # Write everything queued meanwhile in one go
+            while message[0] == "batch":
+                batches.append(message[1])
+                try:
+                    message = self.queue.get_nowait()
+                except queue.Empty:
+                    message = None
+                    break
+            try:
+                if batches:
+                    self._write(batches)
+                if message is None:
+                    continue
+                if message[0] == "reset":
+                    _, data, ids, saved = message
+                    self.state = AutosaveState.from_data(data, ids)
+                    self._close_journal()
+                    if saved:
+                        remove_autosave(self.file_path)
+                    else:
+                        self._compact()
+                else:
+                    self._close_journal()
+                    if message[1]:
+                        remove_autosave(self.file_path)
+                    return
+            except Exception as error:  # OSError mostly, the thread must outlive any of them
+                self.error = error
+                self._close_journal()
+
+    def _write(self, batches):
+        lines = []
+        for batch in batches:
+            try:
+                line = json.dumps(batch, separators=(",", ":")) + "\n"
+                self.state.apply(batch)
+            except Exception as error:  # A broken batch is dropped, the others still go out
+                self.error = error
+                self._close_journal()  # Whatever it did apply goes out with the next snapshot
+                continue
+            lines.append(line)
+        if self.journal is None:
+            self._compact()  # Includes the batches
+            return
+        text = "".join(lines)
+        self.journal.write(text)
+        self.journal.flush()
+        os.fsync(self.journal.fileno())
+        self.journal_size += len(text)
+        if self.journal_size > max(self.min_journal_size, self.snapshot_size):
+            self._compact()
+
+    def _compact(self):
+        """Write the whole state as a new snapshot and start an empty journal for it"""
+        self._close_journal()
+        token = uuid.uuid4().hex
+        header = json.dumps({"snapshot": token, "root": self.state.root}) + "\n"
+        temp_path = self.snapshot_path + ".tmp"
+        with open(temp_path, "w") as f:
+            f.write(header)
+            # One small dumps per node, the GUI thread gets the GIL in between
+            for node in self.state.nodes.values():
+                f.write(json.dumps(node, separators=(",", ":")) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+            self.snapshot_size = f.tell()
+        os.replace(temp_path, self.snapshot_path)
+        temp_path = self.journal_path + ".tmp"
+        with open(temp_path, "w") as f:
+            f.write(json.dumps({"snapshot": token}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.journal_path)
+        self.journal = open(self.journal_path, "a")
+        self.journal_size = 0
+
+    def _close_journal(self):
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
@@ -0,0 +1,507 @@
+"""Tidy tree layout of mind maps, growing right, to both sides or in rings.
+
+tidy_layout places a tree with the Buchheim-Walker variant of the
+Reingold-Tilford algorithm: parents are centred over their children,
+subtrees are packed as close as their contours allow, and the whole pass
+is linear in the number of nodes. Everything is iterative, so very deep
+trees are fine.
+
+Nodes are plain indices; the caller passes the children lists and node
+sizes and gets back centre coordinates relative to the root, in one of
+the LAYOUT_MODES:
+
+    right       the tree grows from the root to the right
+    balanced    the root's branches are split between its right and left
+                side, like a hand-drawn mind map
+    radial      levels are rings around the root
+"""
+import math
+
+LAYOUT_MODES = ("balanced", "right", "radial")
+
+
+class TreeLayout:
+    """Tidy tree layout of one tree, see TidyLayout.
+
+    breadth holds the node sizes across the direction the tree grows in.
+    After run(), x holds the position across and level the depth of every
+    node reached from root (None for the others).
+
+    The layout state is kept so update() can redo only the part an edit
+    touched. Each node's walk records which threads and contour ancestors
+    it set (in records), so re-walking a node can first undo them.
+    """
+
+    def __init__(self, children, breadth, root, sibling_gap=20.0, subtree_gap=40.0):
+        self.children = [list(kids) for kids in children]  # Own copy, changed by update
+        self.breadth = breadth
+        self.root = root
+        self.sibling_gap = sibling_gap
+        self.subtree_gap = subtree_gap
+        self.parent = []
+        self.number = []  # Position among siblings
+        self.level = []
+        self.prelim = []
+        self.mid = []  # prelim of a node centred over its children, before its parent places it
+        self.mod = []
+        self.shift = []
+        self.change = []
+        self.thread = []
+        self.ancestor = []
+        self.records = {}  # node -> [(node, thread mod or None)] changed by its walk
+        self.grow(len(children))
+        self.x = [None] * len(children)
+        self.order = []  # Breadth-first order of the reached nodes
+
+    def grow(self, n):
+        """Make room for nodes up to index n - 1"""
+        start = len(self.parent)
+        if n <= start:
+            return
+        extra = n - start
+        self.children.extend([] for _ in range(n - len(self.children)))
+        for values in (self.parent, self.level, self.thread):
+            values.extend([None] * extra)
+        self.number.extend([0] * extra)
+        for values in (self.prelim, self.mid, self.mod, self.shift, self.change):
+            values.extend([0.0] * extra)
+        self.ancestor.extend(range(start, n))
+
+    def run(self):
+        self.order = self.attach(self.root, None, 0)
+        # Children are always finished before their parent
+        for v in reversed(self.order):
+            self.first_walk(v)
+        self.second_walk()
+        return self
+
+    def attach(self, v, parent, number):
+        """Add v's subtree to the tree with fresh state, returns it in breadth-first order"""
+        children, level = self.children, self.level
+        self.parent[v] = parent
+        self.number[v] = number
+        level[v] = 0 if parent is None else level[parent] + 1
+        order = [v]
+        for u in order:  # Grows while iterating
+            self.mod[u] = self.shift[u] = self.change[u] = 0.0
+            self.thread[u] = None
+            self.ancestor[u] = u
+            for k, w in enumerate(children[u]):
+                self.parent[w] = u
+                self.number[w] = k
+                level[w] = level[u] + 1
+                order.append(w)
+        return order
+
+    def separation(self, a, b):
+        gap = self.sibling_gap if self.parent[a] == self.parent[b] else self.subtree_gap
+        return (self.breadth[a] + self.breadth[b]) / 2 + gap
+
+    def next_left(self, v):
+        kids = self.children[v]
+        return kids[0] if kids else self.thread[v]
+
+    def next_right(self, v):
+        kids = self.children[v]
+        return kids[-1] if kids else self.thread[v]
+
+    def first_walk(self, v):
+        """Place the children of v against each other and centre v's subtree under it"""
+        kids = self.children[v]
+        prelim, mod = self.prelim, self.mod
+        self.records[v] = []
+        if kids:
+            default_ancestor = kids[0]
+            previous = None
+            for w in kids:
+                if previous is not None:
+                    # w's own subtree is already laid out around prelim[w] == mid[w]
+                    prelim[w] = prelim[previous] + self.separation(previous, w)
+                    if self.children[w]:
+                        mod[w] += prelim[w] - self.mid[w]
+                    default_ancestor = self.apportion(w, previous, default_ancestor)
+                previous = w
+            self.execute_shifts(v)
+            prelim[v] = (prelim[kids[0]] + prelim[kids[-1]]) / 2
+        else:
+            prelim[v] = 0.0
+        self.mid[v] = prelim[v]
+
+    def apportion(self, v, left_sibling, default_ancestor):
+        """Push v's subtree right until it clears the subtrees of its left siblings"""
+        prelim, mod, ancestor, thread = self.prelim, self.mod, self.ancestor, self.thread
+        next_left, next_right = self.next_left, self.next_right
+        record = self.records[self.parent[v]]
+        v_in_right = v_out_right = v
+        v_in_left = left_sibling
+        v_out_left = self.children[self.parent[v]][0]
+        s_in_right = s_out_right = mod[v]
+        s_in_left = mod[v_in_left]
+        s_out_left = mod[v_out_left]
+        while next_right(v_in_left) is not None and next_left(v_in_right) is not None:
+            v_in_left = next_right(v_in_left)
+            v_in_right = next_left(v_in_right)
+            v_out_left = next_left(v_out_left)
+            v_out_right = next_right(v_out_right)
+            ancestor[v_out_right] = v
+            record.append((v_out_right, None))
+            shift = ((prelim[v_in_left] + s_in_left) - (prelim[v_in_right] + s_in_right)
+                     + self.separation(v_in_left, v_in_right))
+            if shift > 0:
+                left = ancestor[v_in_left]
+                if self.parent[left] != self.parent[v]:
+                    left = default_ancestor
+                self.move_subtree(left, v, shift)
+                s_in_right += shift
+                s_out_right += shift
+            s_in_left += mod[v_in_left]
+            s_in_right += mod[v_in_right]
+            s_out_left += mod[v_out_left]
+            s_out_right += mod[v_out_right]
+        if next_right(v_in_left) is not None and next_right(v_out_right) is None:
+            thread[v_out_right] = next_right(v_in_left)
+            mod[v_out_right] += s_in_left - s_out_right
+            record.append((v_out_right, s_in_left - s_out_right))
+        if next_left(v_in_right) is not None and next_left(v_out_left) is None:
+            thread[v_out_left] = next_left(v_in_right)
+            mod[v_out_left] += s_in_right - s_out_left
+            record.append((v_out_left, s_in_right - s_out_left))
+            default_ancestor = v
+        return default_ancestor
+
+    def move_subtree(self, left, right, shift):
+        subtrees = self.number[right] - self.number[left]
+        self.change[right] -= shift / subtrees
+        self.shift[right] += shift
+        self.change[left] += shift / subtrees
+        self.prelim[right] += shift
+        self.mod[right] += shift
+
+    def execute_shifts(self, v):
+        prelim, mod = self.prelim, self.mod
+        shift = change = 0.0
+        for w in reversed(self.children[v]):
+            prelim[w] += shift
+            mod[w] += shift
+            change += self.change[w]
+            shift += self.shift[w] + change
+
+    def second_walk(self):
+        """Turn the relative positions into absolute ones, root at 0"""
+        self.place(self.order, 0.0, self.x)
+
+    def place(self, order, offset, x):
+        """Store the absolute position of the nodes of one subtree in x.
+
+        order is the subtree in breadth-first order and offset the sum of
+        the mods of its root's ancestors.
+        """
+        children, prelim, mod = self.children, self.prelim, self.mod
+        offsets = {order[0]: offset}
+        base = prelim[self.root]
+        for v in order:
+            x[v] = prelim[v] + offsets[v] - base
+            for w in children[v]:
+                offsets[w] = offsets[v] + mod[v]
+
+    def path_positions(self, path):
+        """Absolute position and mod sum of the path nodes and all their children.
+
+        path must be closed under parents and sorted top-down.
+        """
+        children, prelim, mod = self.children, self.prelim, self.mod
+        base = prelim[self.root]
+        offsets = {self.root: 0.0}
+        x = {self.root: prelim[self.root] - base}
+        for v in path:
+            for w in children[v]:
+                offsets[w] = offsets[v] + mod[v]
+                x[w] = prelim[w] + offsets[w] - base
+        return x, offsets
+
+    def update(self, dirty, children_of, breadth):
+        """Re-lay out the tree after the children of the dirty nodes changed.
+
+        children_of(v) gives the current children of a node. It is asked for
+        the dirty nodes and for every node in newly attached subtrees. Only
+        the dirty nodes and their ancestors are walked again (newly attached
+        subtrees are walked once). Returns (moved, shifted, relevelled): the
+        new absolute position of the re-walked and attached nodes, the offset
+        of every other branch hanging off the re-walked nodes, which moved as
+        a whole, and the (old, new) level of the nodes that left, joined or
+        moved within the tree, None while outside it.
+        """
+        self.breadth = breadth
+        children, parent, level = self.children, self.parent, self.level
+        dirty = [v for v in dirty if v < len(level) and level[v] is not None]
+        path = set()
+        for v in dirty:
+            while v is not None and v not in path:
+                path.add(v)
+                v = parent[v]
+        path = sorted(path, key=level.__getitem__)
+        old, _ = self.path_positions(path)
+
+        # Take out the branches that are gone, then attach the new ones
+        new_children = {v: list(children_of(v)) for v in dirty}
+        self.grow(len(breadth))  # children_of may have numbered new nodes
+        levels = {}  # Level before the update of the nodes taken out or attached
+        for v in dirty:
+            kept = set(new_children[v])
+            for w in children[v]:
+                if w not in kept and parent[w] == v:
+                    for u in self.subtree(w):
+                        levels.setdefault(u, level[u])
+                        level[u] = None
+        # Dirty nodes may have gone with a branch taken out above them
+        dirty = [v for v in dirty if level[v] is not None]
+        path = [v for v in path if level[v] is not None]
+        attached = []
+        for v in dirty:
+            children[v] = new_children[v]
+            for k, w in enumerate(children[v]):
+                if level[w] is None:
+                    # Walk newly shown nodes through children_of to pick up their branches
+                    branch = self.subtree(w, children_of)
+                    self.grow(len(breadth))
+                    for u in branch:
+                        children[u] = list(children_of(u))
+                    attached.append(self.attach(w, v, k))
+                    for u in attached[-1]:
+                        levels.setdefault(u, None)
+                else:
+                    self.number[w] = k
+
+        # Undo what the path's walks did to other nodes, then walk again bottom-up
+        prelim, mod = self.prelim, self.mod
+        for v in path:
+            for node, delta in self.records.pop(v, ()):
+                self.ancestor[node] = node
+                if delta is not None:
+                    self.thread[node] = None
+                    mod[node] -= delta
+        for v in path:
+            for w in children[v]:
+                prelim[w] = self.mid[w]
+                mod[w] = self.shift[w] = self.change[w] = 0.0
+        for order in attached:
+            for v in reversed(order):
+                self.first_walk(v)
+        for v in reversed(path):
+            self.first_walk(v)
+
+        new, offsets = self.path_positions(path)
+        moved, shifted = {}, {}
+        on_path = set(path)
+        for order in attached:
+            self.place(order, offsets[order[0]], moved)
+        for v, position in new.items():
+            if v in on_path:
+                moved[v] = position
+            elif v in old and v not in moved:
+                delta = position - old[v]
+                if delta:
+                    shifted[v] = delta
+        relevelled = {v: (old_level, level[v]) for v, old_level in levels.items() if old_level != level[v]}
+        return moved, shifted, relevelled
+
+    def subtree(self, v, children_of=None):
+        """v and all nodes below it, breadth-first"""
+        children_of = children_of or self.children.__getitem__
+        order = [v]
+        for u in order:
+            order.extend(children_of(u))
+        return order
+
+
+class TidyLayout:
+    """Tidy tree layout in one of the LAYOUT_MODES that can follow edits.
+
+    run() lays out a whole tree. update() then re-lays out just the branches
+    whose children changed and their ancestors, and reports the untouched
+    branches beside them as whole-branch offsets, so an edit in a large map
+    costs about as much as the branches it moves. update() returns None when
+    only a full run() gives a good layout: in radial mode (every ring
+    depends on all nodes), when the root's own branches change in balanced
+    mode, or when the deepest node of a level comes or goes, which moves
+    every level beyond it.
+    """
+
+    def __init__(self, mode="balanced", level_gap=80.0, sibling_gap=20.0, subtree_gap=40.0):
+        if mode not in LAYOUT_MODES:
+            raise ValueError("Unknown layout mode %r, expected one of %s" % (mode, ", ".join(LAYOUT_MODES)))
+        self.mode = mode
+        self.level_gap = level_gap
+        self.sibling_gap = sibling_gap
+        self.subtree_gap = subtree_gap
+        self.root = None
+        self.sides = []  # (TreeLayout, direction, level extents, level offsets)
+
+    def run(self, children, widths, heights, root=0):
+        """Lay out the tree below root, returns (xs, ys).
+
+        children[i] lists the children of node i in order, widths and heights
+        are the node sizes. The result holds the centre of every node reached
+        from root relative to the root's centre, and None for the others.
+        """
+        n = len(children)
+        xs, ys = [None] * n, [None] * n
+        self.root = root
+        self.sides = []
+
+        if self.mode == "radial":
+            # Round nodes take about the same room in every direction
+            size = [max(w, h) for w, h in zip(widths, heights)]
+            tree = TreeLayout(children, size, root, self.sibling_gap, self.subtree_gap).run()
+            _radial(tree, size, self.level_gap, xs, ys)
+            return xs, ys
+
+        sides = [(children, 1)]
+        if self.mode == "balanced" and len(children[root]) > 1:
+            right, left = _split_branches(children, root)
+            sides = [(_with_children(children, root, right), 1),
+                     (_with_children(children, root, left), -1)]
+        for side_children, direction in sides:
+            tree = TreeLayout(side_children, heights, root, self.sibling_gap, self.subtree_gap).run()
+            sizes = level_sizes(tree.order, tree.level, widths)
+            extents = [max(counts) for counts in sizes]
+            offsets = level_offsets(extents, self.level_gap)
+            self.sides.append((tree, direction, sizes, extents, offsets))
+            for v in tree.order:
+                xs[v] = direction * offsets[tree.level[v]]
+                ys[v] = tree.x[v]
+        return xs, ys
+
+    def update(self, dirty, children_of, widths, heights):
+        """Follow an edit, returns (positions, shifts) or None if run() is needed.
+
+        dirty lists the nodes whose children changed and children_of(i) gives
+        the current children of node i (see TreeLayout.update). positions maps
+        re-laid out nodes to their new centre (x, y) relative to the root,
+        shifts maps the roots of branches that moved as a whole to their
+        (dx, dy).
+        """
+        if not self.sides or (self.mode == "balanced" and self.root in dirty):
+            return None
+        positions, shifts = {}, {}
+        for tree, direction, sizes, extents, offsets in self.sides:
+            side_dirty = [v for v in dirty if v < len(tree.level) and tree.level[v] is not None]
+            if not side_dirty:
+                continue
+            moved, shifted, relevelled = tree.update(side_dirty, children_of, heights)
+            # The depth of a level follows its deepest node, so nodes coming
+            # and going may move whole levels
+            touched = set()
+            for v, (old, new) in relevelled.items():
+                if old is not None:
+                    counts = sizes[old]
+                    counts[widths[v]] -= 1
+                    if not counts[widths[v]]:
+                        del counts[widths[v]]
+                    touched.add(old)
+                if new is not None:
+                    if new == len(sizes):
+                        sizes.append({})
+                    sizes[new][widths[v]] = sizes[new].get(widths[v], 0) + 1
+                    touched.add(new)
+            for d in touched:
+                if d >= len(extents) or not sizes[d] or max(sizes[d]) != extents[d]:
+                    return None
+            for v, y in moved.items():
+                positions[v] = (direction * offsets[tree.level[v]], y)
+            for v, dy in shifted.items():
+                shifts[v] = (0.0, dy)
+        return positions, shifts
+
+
+def level_sizes(order, level, depth):
+    """How many nodes of every size each level holds, as {size: count} per level"""
+    sizes = []
+    for v in order:
+        d = level[v]
+        if d == len(sizes):
+            sizes.append({})
+        sizes[d][depth[v]] = sizes[d].get(depth[v], 0) + 1
+    return sizes
+
+
+def level_offsets(extents, level_gap):
+    """Depth coordinate of every level, each as deep as its deepest node"""
+    offsets = [0.0] * len(extents)
+    for d in range(1, len(extents)):
+        offsets[d] = offsets[d - 1] + (extents[d - 1] + extents[d]) / 2 + level_gap
+    return offsets
+
+
+def tidy_layout(children, widths, heights, root=0, mode="balanced",
+                level_gap=80.0, sibling_gap=20.0, subtree_gap=40.0):
+    """Lay out the tree below root once, see TidyLayout.run"""
+    return TidyLayout(mode, level_gap, sibling_gap, subtree_gap).run(children, widths, heights, root)
+
+
+def _with_children(children, root, root_children):
+    # Shallow copy, only the root's list differs
+    children = list(children)
+    children[root] = root_children
+    return children
+
+
+def _split_branches(children, root):
+    """Split the root's children into a right and a left half of about equal size"""
+    sizes = {}
+    for branch in children[root]:
+        count, stack = 0, [branch]
+        while stack:
+            v = stack.pop()
+            count += 1
+            stack.extend(children[v])
+        sizes[branch] = count
+    total = sum(sizes.values())
+    right, done = [], 0
+    for branch in children[root]:
+        if done >= total / 2 and right:
+            break
+        right.append(branch)
+        done += sizes[branch]
+    return right, children[root][len(right):]
+
+
+def _radial(tree, size, level_gap, xs, ys):
+    """Wrap a tidy layout around the root: breadth becomes the angle, depth the radius.
+
+    Each ring gets the smallest radius that keeps neighbouring nodes on it
+    apart, and at least level_gap plus the node sizes more than the ring
+    inside it.
+    """
+    order, level, breadth = tree.order, tree.level, tree.x
+    low = min(breadth[v] for v in order)
+    span = max(breadth[v] for v in order) - low
+    # Leave room between the last and the first node around the circle
+    total = span + (max(size[v] for v in order) + tree.subtree_gap if span else 1.0)
+    angle = {v: 2 * math.pi * (breadth[v] - low) / total for v in order}
+
+    rings = []  # Per level: (largest node, nodes in breadth order)
+    for v in order:  # Breadth-first order keeps each level sorted left to right
+        d = level[v]
+        if d == len(rings):
+            rings.append([0.0, []])
+        rings[d][0] = max(rings[d][0], size[v])
+        rings[d][1].append(v)
+
+    radius = [0.0] * len(rings)
+    for d in range(1, len(rings)):
+        needed = radius[d - 1] + (rings[d - 1][0] + rings[d][0]) / 2 + level_gap
+        ring = rings[d][1]
+        for a, b in zip(ring, ring[1:]):
+            step = min(angle[b] - angle[a], math.pi)
+            if step > 0:
+                # The chord between neighbours must fit both half sizes and the gap
+                needed = max(needed, tree.separation(a, b) / (2 * math.sin(step / 2)))
+        radius[d] = needed
+
+    root_angle = angle[tree.root]
+    for v in order:
+        r = radius[level[v]]
+        theta = angle[v] - root_angle  # First-level branches spread around angle 0
+        xs[v] = r * math.cos(theta)
+        ys[v] = r * math.sin(theta)
@@ -0,0 +1,569 @@
+"""NodeRecords, the plain-data nodes of mind maps, and the grids indexing them.
+
+MindMap holds a whole map as NodeRecords with its edits and layouts,
+without any Qt: MindMapView shows one, and batch jobs use it on its own
+(see mindmap_cli).
+"""
+import itertools
+
+from mindmap_format import read_mindmap_file, write_mindmap_file
+from mindmap_layout import TidyLayout
+
+_node_ids = itertools.count(1)
+
+
+def new_node_id():
+    """A node id not handed out before in this process, records and the editor's nodes share them"""
+    return next(_node_ids)
+
+
+class NodeRecord:
+    """A mind map node as plain data, without graphics items.
+
+    Holds the same fields as a node in the saved JSON. children, parent and
+    links refer to other NodeRecords, hidden is True under a collapsed
+    ancestor, and item is the MindMapNode showing the record, if any. The
+    node's own text, fill, size and position are newer than the record's
+    until MindMapView copies them back, see MindMapNode.store_record.
+    node_id is the id of that node, and the record's key in its MindMap.
+    """
+    __slots__ = ("x", "y", "width", "height", "text", "color", "node_type", "level",
+                 "notes", "collapsed", "children", "parent", "links", "hidden", "item", "node_id")
+
+    def __init__(self, x=0.0, y=0.0, text="New Idea", color="#ffff00", node_type="ellipse",
+                 width=100, height=60):
+        self.x = x
+        self.y = y
+        self.width = width
+        self.height = height
+        self.text = text
+        self.color = color
+        self.node_type = node_type
+        self.level = 0
+        self.notes = ""
+        self.collapsed = False
+        self.children = []
+        self.parent = None
+        self.links = ()  # A list from the first link on, most records have none
+        self.hidden = False
+        self.item = None
+        self.node_id = None
+
+    @classmethod
+    def from_data(cls, node_data):
+        """Create a record from its saved JSON description (without links)"""
+        record = cls(node_data["x"], node_data["y"], node_data["text"], node_data["color"],
+                     node_data["node_type"], node_data["width"], node_data["height"])
+        record.level = node_data["level"]
+        record.notes = node_data["notes"]
+        record.collapsed = node_data["collapsed"]
+        return record
+
+    def to_data(self):
+        """Return the saved JSON fields of this record, apart from its id and children"""
+        return {
+            "x": self.x,
+            "y": self.y,
+            "text": self.text,
+            "color": self.color,
+            "node_type": self.node_type,
+            "width": self.width,
+            "height": self.height,
+            "level": self.level,
+            "notes": self.notes,
+            "collapsed": self.collapsed
+        }
+
+    def center(self):
+        return self.x + self.width / 2, self.y + self.height / 2
+
+    def add_link(self, other):
+        """Link this record to another, one way"""
+        if self.links:
+            self.links.append(other)
+        else:
+            self.links = [other]
+
+    def descendants(self):
+        """Return all records below this one (iterative, safe for deep trees)"""
+        records = []
+        stack = list(self.children)
+        while stack:
+            record = stack.pop()
+            records.append(record)
+            stack.extend(record.children)
+        return records
+
+
+def update_hidden(records):
+    """Recompute the hidden flag of the given records and everything below them"""
+    stack = [(record, record.parent is not None and (record.parent.hidden or record.parent.collapsed))
+             for record in records]
+    while stack:
+        record, hidden = stack.pop()
+        record.hidden = hidden
+        hide_children = hidden or record.collapsed
+        for child in record.children:
+            stack.append((child, hide_children))
+
+
+def records_from_data(data):
+    """Build NodeRecords from a mind map dict, returns (records, root)"""
+    records = [NodeRecord.from_data(node_data) for node_data in data["nodes"]]
+    for record, node_data in zip(records, data["nodes"]):
+        for child_idx in node_data["children"]:
+            child = records[child_idx]
+            child.parent = record
+            record.children.append(child)
+    for i, j in data["connections"]:
+        records[i].add_link(records[j])
+        records[j].add_link(records[i])
+    update_hidden([record for record in records if record.parent is None])
+    root_idx = data.get("root_node_index", -1)
+    root = records[root_idx] if 0 <= root_idx < len(records) else None
+    return records, root
+
+
+def records_to_data(records, root):
+    """Build the mind map dict for a list of NodeRecords"""
+    index_of = {id(record): i for i, record in enumerate(records)}
+    data = {
+        "nodes": [],
+        "connections": [],
+        "root_node_index": index_of.get(id(root), -1)
+    }
+    for i, record in enumerate(records):
+        data["nodes"].append({
+            "id": i,
+            "x": record.x,
+            "y": record.y,
+            "text": record.text,
+            "color": record.color,
+            "node_type": record.node_type,
+            "width": record.width,
+            "height": record.height,
+            "level": record.level,
+            "notes": record.notes,
+            "collapsed": record.collapsed,
+            "children": [index_of[id(child)] for child in record.children]
+        })
+        for other in record.links:
+            j = index_of[id(other)]
+            if i < j:  # Save each connection only once
+                data["connections"].append([i, j])
+    return data
+
+
+class MindMap:
+    """A mind map as plain data: NodeRecords, their links and the root.
+
+    MindMapView keeps its map in one and shows the records with
+    MindMapNodes; batch jobs use it without any Qt (see mindmap_cli). It
+    loads and saves either file format, adds, deletes, links and collapses
+    nodes, and does the tidy layouts of auto_arrange_nodes. Records are
+    kept by node id, in the order they were added. Collapsed records keep
+    their children, which are hidden, and positions are top-left corners
+    in scene coordinates.
+    """
+
+    def __init__(self, records=(), root=None):
+        self.records = {}  # node_id -> NodeRecord, in the order added
+        for record in records:
+            if record.node_id is None:
+                record.node_id = new_node_id()
+            self.records[record.node_id] = record
+        self.root = root
+
+    def __len__(self):
+        return len(self.records)
+
+    @classmethod
+    def from_data(cls, data):
+        return cls(*records_from_data(data))
+
+    @classmethod
+    def load(cls, file_path):
+        """Read a map saved as JSON or in the binary format (.mmb)"""
+        return cls.from_data(read_mindmap_file(file_path))
+
+    def to_data(self):
+        return records_to_data(list(self.records.values()), self.root)
+
+    def save(self, file_path):
+        """Write the map as JSON, or in the binary format for .mmb files"""
+        write_mindmap_file(self.to_data(), file_path)
+
+    def add_node(self, x=0.0, y=0.0, text="New Idea", parent=None, **fields):
+        """Add a record at (x, y), as the last child of parent if given.
+
+        The first node added to an empty map becomes its root. fields sets
+        any other NodeRecord constructor argument (color, size, shape).
+        """
+        record = NodeRecord(x, y, text, **fields)
+        record.node_id = new_node_id()
+        if parent is not None:
+            record.parent = parent
+            record.level = parent.level + 1
+            record.hidden = parent.hidden or parent.collapsed
+            parent.children.append(record)
+        elif self.root is None:
+            self.root = record
+        self.records[record.node_id] = record
+        return record
+
+    def branch_snapshot(self, record, index=None):
+        """Describe how a record's branch is attached, for restore_branch after remove_branch.
+
+        index is where the record is likely found among its siblings, they
+        are only searched when it is not there.
+        """
+        parent = record.parent
+        if parent is None:
+            index = 0
+        elif index is None or not 0 <= index < len(parent.children) or parent.children[index] is not record:
+            index = parent.children.index(record)
+        branch = [record] + record.descendants()
+        inside = {id(member) for member in branch}
+        return {
+            "record": record,
+            "parent": parent,
+            "index": index,
+            "links": [(member, other) for member in branch for other in member.links if id(other) not in inside],
+            "root": record is self.root
+        }
+
+    def remove_branch(self, record, index=None):
+        """Remove a record, everything below it and every link to the rest of the map.
+
+        Costs the size of the branch and of its links. The records of the
+        branch keep their children and the links among them, index is as
+        for branch_snapshot.
+        """
+        branch = [record] + record.descendants()
+        inside = {id(member) for member in branch}
+        parent = record.parent
+        if parent is not None:
+            siblings = parent.children
+            if index is not None and 0 <= index < len(siblings) and siblings[index] is record:
+                del siblings[index]
+            else:
+                siblings.remove(record)
+            record.parent = None
+        records = self.records
+        for member in branch:
+            if member.links:
+                for other in member.links:
+                    if id(other) not in inside:
+                        other.links.remove(member)
+                member.links = [other for other in member.links if id(other) in inside] or ()
+            del records[member.node_id]
+        if self.root is not None and id(self.root) in inside:
+            self.root = None
+
+    def restore_branch(self, snapshot):
+        """Put a branch removed by remove_branch back, as described by branch_snapshot.
+
+        Links to records removed since are left out.
+        """
+        record, parent = snapshot["record"], snapshot["parent"]
+        if parent is not None:
+            record.parent = parent
+            parent.children.insert(snapshot["index"], record)
+        records = self.records
+        for member in [record] + record.descendants():
+            records[member.node_id] = member
+        for member, other in snapshot["links"]:
+            if records.get(other.node_id) is other:
+                self.link(member, other)
+        if snapshot["root"]:
+            self.root = record
+        update_hidden([record])
+
+    def link(self, record1, record2):
+        """Add a non-hierarchical connection between two records"""
+        if record1 is not record2 and record2 not in record1.links:
+            record1.add_link(record2)
+            record2.add_link(record1)
+
+    def unlink(self, record1, record2):
+        if record2 in record1.links:
+            record1.links.remove(record2)
+            record2.links.remove(record1)
+
+    def set_collapsed(self, record, collapsed):
+        """Collapse or expand a record, returns the records this hides or shows.
+
+        Costs the records shown below it once expanded, the ones under
+        collapsed records stay hidden either way. They are listed parents
+        first.
+        """
+        record.collapsed = collapsed
+        if record.hidden:
+            return []
+        below = list(record.children)
+        for child in below:  # Grows while iterating
+            child.hidden = collapsed
+            if not child.collapsed:
+                below.extend(child.children)
+        return below
+
+    def move(self, record, x, y):
+        """Move a record to (x, y), along with everything hidden below it"""
+        dx, dy = x - record.x, y - record.y
+        if dx or dy:
+            for member in [record] + record.descendants() if record.collapsed else [record]:
+                member.x += dx
+                member.y += dy
+
+    def shown(self):
+        """The records not hidden under a collapsed one"""
+        return [record for record in self.records.values() if not record.hidden]
+
+    def content_rect(self, margin=20.0):
+        """(x, y, width, height) covering every shown record, None for an empty map"""
+        shown = self.shown()
+        if not shown:
+            return None
+        left = min(record.x for record in shown) - margin
+        top = min(record.y for record in shown) - margin
+        right = max(record.x + record.width for record in shown) + margin
+        bottom = max(record.y + record.height for record in shown) + margin
+        return left, top, right - left, bottom - top
+
+    def layout_tree(self):
+        """The shown tree below the root breadth-first, as (records, children) for TidyLayout.run.
+
+        children[i] are the indices of the children of records[i], none
+        for collapsed records. Both are empty without a root.
+        """
+        if self.root is None:
+            return [], []
+        records, children = [self.root], []
+        for record in records:  # Grows while iterating
+            visible = [] if record.collapsed else record.children
+            children.append(list(range(len(records), len(records) + len(visible))))
+            records.extend(visible)
+        return records, children
+
+    def layout_positions(self, centers):
+        """Map (record, x, y) layout centres, relative to the root's centre, to top-left positions"""
+        center_x, center_y = self.root.center()
+        return {record: (center_x + x - record.width / 2, center_y + y - record.height / 2)
+                for record, x, y in centers}
+
+    def tidy_layout(self, mode="balanced"):
+        """Lay out the shown tree below the root, without moving anything.
+
+        Returns the TidyLayout, which can update the layout after edits,
+        the records of layout_tree and {record: (x, y)} of their new
+        positions, with the root where it is. mode is one of
+        mindmap_layout.LAYOUT_MODES.
+        """
+        records, children = self.layout_tree()
+        tidy = TidyLayout(mode)
+        if not records:
+            return tidy, records, {}
+        xs, ys = tidy.run(children, [record.width for record in records], [record.height for record in records], 0)
+        return tidy, records, self.layout_positions(zip(records, xs, ys))
+
+    def arrange(self, mode="balanced"):
+        """Lay out the shown tree below the root like MindMapView.auto_arrange_nodes.
+
+        The root stays in place and hidden branches move along with their
+        collapsed record. Returns the number of records moved.
+        """
+        moved = 0
+        for record, (x, y) in self.tidy_layout(mode)[2].items():
+            if (x, y) != (record.x, record.y):
+                moved += 1
+                self.move(record, x, y)
+        return moved
+
+
+class SpatialGrid:
+    """Uniform grid over axis-aligned boxes for fast area queries.
+
+    Every key is stored in each cell its box overlaps. Moving a key within
+    the same cells only updates its box, so incremental updates during drags
+    are cheap.
+    """
+
+    def __init__(self, cell_size=512.0):
+        self.cell_size = cell_size
+        self.cells = {}  # (column, row) -> set of keys
+        self.boxes = {}  # key -> (x, y, width, height)
+        self.spans = {}  # key -> (first column, first row, last column, last row)
+
+    def __len__(self):
+        return len(self.boxes)
+
+    def __contains__(self, key):
+        return key in self.boxes
+
+    def _span(self, x, y, width, height):
+        size = self.cell_size
+        return (int(x // size), int(y // size), int((x + width) // size), int((y + height) // size))
+
+    def insert(self, key, x, y, width, height):
+        if key in self.boxes:
+            self.remove(key)
+        span = self._span(x, y, width, height)
+        self.boxes[key] = (x, y, width, height)
+        self.spans[key] = span
+        cells = self.cells
+        for column in range(span[0], span[2] + 1):
+            for row in range(span[1], span[3] + 1):
+                bucket = cells.get((column, row))
+                if bucket is None:
+                    bucket = cells[(column, row)] = set()
+                bucket.add(key)
+
+    def remove(self, key):
+        span = self.spans.pop(key, None)
+        if span is None:
+            return
+        del self.boxes[key]
+        cells = self.cells
+        for column in range(span[0], span[2] + 1):
+            for row in range(span[1], span[3] + 1):
+                bucket = cells[(column, row)]
+                bucket.discard(key)
+                if not bucket:
+                    del cells[(column, row)]
+
+    def move(self, key, x, y, width, height):
+        if self.spans.get(key) == self._span(x, y, width, height):
+            self.boxes[key] = (x, y, width, height)
+        else:
+            self.insert(key, x, y, width, height)
+
+    def clear(self):
+        self.cells.clear()
+        self.boxes.clear()
+        self.spans.clear()
+
+    def occupied_cells(self, x, y, width, height):
+        """Return the keys of the non-empty cells overlapping the given rectangle"""
+        first_column, first_row, last_column, last_row = self._span(x, y, width, height)
+        if (last_column - first_column + 1) * (last_row - first_row + 1) > len(self.cells):
+            # Wider than the occupied area, walk the occupied cells instead
+            return [cell for cell in self.cells
+                    if first_column <= cell[0] <= last_column and first_row <= cell[1] <= last_row]
+        cells = self.cells
+        return [(column, row) for column in range(first_column, last_column + 1)
+                for row in range(first_row, last_row + 1) if (column, row) in cells]
+
+    def query(self, x, y, width, height):
+        """Return the set of keys whose boxes intersect the given rectangle"""
+        candidates = set()
+        for cell in self.occupied_cells(x, y, width, height):
+            candidates.update(self.cells[cell])
+        right, bottom = x + width, y + height
+        boxes = self.boxes
+        return {key for key in candidates
+                if boxes[key][0] <= right and boxes[key][0] + boxes[key][2] >= x
+                and boxes[key][1] <= bottom and boxes[key][1] + boxes[key][3] >= y}
+
+    def nearest(self, x, y, max_distance=None, accept=None):
+        """Return the key whose box is closest to the point (x, y), or None.
+
+        Boxes containing the point are at distance 0. Cells are searched in
+        rings around the point until no closer box can turn up; accept, if
+        given, filters out keys. Only boxes within max_distance count.
+        """
+        limit = float("inf") if max_distance is None else max_distance
+        best_key, best = None, limit
+        boxes = self.boxes
+        size = self.cell_size
+        column, row = int(x // size), int(y // size)
+        seen = set()
+        ring = 0
+        while self.cells and (ring - 1) * size <= best:
+            if 8 * ring > len(self.cells):
+                # The ring has more cells than are occupied, check the rest directly
+                keys = (key for key in boxes if key not in seen)
+            else:
+                keys = (key for cell in _ring_cells(column, row, ring) if cell in self.cells
+                        for key in self.cells[cell] if key not in seen)
+            for key in keys:
+                seen.add(key)
+                if accept is not None and not accept(key):
+                    continue
+                left, top, width, height = boxes[key]
+                dx = max(left - x, 0.0, x - left - width)
+                dy = max(top - y, 0.0, y - top - height)
+                distance = (dx * dx + dy * dy) ** 0.5
+                if distance < best or (best_key is None and distance <= limit):
+                    best_key, best = key, distance
+            if 8 * ring > len(self.cells):
+                break
+            ring += 1
+        return best_key
+
+
+class ExtentGrid(SpatialGrid):
+    """SpatialGrid that also knows the extent of its boxes, in whole cells.
+
+    Counts how many boxes start and end in every column and row, so
+    extent() only looks for a new outermost column or row after the last
+    box there has left, instead of going over every box.
+    """
+
+    def __init__(self, cell_size=512.0):
+        super().__init__(cell_size)
+        self.edge_counts = ({}, {}, {}, {})  # First column, first row, last column, last row -> keys
+        self.extremes = [None] * 4  # Outermost of each, None when it has to be looked up again
+
+    def insert(self, key, x, y, width, height):
+        super().insert(key, x, y, width, height)
+        extremes = self.extremes
+        for side, (counts, value) in enumerate(zip(self.edge_counts, self.spans[key])):
+            counts[value] = counts.get(value, 0) + 1
+            extreme = extremes[side]
+            if extreme is not None and (value < extreme if side < 2 else value > extreme):
+                extremes[side] = value
+
+    def remove(self, key):
+        span = self.spans.get(key)
+        if span is None:
+            return
+        super().remove(key)
+        for side, (counts, value) in enumerate(zip(self.edge_counts, span)):
+            if counts[value] == 1:
+                del counts[value]
+                if self.extremes[side] == value:
+                    self.extremes[side] = None
+            else:
+                counts[value] -= 1
+
+    def clear(self):
+        super().clear()
+        for counts in self.edge_counts:
+            counts.clear()
+        self.extremes = [None] * 4
+
+    def extent(self):
+        """(x, y, width, height) of the cells covering every box, None when empty"""
+        if not self.boxes:
+            return None
+        extremes = self.extremes
+        for side, counts in enumerate(self.edge_counts):
+            if extremes[side] is None:
+                extremes[side] = min(counts) if side < 2 else max(counts)
+        size = self.cell_size
+        first_column, first_row, last_column, last_row = extremes
+        return (first_column * size, first_row * size,
+                (last_column - first_column + 1) * size, (last_row - first_row + 1) * size)
+
+
+def _ring_cells(column, row, ring):
+    """Cells at Chebyshev distance ring from (column, row)"""
+    if ring == 0:
+        yield column, row
+        return
+    for c in range(column - ring, column + ring + 1):
+        yield c, row - ring
+        yield c, row + ring
+    for r in range(row - ring + 1, row + ring):
+        yield column - ring, r
+        yield column + ring, r
@@ -0,0 +1,127 @@
+"""Counting and timing the editor's hot paths, switched on and off at runtime.
+
+A Profiler wraps the methods given to instrument while it is enabled and
+puts the originals back when it is disabled, so it costs nothing while
+off. Every call of a wrapped method adds to the call count, total and
+longest time of its label; a nested call counts in full in its own label
+and in its callers'. Methods instrumented as frames also keep the recent
+frame times. While tracing, every call is also kept as a complete event,
+the oldest dropped past max_events, and write_trace saves them as Chrome
+trace JSON for chrome://tracing or Perfetto.
+"""
+import collections
+import functools
+import json
+import os
+import threading
+import time
+
+
+class Profiler:
+    max_events = 100000  # Trace events kept, about 10 MB
+    frame_history = 120  # Frames frame_stats looks back over
+
+    def __init__(self):
+        self.enabled = False
+        self.tracing = False
+        self.hooks = []  # (class, method name, label, frames) to wrap while enabled
+        self.originals = {}  # (class, method name) -> the class's own function, or None if inherited
+        self.stats = {}  # label -> [calls, total seconds, longest seconds]
+        self.events = collections.deque(maxlen=self.max_events)  # (label, start, seconds, thread)
+        self.frames = collections.deque(maxlen=self.frame_history)  # (start, seconds)
+        self.origin = time.perf_counter()  # Time 0 of the trace
+
+    def instrument(self, cls, name, label=None, frames=False):
+        """Time a method of a class while enabled, under label (class.method by default)"""
+        hook = (cls, name, label or "%s.%s" % (cls.__name__, name), frames)
+        self.hooks.append(hook)
+        if self.enabled:
+            self._install(*hook)
+
+    def enable(self, tracing=False):
+        self.tracing = tracing
+        if not self.enabled:
+            self.enabled = True
+            for hook in self.hooks:
+                self._install(*hook)
+
+    def disable(self):
+        self.enabled = self.tracing = False
+        for (cls, name), original in self.originals.items():
+            if original is None:
+                delattr(cls, name)
+            else:
+                setattr(cls, name, original)
+        self.originals.clear()
+
+    def reset(self):
+        """Forget the counts, frames and trace so far"""
+        self.stats.clear()
+        self.events.clear()
+        self.frames.clear()
+        self.origin = time.perf_counter()
+
+    def _install(self, cls, name, label, frames):
+        if (cls, name) in self.originals:
+            return
+        self.originals[(cls, name)] = cls.__dict__.get(name)
+        setattr(cls, name, self._wrap(getattr(cls, name), label, self.record_frame if frames else self.record))
+
+    @staticmethod
+    def _wrap(function, label, record):
+        clock = time.perf_counter
+
+        @functools.wraps(function)
+        def timed(*args, **kwargs):
+            start = clock()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                record(label, start, clock())
+        return timed
+
+    def record(self, label, start, end):
+        """Count one call of label that ran from start to end (time.perf_counter)"""
+        seconds = end - start
+        stats = self.stats.get(label)
+        if stats is None:
+            stats = self.stats[label] = [0, 0.0, 0.0]
+        stats[0] += 1
+        stats[1] += seconds
+        if seconds > stats[2]:
+            stats[2] = seconds
+        if self.tracing:
+            self.events.append((label, start, seconds, threading.get_ident()))
+
+    def record_frame(self, label, start, end):
+        self.record(label, start, end)
+        self.frames.append((start, end - start))
+
+    def summary(self):
+        """Return (label, calls, total seconds, mean seconds, longest seconds), most total time first"""
+        rows = [(label, calls, total, total / calls, longest)
+                for label, (calls, total, longest) in self.stats.items()]
+        rows.sort(key=lambda row: -row[2])
+        return rows
+
+    def frame_stats(self):
+        """Return (frames per second, mean seconds, longest seconds) of the recent frames, or None"""
+        if not self.frames:
+            return None
+        times = [seconds for _, seconds in self.frames]
+        span = self.frames[-1][0] - self.frames[0][0]
+        rate = (len(self.frames) - 1) / span if span > 0 else 0.0
+        return rate, sum(times) / len(times), max(times)
+
+    def trace(self):
+        """The trace events as a Chrome trace dict, times in microseconds"""
+        pid = os.getpid()
+        origin = self.origin
+        events = [{"name": label, "cat": "editor", "ph": "X", "ts": (start - origin) * 1e6,
+                   "dur": seconds * 1e6, "pid": pid, "tid": thread}
+                  for label, start, seconds, thread in self.events if start >= origin]
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write_trace(self, file_path):
+        with open(file_path, "w") as f:
+            json.dump(self.trace(), f)
@@ -0,0 +1,197 @@
+"""Render mind maps to image files without widgets or a display.
+
+MapRenderer paints a MindMap the way MindMapView shows it, straight from
+its NodeRecords with QtGui, so batch jobs (see mindmap_cli) need neither
+QApplication nor a scene. Qt runs on the offscreen platform unless
+QT_QPA_PLATFORM says otherwise. Like MindMapView.export_to_image, PNG
+output is rendered a band of rows at a time and streamed through
+PngStreamWriter, so memory stays around memory_limit bytes however large
+the map is. Nodes and lines are drawn in a Theme, classic by default, with
+the same shared styles as the view, and with its shapes and text layout
+(see mindmap_style.NodeStyle).
+"""
+import math
+import os
+import sys
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt5.QtCore import QLineF, QMarginsF, QRect, QRectF, QSize, QSizeF, Qt
+from PyQt5.QtGui import QAbstractTextDocumentLayout, QGuiApplication, QImage, QPageSize, QPainter, QPalette, QPdfWriter
+
+from mindmap_export import PngStreamWriter
+from mindmap_geometry import edge_lines
+from mindmap_model import SpatialGrid
+from mindmap_style import DEFAULT_THEME, THEMES
+
+RENDER_FORMATS = (".png", ".svg", ".pdf", ".jpg", ".bmp")
+
+_app = None  # QGuiApplication made by ensure_app, kept alive while in use
+
+
+def ensure_app():
+    """Make sure a Qt application exists, fonts cannot be used before one does"""
+    global _app
+    if QGuiApplication.instance() is None:
+        _app = QGuiApplication([sys.argv[0] if sys.argv and sys.argv[0] else "mindmap"])
+
+
+class MapRenderer:
+    """Draws the shown nodes and lines of a MindMap, any part of it at a time.
+
+    Nodes and lines are indexed in SpatialGrids, so painting one band of a
+    huge map only visits what lies in it. Line ends are computed once, on
+    the node outlines, see mindmap_geometry.
+    """
+    max_cells = 16  # Lines crossing more grid cells are checked on every paint instead
+    overhang = 50  # Scene units that text and outlines may reach past a node's box
+
+    def __init__(self, mindmap, theme=DEFAULT_THEME):
+        ensure_app()
+        self.theme = THEMES[theme] if isinstance(theme, str) else theme
+        self.records = mindmap.shown()
+        self.rect = mindmap.content_rect() or (0.0, 0.0, 1.0, 1.0)  # Scene (x, y, width, height) rendered
+        self.grid = SpatialGrid()
+        index = {}
+        for i, record in enumerate(self.records):
+            index[id(record)] = i
+            self.grid.insert(i, record.x, record.y, record.width, record.height)
+        pairs, self.dashed = [], []
+        for i, record in enumerate(self.records):
+            for child in record.children:
+                if id(child) in index:
+                    pairs.append((i, index[id(child)]))
+                    self.dashed.append(False)
+            for other in record.links:
+                j = index.get(id(other))
+                if j is not None and i < j:  # Each link once
+                    pairs.append((i, j))
+                    self.dashed.append(True)
+        rows = [record.center() + (record.width / 2, record.height / 2, record.node_type == "ellipse")
+                for record in self.records]
+        self.lines = edge_lines(rows, pairs) if pairs else []
+        self.line_grid = SpatialGrid(1024.0)
+        self.long_lines = []
+        size = self.line_grid.cell_size
+        for k, (x1, y1, x2, y2) in enumerate(self.lines):
+            width, height = abs(x2 - x1), abs(y2 - y1)
+            if (width // size + 2) * (height // size + 2) > self.max_cells:
+                self.long_lines.append(k)
+            else:
+                self.line_grid.insert(k, min(x1, x2), min(y1, y2), width, height)
+
+    def paint(self, painter, x, y, width, height):
+        """Paint what lies in a scene rectangle, the painter maps scene coordinates already"""
+        lines = self.line_grid.query(x, y, width, height)
+        lines.update(self.long_lines)
+        solid, dashed = [], []
+        for k in sorted(lines):
+            (dashed if self.dashed[k] else solid).append(QLineF(*self.lines[k]))
+        theme = self.theme
+        pens, _ = theme.pens()
+        painter.setPen(pens[0])
+        painter.drawLines(solid)
+        painter.setPen(pens[1])
+        painter.drawLines(dashed)
+
+        # Later nodes are stacked above earlier ones, as in the view
+        margin = self.overhang
+        for i in sorted(self.grid.query(x - margin, y - margin, width + 2 * margin, height + 2 * margin)):
+            record = self.records[i]
+            style = theme.style(record.color)
+            style.paint_shape(painter, QRectF(record.x, record.y, record.width, record.height), record.node_type)
+            # Centred in the node, as MindMapNode.center_text places its text
+            document = style.text_document(record.text, record.width)
+            size = document.size()
+            context = QAbstractTextDocumentLayout.PaintContext()
+            context.palette.setColor(QPalette.Text, style.text_color)
+            painter.save()
+            painter.translate(record.x + (record.width - size.width()) / 2,
+                              record.y + (record.height - size.height()) / 2)
+            document.documentLayout().draw(painter, context)
+            painter.restore()
+
+    def render(self, file_path, scale=1.0, dpi=96, band_height=1024, memory_limit=64 << 20):
+        """Render the whole map to an image file, chosen by extension (see RENDER_FORMATS).
+
+        scale is the number of pixels per scene unit and dpi the
+        resolution recorded in the file. Returns the image size.
+        """
+        extension = os.path.splitext(file_path)[1].lower()
+        if extension not in RENDER_FORMATS:
+            raise ValueError("Cannot render to %s files, use one of %s" % (extension, ", ".join(RENDER_FORMATS)))
+        x, y, width, height = self.rect
+        pixels_x = max(1, int(math.ceil(width * scale)))
+        pixels_y = max(1, int(math.ceil(height * scale)))
+        if extension == ".png":
+            self._render_png(file_path, scale, pixels_x, pixels_y, dpi, band_height, memory_limit)
+        elif extension in (".svg", ".pdf"):
+            self._render_vector(file_path, extension, pixels_x, pixels_y, dpi)
+        else:
+            if pixels_x * pixels_y * 4 > memory_limit:
+                raise ValueError("A %dx%d image does not fit in the memory limit, render to "
+                                 "PNG, SVG or PDF instead" % (pixels_x, pixels_y))
+            image = QImage(pixels_x, pixels_y, QImage.Format_RGB32)
+            image.setDotsPerMeterX(int(round(dpi / 0.0254)))
+            image.setDotsPerMeterY(int(round(dpi / 0.0254)))
+            self._paint_band(image, scale, 0)
+            if not image.save(file_path):
+                raise OSError("Could not write %s" % file_path)
+        return pixels_x, pixels_y
+
+    def background(self):
+        """Colour under the map, the theme's or white"""
+        brush = self.theme.background_brush()
+        return brush.color() if brush.style() != Qt.NoBrush else Qt.white
+
+    def _paint_band(self, image, scale, top):
+        """Paint the rows of the image starting at pixel row top"""
+        x, y, _, _ = self.rect
+        image.fill(self.background())
+        painter = QPainter(image)
+        painter.setRenderHint(QPainter.Antialiasing)
+        painter.scale(scale, scale)
+        painter.translate(-x, -y - top / scale)
+        self.paint(painter, x, y + top / scale, image.width() / scale, image.height() / scale)
+        painter.end()
+
+    def _render_png(self, file_path, scale, width, height, dpi, band_height, memory_limit):
+        # The band image and the rows copied out of it
+        band_height = max(1, min(band_height, memory_limit // (width * 3 * 2)))
+        with PngStreamWriter(file_path, width, height, dpi) as writer:
+            for top in range(0, height, band_height):
+                rows = min(band_height, height - top)
+                image = QImage(width, rows, QImage.Format_RGB888)
+                self._paint_band(image, scale, top)
+                bits = image.constBits()
+                bits.setsize(image.byteCount())
+                data, stride = bytes(bits), image.bytesPerLine()
+                writer.write_rows(data[row * stride:row * stride + width * 3] for row in range(rows))
+
+    def _render_vector(self, file_path, extension, width, height, dpi):
+        if extension == ".svg":
+            from PyQt5.QtSvg import QSvgGenerator
+            device = QSvgGenerator()
+            device.setFileName(file_path)
+            device.setSize(QSize(width, height))
+            device.setViewBox(QRect(0, 0, width, height))
+            device.setResolution(dpi)
+        else:
+            device = QPdfWriter(file_path)
+            device.setResolution(dpi)
+            device.setPageSize(QPageSize(QSizeF(width * 72.0 / dpi, height * 72.0 / dpi), QPageSize.Point))
+            device.setPageMargins(QMarginsF(0, 0, 0, 0))
+        x, y, scene_width, scene_height = self.rect
+        painter = QPainter(device)
+        painter.setRenderHint(QPainter.Antialiasing)
+        if self.theme.background:
+            painter.fillRect(0, 0, painter.device().width(), painter.device().height(), self.background())
+        painter.scale(painter.device().width() / scene_width, painter.device().height() / scene_height)
+        painter.translate(-x, -y)
+        self.paint(painter, x, y, scene_width, scene_height)
+        painter.end()
+
+
+def render_mindmap(mindmap, file_path, theme=DEFAULT_THEME, **options):
+    """Render a MindMap to an image file in a theme, see MapRenderer.render"""
+    return MapRenderer(mindmap, theme).render(file_path, **options)
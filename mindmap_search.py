@@ -0,0 +1,268 @@
+"""Full-text search over the text and notes of mind map nodes.
+
+SearchIndex is an inverted index from words to the keys of the nodes
+holding them; the view keys it by node id, shared by a MindMapNode and
+the record it shows. Words are lower-cased runs of letters and digits.
+Every query word matches the words it starts, so results narrow down as
+the query is typed, and with fuzzy also the words one edit away (a
+letter inserted, deleted, changed or two swapped). All query words must
+match, text matches rank above notes matches and exact above prefix above
+fuzzy ones.
+
+Prefixes are looked up in a sorted vocabulary, fuzzy matches in an index
+of every word with one letter deleted, so a query costs the matching
+words and nodes rather than the size of the map. Words new since the
+last query are sorted into the vocabulary in one go. Only words of
+letters are matched fuzzily, a number one digit off is another number;
+their deletion index is built at the first fuzzy query.
+"""
+import bisect
+import heapq
+import re
+
+_word = re.compile(r"\w+")
+
+# Score of a query word per kind of match, plus TEXT_BONUS when the word is in the node text
+EXACT, PREFIX, FUZZY = 3, 2, 1
+TEXT_BONUS = 3
+
+
+def words(text):
+    """The distinct searchable words of a string"""
+    return set(_word.findall(text.casefold()))
+
+
+def _deletions(word):
+    return {word[:i] + word[i + 1:] for i in range(len(word))}
+
+
+def within_one_edit(a, b):
+    """Whether a can be turned into b by inserting, deleting or changing a letter or swapping two"""
+    if a == b:
+        return True
+    if len(a) < len(b):
+        a, b = b, a
+    if len(a) - len(b) > 1:
+        return False
+    i = 0
+    while i < len(b) and a[i] == b[i]:
+        i += 1
+    if len(a) > len(b):
+        return a[i + 1:] == b[i:]
+    return a[i + 1:] == b[i + 1:] or (a[i + 1:i + 2] == b[i:i + 1] and a[i:i + 1] == b[i + 1:i + 2]
+                                      and a[i + 2:] == b[i + 2:])
+
+
+class SearchIndex:
+    """Inverted index over the text and notes of nodes, updated one node at a time"""
+    min_fuzzy_length = 4  # Shorter query words are one edit from too much
+
+    def __init__(self):
+        self.entries = {}  # key -> (text, notes, text words, all words), tuples of strings the gc stops tracking
+        self.order = {}  # key -> sequence number, ties keep the order nodes were added
+        self.next_order = 0
+        self.postings = {}  # word -> set of keys
+        self.text_postings = {}  # word -> set of the keys with the word in their text
+        self.vocabulary = []  # Sorted words of postings, apart from unsorted
+        self.unsorted = set()
+        self.variants = None  # Word with a letter deleted -> words, see fuzzy_words
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def entry(self, key):
+        """Return the (text, notes) indexed for key, or None"""
+        entry = self.entries.get(key)
+        return entry[:2] if entry is not None else None
+
+    def add(self, key, text, notes=""):
+        """Index a node's text and notes, replacing what was indexed for key before"""
+        old = self.entries.get(key)
+        if old is not None and old[0] == text and old[1] == notes:
+            return
+        text_words = words(text)
+        all_words = text_words | words(notes) if notes else text_words
+        old_words, old_text_words = (set(old[3]), set(old[2])) if old is not None else ((), ())
+        for word in old_words:
+            if word not in all_words:
+                self._drop(word, key)
+        postings = self.postings
+        for word in all_words:
+            if word in old_words:
+                continue
+            keys = postings.get(word)
+            if keys is None:
+                keys = postings[word] = set()
+                self.unsorted.add(word)
+                if self.variants is not None:
+                    self._add_variants(word)
+            keys.add(key)
+        text_postings = self.text_postings
+        for word in old_text_words:
+            if word in text_words:
+                continue
+            keys = text_postings[word]
+            keys.discard(key)
+            if not keys:
+                del text_postings[word]
+        for word in text_words:
+            if word not in old_text_words:
+                text_postings.setdefault(word, set()).add(key)
+        text_words = tuple(text_words)
+        self.entries[key] = (text, notes, text_words, tuple(all_words) if notes else text_words)
+        if key not in self.order:
+            self.order[key] = self.next_order
+            self.next_order += 1
+
+    def remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        del self.order[key]
+        for word in entry[3]:
+            self._drop(word, key)
+        text_postings = self.text_postings
+        for word in entry[2]:
+            keys = text_postings[word]
+            keys.discard(key)
+            if not keys:
+                del text_postings[word]
+
+    def clear(self):
+        self.entries.clear()
+        self.order.clear()
+        self.postings.clear()
+        self.text_postings.clear()
+        self.vocabulary = []
+        self.unsorted.clear()
+        self.variants = None
+
+    def _drop(self, word, key):
+        keys = self.postings[word]
+        keys.discard(key)
+        if not keys:
+            del self.postings[word]
+            if word in self.unsorted:
+                self.unsorted.discard(word)
+            else:
+                vocabulary = self.vocabulary
+                del vocabulary[bisect.bisect_left(vocabulary, word)]
+            if self.variants is not None:
+                self._remove_variants(word)
+
+    @staticmethod
+    def fuzzy_candidate(word):
+        return len(word) >= SearchIndex.min_fuzzy_length - 1 and word.isalpha()
+
+    def _add_variants(self, word):
+        if not self.fuzzy_candidate(word):
+            return
+        variants = self.variants
+        for variant in _deletions(word) | {word}:
+            variants.setdefault(variant, set()).add(word)
+
+    def _remove_variants(self, word):
+        if not self.fuzzy_candidate(word):
+            return
+        variants = self.variants
+        for variant in _deletions(word) | {word}:
+            found = variants[variant]
+            found.discard(word)
+            if not found:
+                del variants[variant]
+
+    def prefixed_words(self, prefix):
+        """Indexed words starting with prefix, the word itself included"""
+        if self.unsorted:
+            if len(self.unsorted) < 64:
+                for word in self.unsorted:
+                    bisect.insort(self.vocabulary, word)
+            else:
+                self.vocabulary.extend(self.unsorted)
+                self.vocabulary.sort()
+            self.unsorted.clear()
+        vocabulary = self.vocabulary
+        i = bisect.bisect_left(vocabulary, prefix)
+        found = []
+        while i < len(vocabulary) and vocabulary[i].startswith(prefix):
+            found.append(vocabulary[i])
+            i += 1
+        return found
+
+    def fuzzy_words(self, word):
+        """Indexed words one edit away from word"""
+        if self.variants is None:
+            self.variants = {}
+            for indexed in self.postings:
+                self._add_variants(indexed)
+        variants = self.variants
+        candidates = set()
+        for variant in _deletions(word) | {word}:
+            candidates.update(variants.get(variant, ()))
+        return [candidate for candidate in candidates if within_one_edit(word, candidate)]
+
+    def match_score(self, term, word, fuzzy):
+        """Score of an indexed word for a query word, 0 if it does not match"""
+        if word == term:
+            return EXACT
+        if word.startswith(term):
+            return PREFIX
+        if fuzzy and len(term) >= self.min_fuzzy_length and term.isalpha() and within_one_edit(term, word):
+            return FUZZY
+        return 0
+
+    def term_matches(self, term, fuzzy):
+        """Return {key: score} for the nodes matching one query word"""
+        matched = [(word, PREFIX) for word in self.prefixed_words(term)]
+        if fuzzy and len(term) >= self.min_fuzzy_length and term.isalpha():
+            matched.extend((word, FUZZY) for word in self.fuzzy_words(term) if not word.startswith(term))
+        updates = []
+        for word, score in matched:
+            if word == term:
+                score = EXACT
+            updates.append((score, self.postings[word]))
+            if word in self.text_postings:
+                updates.append((score + TEXT_BONUS, self.text_postings[word]))
+        # Best score last, so it is the one kept
+        updates.sort(key=lambda update: update[0])
+        scores = {}
+        for score, keys in updates:
+            scores.update(dict.fromkeys(keys, score))
+        return scores
+
+    def candidate_matches(self, term, fuzzy, scores):
+        """Add the score of one more query word to the nodes in scores that match it"""
+        entries = self.entries
+        matches = {}
+        for key, total in scores.items():
+            _, _, text_words, all_words = entries[key]
+            best = 0
+            for word in all_words:
+                score = self.match_score(term, word, fuzzy)
+                if score and word in text_words:
+                    score += TEXT_BONUS
+                if score > best:
+                    best = score
+            if best:
+                matches[key] = total + best
+        return matches
+
+    def search(self, query, fuzzy=False, limit=None):
+        """Return the keys of the nodes matching every word of query, best first"""
+        terms = sorted(words(query), key=len, reverse=True)  # Longest words match the fewest nodes
+        if not terms:
+            return []
+        scores = self.term_matches(terms[0], fuzzy)
+        for term in terms[1:]:
+            if not scores:
+                break
+            # The other words are checked against the few nodes left rather than looked up
+            scores = self.candidate_matches(term, fuzzy, scores)
+        order = self.order
+        rank = lambda key: (-scores[key], order[key])
+        if limit is not None and limit < len(scores):
+            return heapq.nsmallest(limit, scores, key=rank)
+        return sorted(scores, key=rank)
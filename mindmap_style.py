@@ -0,0 +1,140 @@
+"""Themes, and the shared styles nodes are drawn with.
+
+A Theme says how a map looks: the fill of the nodes at each level, and
+the outline, font, text colour, selection highlight, connection lines and
+background they all share. Its NodeStyles are interned, one per fill, and
+hold the QBrush, QPen and QFont that nodes paint with, so a map holds one
+set of them per colour in use rather than one per node (see
+MindMapNode.set_style). Styles never change once made; restyling a node
+gives it another style.
+
+Fills are "#rrggbb" strings, as NodeRecord.color and saved maps keep
+them. Levels past a theme's level_fills cycle through its deep_fills, so
+a branch gets the same colours every time it is built.
+
+NodeStyle also draws a node's shape and lays out its text, for both
+MindMapNode and MapRenderer (see mindmap_render), so exports of the view
+and batch renders look alike.
+
+Qt objects are only made at a theme's first use, as fonts cannot be made
+before the application is.
+"""
+from PyQt5.QtCore import Qt
+from PyQt5.QtGui import QBrush, QColor, QFont, QPen, QTextDocument
+
+TEXT_INSET = 10  # Node text wraps this far inside either side of the node
+
+
+class NodeStyle:
+    """The brush, pens and font of a theme's nodes of one fill, see Theme.style"""
+    __slots__ = ("theme", "fill", "brush", "highlight", "pen", "font", "text_color")
+
+    def __init__(self, theme, fill):
+        self.theme = theme
+        self.fill = fill
+        self.brush = QBrush(QColor(fill))
+        # Shared by every style of the theme
+        self.highlight = theme.highlight_brush
+        self.pen = theme.outline_pen
+        self.font = theme.node_font
+        self.text_color = theme.text_qcolor
+
+    def paint_shape(self, painter, rect, node_type, brush=None):
+        """Outline and fill a node's box, in its "ellipse" or "rectangle" shape"""
+        painter.setPen(self.pen)
+        painter.setBrush(self.brush if brush is None else brush)
+        if node_type == "rectangle":
+            painter.drawRect(rect)
+        else:
+            painter.drawEllipse(rect)
+
+    def text_document(self, text, width):
+        """A QTextDocument holding the text of a node width wide, laid out as the node shows it"""
+        document = QTextDocument()
+        document.setDefaultFont(self.font)
+        document.setPlainText(text)
+        document.setTextWidth(width - 2 * TEXT_INSET)
+        return document
+
+
+class Theme:
+    """How a map looks, colours given as anything QColor takes"""
+
+    def __init__(self, name, level_fills, deep_fills, outline="#000000", outline_width=2, font=("Arial", 10),
+                 text_color="#000000", highlight="#00ffff", line="#000000", faint_link="#808080",
+                 background=None):
+        self.name = name
+        self.level_fills = [QColor(fill).name() for fill in level_fills]  # Fill by level, the root first
+        self.deep_fills = [QColor(fill).name() for fill in deep_fills]  # Cycled through past level_fills
+        self.outline = outline
+        self.outline_width = outline_width
+        self.font = font  # (family, point size)
+        self.text_color = text_color
+        self.highlight = highlight  # Fill of the nodes picked for a manual connection
+        self.line = line
+        self.faint_link = faint_link  # Dashed connections drawn thin when zoomed out
+        self.background = background  # None leaves the view's own
+        self.styles = None  # fill -> NodeStyle, made at the first style()
+
+    def __repr__(self):
+        return "Theme(%r)" % self.name
+
+    def _make_shared(self):
+        self.styles = {}
+        self.outline_pen = QPen(QColor(self.outline), self.outline_width)
+        self.node_font = QFont(*self.font)
+        self.text_qcolor = QColor(self.text_color)
+        self.highlight_brush = QBrush(QColor(self.highlight))
+        line = QColor(self.line)
+        self.line_pens = (QPen(line, 2, Qt.SolidLine), QPen(line, 2, Qt.DashLine))
+        self.thin_line_pens = (QPen(line, 0), QPen(QColor(self.faint_link), 0))
+        self.background_fill = QBrush(QColor(self.background)) if self.background else QBrush()
+
+    def fill_for(self, level):
+        level_fills = self.level_fills
+        if level < len(level_fills):
+            return level_fills[level]
+        return self.deep_fills[(level - len(level_fills)) % len(self.deep_fills)]
+
+    def style(self, fill):
+        """The interned NodeStyle of a fill, given as a colour name, QColor or Qt.GlobalColor"""
+        if self.styles is None:
+            self._make_shared()
+        key = fill if isinstance(fill, str) else None
+        style = self.styles.get(key)
+        if style is None:
+            name = QColor(fill).name()
+            style = self.styles.get(name)
+            if style is None:
+                style = self.styles[name] = NodeStyle(self, name)
+            if key is not None:
+                self.styles[key] = style  # "#FFFF00" and "yellow" find it straight away next time
+        return style
+
+    def level_style(self, level):
+        return self.style(self.fill_for(level))
+
+    def pens(self):
+        """(solid, dashed) pens of the connection lines, then the thin pair drawn when zoomed out"""
+        if self.styles is None:
+            self._make_shared()
+        return self.line_pens, self.thin_line_pens
+
+    def background_brush(self):
+        if self.styles is None:
+            self._make_shared()
+        return self.background_fill
+
+
+CLASSIC = Theme("Classic", ["#00ff00", "#ffff00", "#ffc864", "#64c8ff", "#c896ff"],
+                ["#ff9696", "#96e6aa", "#f0dc78", "#82b4f0", "#e6a0dc", "#a0e6e6"])
+NIGHT = Theme("Night", ["#4caf50", "#c9a227", "#d9823b", "#3d8fd1", "#8e6bc9"],
+              ["#c0564b", "#3f9f7f", "#a08c3c", "#5a78b4", "#a05a96", "#4b9696"],
+              outline="#d8d8d8", text_color="#ffffff", highlight="#00bcd4", line="#b0b0b0",
+              faint_link="#606060", background="#23262b")
+PASTEL = Theme("Pastel", ["#b5e8b0", "#fff3a8", "#ffd9b0", "#bfe3ff", "#e3d1ff"],
+               ["#ffc8c8", "#c8f0dc", "#f5ebb4", "#c8dcf5", "#f0d2eb", "#d2f0f0"],
+               outline="#707070", outline_width=1.5, text_color="#333333", line="#909090", faint_link="#c0c0c0")
+
+THEMES = {theme.name: theme for theme in (CLASSIC, NIGHT, PASTEL)}
+DEFAULT_THEME = CLASSIC
@@ -0,0 +1,17 @@
+import os
+import sys
+
+import pytest
+
+# The modules live at the top of the repository, not in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="session")
+def app():
+    """The editor module, "the code.py", with a QApplication on the offscreen platform"""
+    pytest.importorskip("PyQt5.QtWidgets")
+    import benchmarks  # Sets the offscreen platform
+    module = benchmarks.load_app()
+    module.qt_app = module.QApplication.instance() or module.QApplication([sys.argv[0]])  # Kept alive while in use
+    return module
@@ -0,0 +1,54 @@
+import pytest
+
+import benchmarks
+
+
+def test_generated_maps_follow_the_parameters():
+    data = benchmarks.generate_map(2000, seed=3, depth=5, fan_out=5, link_density=0.2)
+    assert data == benchmarks.generate_map(2000, seed=3, depth=5, fan_out=5, link_density=0.2)
+    nodes = data["nodes"]
+    assert max(node["level"] for node in nodes) <= 5
+    assert max(len(node["children"]) for node in nodes) <= 5
+    assert sorted(child for node in nodes for child in node["children"]) == list(range(1, 2000))
+    assert 350 <= len(data["connections"]) <= 400
+    assert 10 <= len(benchmarks.generate_map(300, seed=1)["connections"]) <= 15
+    with pytest.raises(ValueError):
+        benchmarks.generate_map(100, depth=2, fan_out=3)
+
+
+def test_replay_drags_zooms_and_pans(app, tmp_path):
+    path = str(tmp_path / "map.json")
+    benchmarks.main(["generate", path, "--size", "300", "--seed", "1"])
+    view = app.MindMapView()
+    view.resize(800, 600)
+    view.show()
+    try:
+        view.load_mindmap(path)
+        view.centerOn(view.root_node)
+        script = benchmarks.replay_script(30, seed=2)
+        frames = benchmarks.replay(app, view, script, moves_per_drag=4)
+        drags = sum(1 for step in script if step[0] == "drag")
+        assert len(frames["drag"]) == 6 * drags
+        assert len(frames["zoom"]) == sum(abs(step[1]) for step in script if step[0] == "zoom")
+        assert [view.history.text(i) for i in range(view.history.count())] == ["Move"] * drags
+    finally:
+        view.close()
+        view.clear_mindmap()
+
+
+def test_suite_results_compare(app):
+    options = {"seed": 0, "depth": None, "fan_out": 8, "link_density": 0.05, "repeat": 2,
+               "ops": 10, "steps": 4, "mode": "balanced", "scale": 0.05}
+    results = benchmarks.run_suite(["save", "collapse", "replay"], [200], options, isolate=False)
+    assert [result["benchmark"] for result in results["results"]] == ["save", "collapse", "replay"]
+    for result in results["results"]:
+        assert result["nodes"] == 200 and len(result["runs"]) == 2 and result["scene_items"] > 200
+        assert result["seconds"] == min(result["runs"])
+    assert results["results"][1]["ops"] == 10
+    assert "drag" in results["results"][2]["frames"]
+
+    slower = {"results": [dict(result, seconds=result["seconds"] * 2) for result in results["results"]]}
+    rows = benchmarks.compare_results(results, slower)
+    assert [row[:2] for row in rows] == [("save", 200), ("collapse", 200), ("replay", 200)]
+    assert all(row[4] for row in rows)
+    assert not any(row[4] for row in benchmarks.compare_results(slower, results))
@@ -0,0 +1,69 @@
+import json
+import os
+import struct
+
+import pytest
+
+import benchmarks
+import mindmap_cli
+from mindmap_model import MindMap
+
+
+def write_maps(tmp_path, count, n=300):
+    paths = []
+    for seed in range(count):
+        data = benchmarks.generate_map(n, seed=seed)
+        data["nodes"][1]["collapsed"] = True
+        path = str(tmp_path / ("map%d.json" % seed))
+        with open(path, "w") as f:
+            json.dump(data, f)
+        paths.append(path)
+    return paths
+
+
+@pytest.mark.parametrize("jobs", [0, 2])
+def test_convert_and_arrange_in_parallel(tmp_path, jobs):
+    paths = write_maps(tmp_path, 3)
+    out = str(tmp_path / "out")
+    assert mindmap_cli.main(["--jobs", str(jobs), "convert", "--output-dir", out] + paths) == 0
+    assert mindmap_cli.main(["--jobs", str(jobs), "arrange", "--mode", "right", "--output-dir", out,
+                             "--format", ".json"] + [os.path.join(out, "map%d.mmb" % i) for i in range(3)]) == 0
+    for i, path in enumerate(paths):
+        expected = MindMap.load(path)
+        expected.arrange("right")
+        assert MindMap.load(os.path.join(out, "map%d.json" % i)).to_data() == expected.to_data()
+
+
+def test_failures_are_reported_per_file(tmp_path, capsys):
+    paths = write_maps(tmp_path, 1) + [str(tmp_path / "missing.json")]
+    assert mindmap_cli.main(["--jobs", "0", "info"] + paths) == 1
+    out, err = capsys.readouterr()
+    assert "300 nodes" in out and "missing.json" in err
+    # Arranging in place needs asking for
+    assert mindmap_cli.main(["--jobs", "0", "arrange", paths[0]]) == 1
+
+
+@pytest.mark.parametrize("jobs", [0, 2])
+def test_a_broken_file_does_not_stop_the_batch(tmp_path, capsys, jobs):
+    bad = str(tmp_path / "bad.json")
+    data = benchmarks.generate_map(10)
+    data["nodes"][0]["children"].append(99)  # No such node
+    with open(bad, "w") as f:
+        json.dump(data, f)
+    good, = write_maps(tmp_path, 1)
+    assert mindmap_cli.main(["--jobs", str(jobs), "info", bad, good]) == 1
+    out, err = capsys.readouterr()
+    assert "300 nodes" in out and "bad.json" in err and "IndexError" in err
+
+
+def test_render_streams_a_png(tmp_path):
+    pytest.importorskip("PyQt5.QtGui")
+    paths = write_maps(tmp_path, 2, n=100)
+    out = str(tmp_path / "images")
+    assert mindmap_cli.main(["--jobs", "2", "render", "--scale", "0.05", "--output-dir", out] + paths) == 0
+    for i, path in enumerate(paths):
+        with open(os.path.join(out, "map%d.png" % i), "rb") as f:
+            header = f.read(24)
+        x, y, width, height = MindMap.load(path).content_rect()
+        assert header[:8] == b"\x89PNG\r\n\x1a\n"
+        assert struct.unpack(">II", header[16:24]) == (int(-(-width * 0.05 // 1)), int(-(-height * 0.05 // 1)))
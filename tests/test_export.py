@@ -0,0 +1,58 @@
+import random
+import struct
+import zlib
+
+import pytest
+
+from mindmap_export import PNG_SIGNATURE, PngStreamWriter, encode_rows
+
+
+def chunks(path):
+    with open(path, "rb") as f:
+        data = f.read()
+    assert data.startswith(PNG_SIGNATURE)
+    offset, found = len(PNG_SIGNATURE), []
+    while offset < len(data):
+        length, kind = struct.unpack_from(">I4s", data, offset)
+        body = data[offset + 8:offset + 8 + length]
+        crc, = struct.unpack_from(">I", data, offset + 8 + length)
+        assert crc == zlib.crc32(body, zlib.crc32(kind)) & 0xffffffff
+        found.append((kind, body))
+        offset += 12 + length
+    return found
+
+
+def random_rows(rng, width, count):
+    return [bytes(rng.randrange(256) for _ in range(width * 3)) for _ in range(count)]
+
+
+@pytest.mark.parametrize("chunk_size", [64, 1 << 20])
+def test_bands_make_one_png(tmp_path, chunk_size):
+    rng = random.Random(9)
+    width, bands = 37, [random_rows(rng, 37, count) for count in (1, 5, 16, 3)]
+    path = str(tmp_path / "out.png")
+    with PngStreamWriter(path, width, 25, dpi=300, chunk_size=chunk_size) as writer:
+        writer.write_rows(bands[0])
+        for band in bands[1:]:
+            writer.write_band(encode_rows(band))  # As compressed on a worker
+    found = chunks(path)
+    assert [kind for kind, _ in found][:2] == [b"IHDR", b"pHYs"] and found[-1][0] == b"IEND"
+    assert struct.unpack(">IIBBBBB", found[0][1]) == (width, 25, 8, 2, 0, 0, 0)
+    assert struct.unpack(">IIB", found[1][1]) == (11811, 11811, 1)
+    idat = b"".join(body for kind, body in found if kind == b"IDAT")
+    rows = [row for band in bands for row in band]
+    assert zlib.decompress(idat) == b"".join(b"\0" + row for row in rows)
+
+
+def test_bad_rows_are_refused(tmp_path):
+    path = str(tmp_path / "out.png")
+    writer = PngStreamWriter(path, 4, 2)
+    with pytest.raises(ValueError):
+        writer.write_rows([b"\0" * 11])
+    with pytest.raises(ValueError):
+        writer.write_rows([b"\0" * 12] * 3)
+    writer.write_rows([b"\0" * 12])
+    with pytest.raises(ValueError):
+        writer.close()  # A row short
+    with pytest.raises(ValueError):
+        PngStreamWriter(path, 0, 10)
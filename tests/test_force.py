@@ -0,0 +1,42 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from mindmap_force import ForceLayout, barnes_hut_repulsion, spring_attraction
+
+
+def exact_repulsion(pos, strength):
+    delta = pos[:, None, :] - pos[None, :, :]
+    d2 = (delta * delta).sum(axis=2)
+    np.fill_diagonal(d2, np.inf)
+    return (delta * (strength / np.maximum(d2, 1e-6))[:, :, None]).sum(axis=1)
+
+
+@pytest.mark.parametrize("n", [2, 50, 700])
+def test_barnes_hut_is_close_to_the_exact_repulsion(n):
+    pos = np.random.default_rng(n).normal(0, 500, (n, 2))
+    exact = exact_repulsion(pos, 100.0)
+    approx = barnes_hut_repulsion(pos, 100.0, theta=0.5, chunk=64)
+    error = np.sqrt(((approx - exact) ** 2).sum(axis=1)) / np.sqrt((exact ** 2).sum(axis=1))
+    assert np.median(error) < 0.05
+
+
+def test_springs_pull_both_ends_equally():
+    pos = np.array([[0.0, 0.0], [300.0, 0.0], [0.0, 150.0]])
+    forces = spring_attraction(pos, np.array([[0, 1], [0, 2]]), 150.0)
+    assert forces.sum(axis=0) == pytest.approx([0.0, 0.0])
+    assert forces[1] == pytest.approx([-600.0, 0.0])
+    assert forces[2] == pytest.approx([0.0, -150.0])
+
+
+def test_layout_keeps_the_fixed_node_and_stops():
+    rng = np.random.default_rng(8)
+    positions = rng.uniform(0, 50, (200, 2))
+    edges = [(rng.integers(v), v) for v in range(1, 200)]
+    layout = ForceLayout(positions, edges, fixed=0, iterations=40)
+    while not layout.done():
+        assert layout.step() <= layout.start_temperature + 1e-9
+    assert layout.positions[0] == pytest.approx(positions[0])
+    assert layout.step() == 0.0
+    # Crowded nodes were pushed apart
+    assert np.ptp(layout.positions, axis=0).max() > 5 * np.ptp(positions, axis=0).max()
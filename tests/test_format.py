@@ -0,0 +1,96 @@
+import json
+import struct
+
+import pytest
+
+import benchmarks
+from mindmap_format import BinaryMindMap, convert_mindmap, read_mindmap_file, write_mindmap_file
+
+
+def sample_map():
+    data = benchmarks.generate_map(500, seed=4)
+    data["nodes"][0]["text"] = "Wurzel über alles ☃"
+    data["nodes"][1]["collapsed"] = True
+    data["nodes"][2]["notes"] = "line one\nline two"
+    data["nodes"][3]["color"] = "red"  # Not #rrggbb, kept in the string table
+    data["nodes"][4]["width"] = 92.5
+    return data
+
+
+@pytest.mark.parametrize("n", [0, 1, 500])
+def test_binary_round_trip(tmp_path, n):
+    data = sample_map() if n == 500 else benchmarks.generate_map(n)
+    path = str(tmp_path / "map.mmb")
+    write_mindmap_file(data, path)
+    assert read_mindmap_file(path) == data
+
+
+def test_numbers_keep_their_type(tmp_path):
+    data = benchmarks.generate_map(50, seed=5)
+    for i, node in enumerate(data["nodes"]):
+        node["x"], node["y"] = (100.0, 7) if i % 2 else (float(i) + 0.25, -3.0)
+        node["width"], node["height"] = (100.0, 60) if i % 3 else (92.5, 50.0)
+    json_path, binary_path, back_path = (str(tmp_path / name) for name in ("a.json", "a.mmb", "b.json"))
+    write_mindmap_file(data, json_path)
+    convert_mindmap(json_path, binary_path)
+    convert_mindmap(binary_path, back_path)
+    with open(json_path) as f, open(back_path) as g:
+        assert g.read() == f.read()
+
+
+def test_columns_are_read_in_place(tmp_path):
+    data = sample_map()
+    path = str(tmp_path / "map.mmb")
+    write_mindmap_file(data, path)
+    with BinaryMindMap(path) as binary:
+        assert binary.node_count == len(data["nodes"])
+        assert binary.x[7] == data["nodes"][7]["x"]
+        assert binary.string(binary.text[0]) == data["nodes"][0]["text"]
+        assert binary.children(0) == data["nodes"][0]["children"]
+
+
+def test_convert_to_binary_and_back(tmp_path):
+    data = sample_map()
+    json_path, binary_path, back_path = (str(tmp_path / name) for name in ("a.json", "a.mmb", "b.json"))
+    with open(json_path, "w") as f:
+        json.dump(data, f)
+    convert_mindmap(json_path, binary_path)
+    convert_mindmap(binary_path, back_path)
+    with open(back_path) as f:
+        assert json.load(f) == data
+
+
+@pytest.mark.parametrize("content", [b"", b"MMB", b"{\"nodes\": []}" + b"\0" * 64])
+def test_other_files_are_refused(tmp_path, content):
+    path = tmp_path / "map.mmb"
+    path.write_bytes(content)
+    with pytest.raises(ValueError):
+        BinaryMindMap(str(path))
+
+
+def test_corrupt_section_tables_are_refused(tmp_path):
+    path = tmp_path / "map.mmb"
+    write_mindmap_file(sample_map(), str(path))
+    raw = path.read_bytes()
+    path.write_bytes(raw[:40])  # Header, then the section table cut short
+    with pytest.raises(ValueError, match="Not a binary mind map"):
+        BinaryMindMap(str(path))
+    path.write_bytes(raw[:len(raw) // 2])  # Sections run past the end
+    with pytest.raises(ValueError, match="Not a binary mind map"):
+        BinaryMindMap(str(path))
+    odd = bytearray(raw)
+    odd[32:40] = struct.pack("<Q", 3)  # x section, 3 bytes of float64s
+    path.write_bytes(bytes(odd))
+    with pytest.raises(ValueError, match="Not a binary mind map"):
+        BinaryMindMap(str(path))
+
+
+def test_newer_versions_are_refused(tmp_path):
+    path = tmp_path / "map.mmb"
+    write_mindmap_file(sample_map(), str(path))
+    raw = bytearray(path.read_bytes())
+    raw[4] += 1  # Version, right after the magic
+    path.write_bytes(bytes(raw))
+    with pytest.raises(ValueError, match="newer"):
+        BinaryMindMap(str(path))
+
@@ -0,0 +1,84 @@
+import math
+import random
+import warnings
+
+import pytest
+
+import mindmap_geometry
+from mindmap_geometry import edge_lines, edge_point
+
+
+def on_outline(x, y, cx, cy, a, b, ellipse):
+    sx, sy = abs(x - cx) / a, abs(y - cy) / b
+    return (math.hypot(sx, sy) if ellipse else max(sx, sy)) == pytest.approx(1.0)
+
+
+@pytest.mark.parametrize("ellipse", [True, False])
+def test_edge_point_is_on_the_outline_towards_the_target(ellipse):
+    rng = random.Random(1)
+    for _ in range(200):
+        cx, cy, a, b = rng.uniform(-500, 500), rng.uniform(-500, 500), rng.uniform(5, 80), rng.uniform(5, 80)
+        tx, ty = rng.uniform(-500, 500), rng.uniform(-500, 500)
+        x, y = edge_point(cx, cy, a, b, ellipse, tx, ty)
+        assert on_outline(x, y, cx, cy, a, b, ellipse)
+        # On the ray from the centre to the target
+        assert (x - cx) * (ty - cy) - (y - cy) * (tx - cx) == pytest.approx(0.0, abs=1e-6)
+        assert (x - cx) * (tx - cx) + (y - cy) * (ty - cy) > 0
+
+
+def test_edge_point_along_the_axes_and_corners():
+    assert edge_point(0, 0, 50, 30, True, 100, 0) == pytest.approx((50, 0))
+    assert edge_point(0, 0, 50, 30, True, 0, -100) == pytest.approx((0, -30))
+    assert edge_point(0, 0, 50, 30, False, 100, 60) == pytest.approx((50, 30))
+    assert edge_point(0, 0, 50, 30, False, 100, 10) == pytest.approx((50, 5))
+    assert edge_point(7, 8, 50, 30, True, 7, 8) == (7, 8)
+
+
+def random_nodes(rng, n):
+    return [(rng.uniform(-500, 500), rng.uniform(-500, 500), rng.uniform(5, 80), rng.uniform(5, 80),
+             rng.random() < 0.5) for _ in range(n)]
+
+
+@pytest.mark.parametrize("numpy", [True, False])
+def test_edge_lines_match_edge_point(monkeypatch, numpy):
+    if numpy:
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(mindmap_geometry, "np", None)
+    rng = random.Random(2)
+    nodes = random_nodes(rng, 50)
+    nodes.append(nodes[0])  # Same centre as node 0, the line shrinks to that point
+    pairs = [(rng.randrange(50), rng.randrange(50)) for _ in range(300)] + [(0, 50)]
+    lines = edge_lines(nodes, pairs)
+    assert len(lines) == len(pairs)
+    for (i, j), line in zip(pairs, lines):
+        x1, y1, a1, b1, ellipse1 = nodes[i]
+        x2, y2, a2, b2, ellipse2 = nodes[j]
+        expected = edge_point(x1, y1, a1, b1, ellipse1, x2, y2) + edge_point(x2, y2, a2, b2, ellipse2, x1, y1)
+        assert tuple(line) == pytest.approx(expected)
+
+
+@pytest.mark.parametrize("numpy", [True, False])
+def test_zero_size_nodes(monkeypatch, numpy):
+    if numpy:
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(mindmap_geometry, "np", None)
+    assert edge_point(0, 0, 0, 30, True, 100, 0) == pytest.approx((0, 0), abs=1e-6)
+    assert edge_point(0, 0, 50, 0, False, 100, 10) == pytest.approx((0, 0), abs=1e-6)
+    assert edge_point(0, 0, 50, 0, False, 100, 0) == pytest.approx((50, 0))
+    nodes = [(0, 0, 0, 0, True), (100, 0, 50, 0, False), (100, 50, 0, 25, True)]
+    pairs = [(0, 1), (1, 2), (2, 0)]
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        lines = edge_lines(nodes, pairs)
+    for (i, j), line in zip(pairs, lines):
+        x1, y1, a1, b1, ellipse1 = nodes[i]
+        x2, y2, a2, b2, ellipse2 = nodes[j]
+        expected = edge_point(x1, y1, a1, b1, ellipse1, x2, y2) + edge_point(x2, y2, a2, b2, ellipse2, x1, y1)
+        assert tuple(line) == pytest.approx(expected, abs=1e-6)
+    assert lines[0] == pytest.approx([0, 0, 50, 0], abs=1e-6)
+
+
+def test_edge_lines_without_lines():
+    assert list(edge_lines([(0, 0, 10, 10, True)], [])) == []
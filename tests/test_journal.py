@@ -0,0 +1,106 @@
+import os
+
+import pytest
+
+from mindmap_journal import AutosaveState, AutosaveWriter, autosave_paths, has_autosave, read_autosave
+
+
+def node(node_id, text, children=(), links=()):
+    return {"id": node_id, "x": float(node_id), "y": 0.0, "text": text, "color": "#ffff00",
+            "node_type": "ellipse", "width": 90, "height": 50, "level": 1, "notes": "",
+            "collapsed": False, "children": list(children), "links": list(links)}
+
+
+def sample_map():
+    data = {"nodes": [], "connections": [[1, 2]], "root_node_index": 0}
+    for i, (text, children) in enumerate([("root", [1, 2]), ("a", []), ("b", [])]):
+        fields = node(i, text)
+        fields["children"] = children
+        data["nodes"].append(fields)
+    return data
+
+
+def batches():
+    """Add a node under a, link it to the root, rename b and then remove it"""
+    return [
+        {"set": [node(11, "a", children=[20]), node(20, "c", links=[10])]},
+        {"set": [node(10, "root", children=[11, 12], links=[20]), node(20, "c", links=[10])]},
+        {"set": [node(12, "renamed")]},
+        {"set": [node(10, "root", children=[11], links=[20])], "remove": [12]},
+    ]
+
+
+def expected_map():
+    state = AutosaveState.from_data(sample_map(), [10, 11, 12])
+    for batch in batches():
+        state.apply(batch)
+    return state.to_data()
+
+
+@pytest.mark.parametrize("min_journal_size", [1 << 20, 1])  # Journal only, compacted every batch
+def test_writer_round_trip(tmp_path, min_journal_size):
+    path = str(tmp_path / "map.json")
+    writer = AutosaveWriter(path, sample_map(), [10, 11, 12], saved=False, min_journal_size=min_journal_size)
+    for batch in batches():
+        writer.append(batch)
+    writer.close()
+    assert writer.error is None
+    data = read_autosave(path)
+    assert data == expected_map()
+    assert [node["text"] for node in data["nodes"]] == ["root", "a", "c"]
+    assert data["nodes"][0]["children"] == [1]
+    assert data["nodes"][1]["children"] == [2]
+    assert data["connections"] == [[0, 2]]
+
+
+def test_torn_last_batch_is_ignored(tmp_path):
+    path = str(tmp_path / "map.json")
+    writer = AutosaveWriter(path, sample_map(), [10, 11, 12], saved=False)
+    writer.append(batches()[0])
+    writer.close()
+    before = read_autosave(path)
+    with open(autosave_paths(path)[1], "a") as journal:
+        journal.write('{"set": [{"id": 30')  # Crashed mid-write
+    assert read_autosave(path) == before
+
+
+def test_journal_of_an_older_snapshot_is_ignored(tmp_path):
+    path = str(tmp_path / "map.json")
+    writer = AutosaveWriter(path, sample_map(), [10, 11, 12], saved=False)
+    writer.append(batches()[0])
+    writer.close()
+    snapshot_path, journal_path = autosave_paths(path)
+    with open(journal_path) as f:
+        old_journal = f.read()
+    writer = AutosaveWriter(path, sample_map(), [10, 11, 12], saved=False)
+    writer.close()
+    with open(journal_path, "w") as f:
+        f.write(old_journal)
+    assert read_autosave(path) == AutosaveState.from_data(sample_map(), [10, 11, 12]).to_data()
+
+
+def test_saving_removes_the_autosave(tmp_path):
+    path = str(tmp_path / "map.json")
+    writer = AutosaveWriter(path, sample_map(), [10, 11, 12], saved=False)
+    writer.append(batches()[0])
+    writer.reset(sample_map(), [10, 11, 12], saved=True)
+    writer.close()
+    assert not has_autosave(path)
+    assert not any(os.path.exists(p) for p in autosave_paths(path))
+    assert read_autosave(path) is None
+
+
+def test_a_broken_batch_does_not_stop_the_writer(tmp_path):
+    path = str(tmp_path / "map.json")
+    writer = AutosaveWriter(path, sample_map(), [10, 11, 12], saved=False)
+    good = batches()
+    writer.append(good[0])
+    writer.append({"set": [{"text": "no id"}]})
+    unwritable = node(30, "unwritable")
+    unwritable["notes"] = {"not", "JSON"}
+    writer.append({"set": [unwritable]})
+    for batch in good[1:]:
+        writer.append(batch)
+    writer.close()
+    assert isinstance(writer.error, (KeyError, TypeError))
+    assert read_autosave(path) == expected_map()
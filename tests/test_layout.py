@@ -0,0 +1,157 @@
+import math
+import random
+
+import pytest
+
+from mindmap_layout import LAYOUT_MODES, TidyLayout, _split_branches, tidy_layout
+
+
+def random_tree(rng, n):
+    children = [[] for _ in range(n)]
+    for v in range(1, n):
+        children[rng.randrange(v)].append(v)
+    return children
+
+
+def reached(children, root=0):
+    order = [root]
+    for v in order:
+        order.extend(children[v])
+    return order
+
+
+def random_sizes(rng, n):
+    return [rng.choice((40.0, 60.0, 120.0)) for _ in range(n)], [rng.choice((20.0, 30.0)) for _ in range(n)]
+
+
+def edit(rng, children, widths, heights):
+    """Delete or add a random node, returns the node whose children changed"""
+    nodes = reached(children)
+    if len(nodes) > 2 and rng.random() < 0.5:
+        v = rng.choice(nodes[1:])
+        parent = next(u for u in nodes if v in children[u])
+        children[parent].remove(v)
+        return parent
+    parent = rng.choice(nodes)
+    children.append([])
+    widths.append(rng.choice((40.0, 60.0, 120.0)))
+    heights.append(rng.choice((20.0, 30.0)))
+    children[parent].insert(rng.randint(0, len(children[parent])), len(children) - 1)
+    return parent
+
+
+@pytest.mark.parametrize("mode", ["right", "balanced"])
+@pytest.mark.parametrize("seed", range(5))
+def test_nodes_do_not_overlap(mode, seed):
+    rng = random.Random(seed)
+    n = 150
+    children = random_tree(rng, n)
+    widths, heights = random_sizes(rng, n)
+    xs, ys = tidy_layout(children, widths, heights, 0, mode)
+    assert (xs[0], ys[0]) == (0, 0)
+    for u in range(n):
+        for v in range(u):
+            assert (abs(xs[u] - xs[v]) >= (widths[u] + widths[v]) / 2
+                    or abs(ys[u] - ys[v]) >= (heights[u] + heights[v]) / 2), (u, v)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_parents_are_centred_beside_their_children(seed):
+    rng = random.Random(seed)
+    children = random_tree(rng, 150)
+    widths, heights = random_sizes(rng, 150)
+    xs, ys = tidy_layout(children, widths, heights, 0, "right")
+    for v, kids in enumerate(children):
+        if kids:
+            assert ys[v] == pytest.approx((ys[kids[0]] + ys[kids[-1]]) / 2)
+            assert all(xs[child] > xs[v] for child in kids)
+
+
+def test_radial_levels_are_rings():
+    rng = random.Random(7)
+    children = random_tree(rng, 150)
+    widths, heights = random_sizes(rng, 150)
+    xs, ys = tidy_layout(children, widths, heights, 0, "radial")
+    radius = {}
+    level = {0: 0}
+    for v in reached(children):
+        for child in children[v]:
+            level[child] = level[v] + 1
+        radius.setdefault(level[v], []).append(math.hypot(xs[v], ys[v]))
+    for d in range(1, len(radius)):
+        assert max(radius[d]) == pytest.approx(min(radius[d]))
+        assert min(radius[d]) > max(radius[d - 1])
+
+
+@pytest.mark.parametrize("mode", LAYOUT_MODES)
+def test_only_nodes_below_the_root_are_placed(mode):
+    children = [[2], [3], [], []]  # Node 1 and its child are not below the root
+    xs, ys = tidy_layout(children, [40.0] * 4, [20.0] * 4, 0, mode)
+    assert xs[1] is None and ys[3] is None
+    assert xs[2] is not None and ys[2] is not None
+
+
+def test_unknown_modes_are_refused():
+    with pytest.raises(ValueError):
+        tidy_layout([[]], [40.0], [20.0], 0, "spiral")
+
+
+@pytest.mark.parametrize("mode", LAYOUT_MODES)
+@pytest.mark.parametrize("seed", range(10))
+def test_update_matches_full_layout(mode, seed):
+    rng = random.Random(seed)
+    n = 150
+    children = random_tree(rng, n)
+    widths = [rng.choice((40.0, 60.0, 120.0)) for _ in range(n)]
+    heights = [rng.choice((20.0, 30.0)) for _ in range(n)]
+    tidy = TidyLayout(mode)
+    xs, ys = tidy.run(children, widths, heights)
+    positions = {v: (xs[v], ys[v]) for v in reached(children)}
+    for _ in range(40):
+        dirty = [edit(rng, children, widths, heights) for _ in range(rng.randint(1, 3))]
+        result = tidy.update(dirty, children.__getitem__, widths, heights)
+        if result is None:
+            xs, ys = tidy.run(children, widths, heights)
+            positions = {v: (xs[v], ys[v]) for v in reached(children)}
+            continue
+        moved, shifts = result
+        positions.update(moved)
+        for branch, (dx, dy) in shifts.items():
+            for v in reached(children, branch):
+                x, y = positions[v]
+                positions[v] = (x + dx, y + dy)
+
+        if mode == "balanced" and _split_branches(children, 0)[0] != tidy.sides[0][0].children[0]:
+            # Edits keep the root's branches on their side, a full run may split them anew
+            continue
+        xs, ys = TidyLayout(mode).run(children, widths, heights)
+        for v in reached(children):
+            assert positions[v] == pytest.approx((xs[v], ys[v])), v
+
+
+def test_update_falls_back_when_the_deepest_node_of_a_level_goes():
+    # Node 1 is the only wide node on level 1, without it level 2 moves closer to the root
+    children = [[1, 2, 5], [3], [4], [], [], []]
+    widths = [40.0, 200.0, 40.0, 40.0, 40.0, 40.0]
+    heights = [20.0] * 6
+    tidy = TidyLayout("right")
+    tidy.run(children, widths, heights)
+    children[0] = [1, 2]
+    assert tidy.update([0], children.__getitem__, widths, heights) is not None
+    children[0] = [2]
+    assert tidy.update([0], children.__getitem__, widths, heights) is None
+
+
+def test_update_follows_edits_below_removed_branches():
+    children = [[1, 2], [3], [], []]
+    widths, heights = [40.0] * 4, [20.0] * 4
+    tidy = TidyLayout("right")
+    tidy.run(children, widths, heights)
+    # A child added to node 3 while its branch is taken out in the same batch
+    children.append([])
+    widths.append(40.0)
+    heights.append(20.0)
+    children[3] = [4]
+    children[0] = [2]
+    result = tidy.update([3, 0], children.__getitem__, widths, heights)
+    assert result is None or not set(result[0]) & {1, 3, 4}
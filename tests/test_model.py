@@ -0,0 +1,136 @@
+import random
+
+import pytest
+
+import benchmarks
+from mindmap_model import ExtentGrid, MindMap, SpatialGrid, records_from_data, records_to_data
+
+
+def overlaps(box, x, y, width, height):
+    return box[0] <= x + width and box[0] + box[2] >= x and box[1] <= y + height and box[1] + box[3] >= y
+
+
+def test_grid_queries_match_a_scan():
+    rng = random.Random(5)
+    grid = SpatialGrid(cell_size=100.0)
+    boxes = {}
+    for step in range(3000):
+        key = rng.randrange(300)
+        if key in boxes and rng.random() < 0.3:
+            grid.remove(key)
+            del boxes[key]
+        else:
+            box = (rng.uniform(-1000, 1000), rng.uniform(-1000, 1000), rng.uniform(1, 250), rng.uniform(1, 250))
+            if key in boxes and rng.random() < 0.5:
+                grid.move(key, *box)
+            else:
+                grid.insert(key, *box)
+            boxes[key] = box
+        if step % 50 == 0:
+            area = (rng.uniform(-1200, 1000), rng.uniform(-1200, 1000), rng.uniform(0, 3000), rng.uniform(0, 3000))
+            assert grid.query(*area) == {key for key, box in boxes.items() if overlaps(box, *area)}
+    assert len(grid) == len(boxes)
+    for key in list(boxes):
+        grid.remove(key)
+    assert not grid.cells
+
+
+def box_distance(box, x, y):
+    dx = max(box[0] - x, 0.0, x - box[0] - box[2])
+    dy = max(box[1] - y, 0.0, y - box[1] - box[3])
+    return (dx * dx + dy * dy) ** 0.5
+
+
+def test_nearest_matches_a_scan():
+    rng = random.Random(10)
+    grid = SpatialGrid(cell_size=100.0)
+    boxes = {}
+    for key in range(400):
+        boxes[key] = (rng.uniform(-3000, 3000), rng.uniform(-3000, 3000), rng.uniform(1, 150), rng.uniform(1, 150))
+        grid.insert(key, *boxes[key])
+    for _ in range(200):
+        x, y = rng.uniform(-4000, 4000), rng.uniform(-4000, 4000)
+        key = grid.nearest(x, y)
+        assert box_distance(boxes[key], x, y) == min(box_distance(box, x, y) for box in boxes.values())
+        even = grid.nearest(x, y, accept=lambda key: key % 2 == 0)
+        assert even % 2 == 0
+        assert box_distance(boxes[even], x, y) == min(box_distance(box, x, y) for key, box in boxes.items()
+                                                      if key % 2 == 0)
+        near = grid.nearest(x, y, max_distance=50.0)
+        assert near is None or box_distance(boxes[near], x, y) <= 50.0
+        assert (near is None) == all(box_distance(box, x, y) > 50.0 for box in boxes.values())
+    assert SpatialGrid().nearest(0.0, 0.0) is None
+
+
+def test_records_round_trip():
+    data = benchmarks.generate_map(400, seed=6)
+    data["nodes"][1]["collapsed"] = True
+    data["connections"] = sorted({tuple(pair) for pair in data["connections"]})
+    records, root = records_from_data(data)
+    assert root is records[0]
+    below = {id(record) for record in records[1].descendants()}
+    assert below and all(record.hidden == (id(record) in below) for record in records)
+    saved = records_to_data(records, root)
+    saved["connections"] = sorted(tuple(pair) for pair in saved["connections"])
+    assert saved == data
+
+
+def test_map_arrange_moves_hidden_branches_along():
+    data = benchmarks.generate_map(200, seed=4)
+    data["nodes"][0]["children"] = data["nodes"][0]["children"][:3]  # Leaves the rest unreached
+    collapsed = data["nodes"][0]["children"][0]
+    data["nodes"][collapsed]["collapsed"] = True
+    mindmap = MindMap.from_data(data)
+    record = list(mindmap.records.values())[collapsed]
+    offsets = [delta for below in record.descendants() for delta in (below.x - record.x, below.y - record.y)]
+    root_position = (mindmap.root.x, mindmap.root.y)
+    assert mindmap.arrange("balanced") > 0
+    assert (mindmap.root.x, mindmap.root.y) == root_position
+    assert offsets == pytest.approx([delta for below in record.descendants()
+                                     for delta in (below.x - record.x, below.y - record.y)])
+
+
+def test_map_edits():
+    mindmap = MindMap()
+    root = mindmap.add_node(text="Root")
+    child = mindmap.add_node(200, 0, "Child", parent=root)
+    leaf = mindmap.add_node(400, 0, "Leaf", parent=child)
+    other = mindmap.add_node(200, 200, "Other", parent=root)
+    mindmap.link(leaf, other)
+    mindmap.set_collapsed(child, True)
+    assert mindmap.root is root and leaf.level == 2 and leaf.hidden
+    assert mindmap.shown() == [root, child, other]
+    snapshot = mindmap.branch_snapshot(child)
+    mindmap.remove_branch(child)
+    assert list(mindmap.records.values()) == [root, other] and not other.links
+    assert mindmap.to_data()["nodes"][0]["children"] == [1]
+    mindmap.restore_branch(snapshot)
+    assert root.children == [child, other] and other.links == [leaf] and leaf.hidden
+    assert mindmap.records[leaf.node_id] is leaf and len(mindmap) == 4
+
+
+def test_extent_follows_the_boxes():
+    rng = random.Random(12)
+    grid = ExtentGrid(cell_size=100.0)
+    boxes = {}
+    for step in range(3000):
+        key = rng.randrange(50)
+        if key in boxes and rng.random() < 0.4:
+            grid.remove(key)
+            del boxes[key]
+        else:
+            box = (rng.uniform(-3e6, 3e6), rng.uniform(-3e6, 3e6), rng.uniform(1, 250), rng.uniform(1, 250))
+            if key in boxes:
+                grid.move(key, *box)
+            else:
+                grid.insert(key, *box)
+            boxes[key] = box
+        extent = grid.extent()
+        if not boxes:
+            assert extent is None
+            continue
+        x, y, width, height = extent
+        assert x <= min(box[0] for box in boxes.values()) < x + 100.0
+        assert y <= min(box[1] for box in boxes.values()) < y + 100.0
+        assert x + width - 100.0 <= max(box[0] + box[2] for box in boxes.values()) < x + width
+        assert y + height - 100.0 <= max(box[1] + box[3] for box in boxes.values()) < y + height
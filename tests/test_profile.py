@@ -0,0 +1,66 @@
+import json
+
+from mindmap_profile import Profiler
+
+
+class Base:
+    def size(self):
+        return 1
+
+
+class Shape(Base):
+    def area(self, scale=1):
+        return self.size() * scale
+
+
+def test_methods_are_wrapped_only_while_enabled(tmp_path):
+    area, profiler = Shape.area, Profiler()
+    profiler.instrument(Shape, "area")
+    profiler.instrument(Shape, "size", "size")  # Inherited from Base
+    assert Shape.area is area and "size" not in Shape.__dict__
+
+    profiler.enable(tracing=True)
+    shape = Shape()
+    assert [shape.area(scale=k) for k in range(3)] == [0, 1, 2]
+    assert {row[0]: row[1] for row in profiler.summary()} == {"Shape.area": 3, "size": 3}
+    calls, total, mean, longest = profiler.summary()[0][1:]
+    assert total >= longest >= mean > 0 and profiler.summary()[0][0] == "Shape.area"  # Includes size
+
+    profiler.disable()
+    assert Shape.area is area and "size" not in Shape.__dict__ and Shape().size() == 1
+    shape.area()
+    assert profiler.stats["Shape.area"][0] == 3
+
+    profiler.write_trace(str(tmp_path / "trace.json"))
+    with open(str(tmp_path / "trace.json")) as f:
+        events = json.load(f)["traceEvents"]
+    assert [event["name"] for event in events] == ["size", "Shape.area"] * 3
+    for event in events:
+        assert event["ph"] == "X" and event["dur"] >= 0 and event["ts"] >= 0
+    # Nested calls lie inside their callers
+    size, outer = events[:2]
+    assert outer["ts"] <= size["ts"] and size["ts"] + size["dur"] <= outer["ts"] + outer["dur"]
+
+    profiler.reset()
+    assert profiler.summary() == [] and profiler.trace()["traceEvents"] == []
+
+
+class SmallProfiler(Profiler):
+    max_events = 5
+
+
+def test_frames_and_bounded_trace():
+    profiler = SmallProfiler()
+    profiler.instrument(Shape, "area", "frame", frames=True)
+    profiler.enable()
+    for _ in range(8):
+        Shape().area()
+    assert len(profiler.events) == 0 and len(profiler.frames) == 8  # Not tracing
+    rate, mean, longest = profiler.frame_stats()
+    assert rate > 0 and longest >= mean > 0
+    profiler.disable()
+    profiler.enable(tracing=True)
+    for _ in range(8):
+        Shape().area()
+    profiler.disable()
+    assert len(profiler.events) == 5
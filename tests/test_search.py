@@ -0,0 +1,59 @@
+import random
+
+from mindmap_search import SearchIndex, within_one_edit, words
+
+
+def scan(texts, query):
+    """Keys whose words each start with a word of query, by brute force"""
+    terms = words(query)
+    return {key for key, (text, notes) in texts.items()
+            if all(any(word.startswith(term) for word in words(text) | words(notes)) for term in terms)}
+
+
+def test_queries_match_a_scan_through_edits():
+    rng = random.Random(3)
+    vocabulary = ["idea", "ideas", "plan", "planet", "budget", "review", "road", "roadmap", "x%d" % 7]
+    index = SearchIndex()
+    texts = {}
+    for step in range(2000):
+        key = rng.randrange(200)
+        if key in texts and rng.random() < 0.2:
+            index.remove(key)
+            del texts[key]
+        else:
+            text = " ".join(rng.sample(vocabulary, rng.randint(0, 3)))
+            notes = " ".join(rng.sample(vocabulary, rng.randint(0, 2)))
+            index.add(key, text, notes)
+            texts[key] = (text, notes)
+        if step % 40 == 0:
+            query = " ".join(word[:rng.randint(1, len(word))] for word in rng.sample(vocabulary, rng.randint(1, 2)))
+            assert set(index.search(query)) == scan(texts, query)
+    assert index.entry(key) == texts.get(key)
+    for key in list(texts):
+        index.remove(key)
+    assert not index.postings and not index.vocabulary
+
+
+def test_ranking_and_fuzzy_matches():
+    index = SearchIndex()
+    index.add(1, "Roadmaps", "")
+    index.add(2, "Budget", "roadmap for next year")
+    index.add(3, "Roadmap")
+    index.add(4, "Raodmap review")
+    assert index.search("roadmap") == [3, 1, 2]
+    assert index.search("roadmap", fuzzy=True) == [3, 1, 4, 2]
+    assert index.search("roadmap", limit=1) == [3]
+    assert index.search("roadmap review", fuzzy=True) == [4]
+    assert index.search("   ") == []
+    index.add(4, "Roadmap review")
+    assert index.search("raodmap", fuzzy=True) == [3, 4, 2]  # "roadmaps" is two edits away
+
+
+def test_one_edit():
+    assert within_one_edit("plan", "plan")
+    assert within_one_edit("plan", "plane")
+    assert within_one_edit("plan", "pan")
+    assert within_one_edit("plan", "plen")
+    assert within_one_edit("plan", "lpan")
+    assert not within_one_edit("plan", "lpna")
+    assert not within_one_edit("plan", "planet")
@@ -0,0 +1,18 @@
+def test_styles_are_interned_per_fill(app):
+    from PyQt5.QtCore import Qt
+    from PyQt5.QtGui import QColor
+    from mindmap_style import CLASSIC, NIGHT
+    style = CLASSIC.style("#FFFF00")
+    assert style is CLASSIC.style("#ffff00") is CLASSIC.style(QColor(255, 255, 0)) is CLASSIC.style(Qt.yellow)
+    assert style.fill == "#ffff00" and style.theme is CLASSIC
+    other = CLASSIC.style("#123456")
+    assert other.pen is style.pen and other.font is style.font and other.highlight is style.highlight
+    assert NIGHT.style("#ffff00") is not style and NIGHT.style("#ffff00").pen is not style.pen
+
+
+def test_level_fills_are_deterministic(app):
+    from mindmap_style import CLASSIC
+    fills = [CLASSIC.fill_for(level) for level in range(17)]
+    assert fills[:5] == ["#00ff00", "#ffff00", "#ffc864", "#64c8ff", "#c896ff"]
+    assert fills[5:11] == fills[11:17] == CLASSIC.deep_fills
+    assert CLASSIC.level_style(7) is CLASSIC.style(fills[7])
@@ -0,0 +1,807 @@
+import json
+import random
+import time
+
+import pytest
+
+from mindmap_journal import read_autosave
+
+
+@pytest.fixture
+def view(app):
+    view = app.MindMapView()
+    view.resize(800, 600)
+    yield view
+    from PyQt5 import sip
+    view.disable_autosave()
+    view.close()
+    sip.delete(view)  # Now, not whenever the garbage collector gets to it
+
+
+def live_nodes(view):
+    return [node for node in view.nodes.values() if node.scene() is view.scene]
+
+
+def state(view):
+    """Everything an edit can change, by node id"""
+    nodes = []
+    for node in live_nodes(view):
+        nodes.append((node.node_id, round(node.x(), 6), round(node.y(), 6), node.text_item.toPlainText(),
+                      node.style.fill, node.node_type, node.collapsed, node.isVisible(), node.notes,
+                      tuple(child.node_id for child in node.children),
+                      tuple(sorted(other.node_id for other in node.connections.values())),
+                      node.parent_connection[1].node_id if node.parent_connection else None))
+    return sorted(nodes), view.root_node.node_id if view.root_node else None
+
+
+def canonical(data):
+    """The tree below a mind map's root as nested node fields, with the connections inside it.
+
+    Independent of node order and ids, and of nodes left outside the tree.
+    """
+    nodes = data["nodes"]
+    reached = set()
+
+    def subtree(i):
+        reached.add(i)
+        node = nodes[i]
+        return (node["text"], round(node["x"], 6), round(node["y"], 6), node["color"], node["node_type"],
+                node["notes"], node["collapsed"], tuple(subtree(child) for child in node["children"]))
+
+    tree = subtree(data["root_node_index"]) if data["root_node_index"] >= 0 else None
+    links = {frozenset((nodes[i]["text"], nodes[j]["text"])) for i, j in data["connections"]
+             if i in reached and j in reached}
+    return tree, links
+
+
+def write_map(path, n, seed):
+    import benchmarks
+    data = benchmarks.generate_map(n, seed=seed)
+    data["nodes"][1]["collapsed"] = True
+    data["nodes"][2]["notes"] = "some notes"
+    data["connections"] = sorted({tuple(pair) for pair in data["connections"]})
+    with open(path, "w") as f:
+        json.dump(data, f)
+    return data
+
+
+def wait_for(app, loader):
+    results = []
+    loader.finished.connect(results.append)
+    deadline = time.monotonic() + 30
+    while not results and time.monotonic() < deadline:
+        app.qt_app.processEvents()
+    return results
+
+
+def test_save_and_load_round_trip(app, view, tmp_path):
+    src, out = str(tmp_path / "in.json"), str(tmp_path / "out.json")
+    data = write_map(src, 300, seed=1)
+    view.load_mindmap(src)
+    view.save_mindmap(out)
+    with open(out) as f:
+        saved = json.load(f)
+    # Nodes hidden under collapsed ones are saved as well
+    assert len(saved["nodes"]) == len(data["nodes"])
+    assert canonical(saved) == canonical(data)
+
+
+def test_async_load_builds_the_same_map(app, view, tmp_path):
+    path = str(tmp_path / "map.json")
+    write_map(path, 3000, seed=2)
+    assert wait_for(app, view.load_mindmap_async(path)) == [True]
+    loaded = view.mindmap_data()
+    view.load_mindmap(path)
+    assert canonical(loaded) == canonical(view.mindmap_data())
+
+
+def test_cancelled_async_load_leaves_no_map(app, view, tmp_path):
+    path = str(tmp_path / "map.json")
+    write_map(path, 3000, seed=3)
+    loader = view.load_mindmap_async(path)
+    loader.progress.connect(lambda built, total: loader.cancel())
+    assert wait_for(app, loader) == [False]
+    assert view.loader is None
+    assert view.mindmap_data()["nodes"] == []
+
+
+def test_async_load_of_a_broken_file_fails(app, view, tmp_path):
+    path = str(tmp_path / "map.json")
+    data = write_map(path, 50, seed=3)
+    data["nodes"][0]["children"].append(99)  # No such node
+    with open(path, "w") as f:
+        json.dump(data, f)
+    loader = view.load_mindmap_async(path)
+    assert wait_for(app, loader) == [False]
+    assert loader.error and view.mindmap_data()["nodes"] == []
+
+
+def test_virtualized_mode_builds_only_nearby_nodes(app, view, tmp_path):
+    path = str(tmp_path / "map.json")
+    write_map(path, 5000, seed=4)
+    view.load_mindmap(path)
+    data = canonical(view.mindmap_data())
+    view.set_virtualized(True)
+    view.show()
+    app.qt_app.processEvents()
+    items = [item for item in view.scene.items() if isinstance(item, app.MindMapNode)]
+    assert len(items) <= view.virtualizer.max_live_items
+    assert canonical(view.mindmap_data()) == data
+    view.set_virtualized(False)
+    assert len(view.mindmap_data()["nodes"]) == 5000
+    assert canonical(view.mindmap_data()) == data
+
+
+def test_collapsing_folds_the_branch_into_records(app, view, tmp_path):
+    path = str(tmp_path / "map.json")
+    write_map(path, 2000, seed=5)
+    view.load_mindmap(path)
+    data = canonical(view.mindmap_data())
+    node = max(view.root_node.children, key=lambda child: len(child.children))
+    shown = len(view.nodes)
+    node.toggle_collapse()
+    assert node.record.children and all(child.hidden and child.item is None for child in node.record.children)
+    assert not node.children
+    assert len(view.nodes) < shown
+    assert canonical(view.mindmap_data())[1] == data[1]  # Connections into the branch are kept
+    node.toggle_collapse()
+    assert len(view.nodes) == shown
+    assert canonical(view.mindmap_data()) == data
+
+
+def test_level_of_detail_thresholds_are_per_view(app, view):
+    from PyQt5 import sip
+    other = app.MindMapView()
+    try:
+        view.set_lod_thresholds(text=0.9, edges=0.1)
+        assert other.lod_thresholds == app.DEFAULT_LOD_THRESHOLDS
+        assert app.lod_thresholds(view.scene, view.viewport())["text"] == 0.9
+        assert app.lod_thresholds(other.scene, other.viewport())["text"] == app.DEFAULT_LOD_THRESHOLDS["text"]
+        with pytest.raises(ValueError):
+            view.set_lod_thresholds(texts=0.5)
+    finally:
+        other.close()
+        sip.delete(other)
+
+
+def test_render_caching_is_per_view(app, view):
+    from PyQt5 import sip
+    from PyQt5.QtWidgets import QGraphicsItem
+    other = app.MindMapView()
+    try:
+        view.add_node()
+        other.add_node()
+        view.set_render_caching(True)
+        child = view.add_child_node(view.root_node, "later")
+        cached = QGraphicsItem.DeviceCoordinateCache
+        assert view.root_node.cacheMode() == child.cacheMode() == child.text_item.cacheMode() == cached
+        assert other.root_node.cacheMode() == other.add_child_node(other.root_node).cacheMode() == QGraphicsItem.NoCache
+        view.set_render_caching(False)
+        assert child.cacheMode() == child.text_item.cacheMode() == QGraphicsItem.NoCache
+    finally:
+        other.close()
+        sip.delete(other)
+
+
+def test_force_layout_stops_without_waiting(app, tmp_path):
+    pytest.importorskip("numpy")
+    from PyQt5 import sip
+    path = str(tmp_path / "map.json")
+    write_map(path, 20000, seed=5)
+    view = app.MindMapView()
+    view.load_mindmap(path)
+    view.start_force_layout()
+    deadline = time.monotonic() + 30
+    while not view.force_thread.isRunning() and time.monotonic() < deadline:
+        app.qt_app.processEvents()
+    thread = view.force_thread
+    start = time.perf_counter()
+    view.stop_force_layout()
+    assert time.perf_counter() - start < 0.05
+    assert view.force_thread is None and thread.parent() is app.qt_app
+    # The view may go while the thread is still in its last step
+    view.close()
+    sip.delete(view)
+    assert thread.wait(30000)
+    app.qt_app.processEvents()
+
+
+def test_view_can_close_while_parsing(app, tmp_path):
+    from PyQt5 import sip
+    path = str(tmp_path / "map.json")
+    write_map(path, 50000, seed=6)
+    view = app.MindMapView()
+    thread = view.load_mindmap_async(path).thread
+    deadline = time.monotonic() + 30
+    while not thread.isRunning() and time.monotonic() < deadline:
+        app.qt_app.processEvents()
+    view.close()
+    sip.delete(view)  # Takes the loader with it
+    assert thread.isRunning() and thread.parent() is app.qt_app
+    assert thread.isInterruptionRequested()
+    assert thread.wait(30000)
+    app.qt_app.processEvents()  # Its late signals find no loader
+
+
+def test_nodes_outside_a_view_fold(app):
+    node = app.MindMapNode(0, 0)
+    node.toggle_collapse()
+    assert node.collapsed
+
+
+@pytest.mark.parametrize("threads", [0, 2])
+def test_tiled_png_export_matches_one_piece(app, view, tmp_path, threads):
+    from PyQt5.QtGui import QImage
+    path = str(tmp_path / "map.json")
+    write_map(path, 200, seed=6)
+    view.load_mindmap(path)
+    whole, tiled = str(tmp_path / "whole.png"), str(tmp_path / "tiled.png")
+    view.export_to_image(whole, scale=0.05, tile_size=4096)
+    view.export_to_image(tiled, scale=0.05, tile_size=64, threads=threads)
+    a, b = (QImage(path).convertToFormat(QImage.Format_RGB888) for path in (whole, tiled))
+    assert a.size() == b.size() and a.width() > 64 and a.height() > 64
+    # Antialiased edges cut by a tile border may come out a shade apart
+    pixels_a, pixels_b = a.constBits().asstring(a.byteCount()), b.constBits().asstring(b.byteCount())
+    assert sum(abs(x - y) for x, y in zip(pixels_a, pixels_b)) < len(pixels_a)
+
+
+def test_hit_tests_follow_moved_nodes(app, view, tmp_path):
+    from PyQt5.QtCore import QPointF, QRectF
+    path = str(tmp_path / "map.json")
+    write_map(path, 500, seed=7)
+    view.load_mindmap(path)
+    visible = [node for node in view.nodes.values() if node.isVisible()]
+    for node in visible[::7]:
+        node.setPos(node.pos() + QPointF(321.0, -123.0))
+    rect = QRectF(-2000, -1500, 3000, 2500)
+    expected = {node for node in visible if node.sceneBoundingRect().intersects(rect)}
+    assert set(view.nodes_in_rect(rect)) == expected
+    for node in visible[::7]:
+        center = node.sceneBoundingRect().center()
+        hit = view.node_at(center)
+        assert hit is not None and hit.sceneBoundingRect().contains(center)
+        assert view.nearest_node(center).sceneBoundingRect().contains(center)
+    assert view.node_at(QPointF(1e6, 1e6)) is None
+
+
+def test_dragging_a_parent_moves_its_branch_in_one_step(app, view):
+    from PyQt5.QtCore import QEvent, QPointF, Qt
+    from PyQt5.QtGui import QMouseEvent
+    from mindmap_geometry import edge_point
+    view.show()
+    view.add_node()
+    parent = view.add_child_node(view.root_node, "parent")
+    parent.setPos(300, 0)
+    children = [view.add_child_node(parent, "child %d" % i) for i in range(3)]
+    for i, child in enumerate(children):
+        child.setPos(500, -150 + 150 * i)
+    grandchild = view.add_child_node(children[0], "grandchild")
+    grandchild.setPos(700, -200)
+    outside = view.add_child_node(view.root_node, "outside")
+    outside.setPos(-300, 200)
+    view.link_nodes(grandchild, outside)
+    app.qt_app.processEvents()
+    view.flush_line_updates()
+    branch = [parent] + children + [grandchild]
+    before = {node: node.pos() for node in branch}
+    count = view.history.count()
+
+    def send(kind, scene_pos, button, buttons):
+        pos = view.mapFromScene(scene_pos)
+        screen_pos = QPointF(view.viewport().mapToGlobal(pos))  # Where the scene looks for items
+        app.qt_app.sendEvent(view.viewport(), QMouseEvent(kind, QPointF(pos), screen_pos, button, buttons,
+                                                          Qt.NoModifier))
+
+    view.centerOn(parent)
+    # Between the outline and the text, pressing on the text would edit it
+    rect, text = parent.sceneBoundingRect(), parent.text_item.sceneBoundingRect()
+    grab = QPointF(rect.center().x(), (rect.top() + text.top()) / 2)
+    assert view.items(view.mapFromScene(grab))[0] is parent
+    send(QEvent.MouseButtonPress, grab, Qt.LeftButton, Qt.LeftButton)
+    for step in range(1, 11):
+        send(QEvent.MouseMove, grab + QPointF(8 * step, 5 * step), Qt.NoButton, Qt.LeftButton)
+        app.qt_app.processEvents()
+    send(QEvent.MouseButtonRelease, grab + QPointF(80, 50), Qt.LeftButton, Qt.NoButton)
+    app.qt_app.processEvents()
+    view.flush_line_updates()
+
+    delta = parent.pos() - before[parent]
+    assert delta != QPointF(0, 0)
+    for node in branch:
+        assert node.pos() == before[node] + delta
+    lines = {id(line): (line, from_node, to_node)
+             for node in view.nodes.values() for line, from_node, to_node in node.connection_lines()}
+    assert len(lines) == 7
+    for line, from_node, to_node in lines.values():
+        x1, y1, a1, b1, ellipse1 = from_node.outline()
+        x2, y2, a2, b2, ellipse2 = to_node.outline()
+        expected = edge_point(x1, y1, a1, b1, ellipse1, x2, y2) + edge_point(x2, y2, a2, b2, ellipse2, x1, y1)
+        got = line.line()
+        got = (got.x1(), got.y1(), got.x2(), got.y2())
+        # Both ends list a link, each as its from_node
+        assert got == pytest.approx(expected) or got[2:] + got[:2] == pytest.approx(expected)
+    assert view.history.count() == count + 1
+    view.history.undo()
+    assert all(node.pos() == before[node] for node in branch)
+
+
+def line_ends(from_node, to_node):
+    """Where a line between two nodes should run, as (x1, y1, x2, y2)"""
+    from mindmap_geometry import edge_point
+    x1, y1, a1, b1, ellipse1 = from_node.outline()
+    x2, y2, a2, b2, ellipse2 = to_node.outline()
+    return edge_point(x1, y1, a1, b1, ellipse1, x2, y2) + edge_point(x2, y2, a2, b2, ellipse2, x1, y1)
+
+
+def runs_between(edge, from_node, to_node):
+    """Whether an EdgeLayer line runs between the outlines of two nodes, either way round"""
+    line = edge.line()
+    coords = line.x1(), line.y1(), line.x2(), line.y2()
+    return coords == pytest.approx(line_ends(from_node, to_node)) or \
+        coords == pytest.approx(line_ends(to_node, from_node))
+
+
+def test_edge_layer_follows_nodes_and_drops_removed_lines(app, view):
+    from PyQt5.QtCore import QPointF, QRectF
+    view.add_node()
+    a = view.add_child_node(view.root_node, "a")
+    a.setPos(400, 0)
+    b = view.add_child_node(view.root_node, "b")
+    b.setPos(0, 400)
+    link = view.link_nodes(a, b)
+    app.qt_app.processEvents()
+    view.flush_line_updates()
+    layer = view.edge_layer
+    to_a, to_b = a.parent_connection[0], b.parent_connection[0]
+    assert len(layer) == 3
+
+    def at(point):
+        """The solid and dashed lines the layer finds around a point, a superset of those crossing it"""
+        return layer.lines_in(QRectF(point - QPointF(1, 1), point + QPointF(1, 1)))
+
+    a.setPos(500, 250)
+    app.qt_app.processEvents()
+    view.flush_line_updates()
+    assert runs_between(to_a, view.root_node, a) and runs_between(link, a, b)
+    assert runs_between(to_b, view.root_node, b)  # Left alone
+
+    # Hit queries find each line where it now is, drawn in its own style
+    for edge in (to_a, to_b):
+        solid, dashed = at(edge.line().center())
+        assert edge.line() in solid and edge.line() not in dashed
+    middle = link.line().center()
+    solid, dashed = at(middle)
+    assert link.line() in dashed and link.line() not in solid
+    assert at(QPointF(-5000, -5000)) == ([], [])
+    # The layer itself is never hit, clicks go to the nodes or the background
+    assert layer.shape().isEmpty() and layer not in view.scene.items(middle)
+    assert view.node_at(middle) is None
+
+    index = link.index
+    view.unlink_nodes(a, b)
+    assert not link.alive() and len(layer) == 2
+    assert index in layer.free and index not in layer.grid and index not in layer.long_lines
+    assert at(middle)[1] == []
+    index = to_b.index
+    b.delete_node()
+    assert not to_b.alive() and len(layer) == 1 and index not in layer.grid
+    assert layer.lines_in(layer.boundingRect()) == ([to_a.line()], [])
+
+
+def test_edge_layer_catches_up_after_bulk_moves(app, view, tmp_path):
+    path = str(tmp_path / "map.json")
+    write_map(path, 2000, seed=8)
+    view.load_mindmap(path)
+    view.auto_arrange_nodes("radial")  # Moves far more lines than bulk_changes
+    app.qt_app.processEvents()
+    view.flush_line_updates()
+    layer = view.edge_layer
+    lines = {line: (from_node, to_node)
+             for node in live_nodes(view) for line, from_node, to_node in node.connection_lines()}
+    assert len(lines) == len(layer)
+    assert all(runs_between(line, *nodes) for line, nodes in lines.items())
+    solid, dashed = layer.lines_in(layer.boundingRect())
+    assert len(solid) + len(dashed) == sum(line.isVisible() for line in lines)
+
+
+def random_edits(app, view, rng, steps):
+    """Make random undoable edits, returns the state after each one, the first being before any"""
+    from PyQt5.QtCore import QPointF
+    from PyQt5.QtGui import QColor
+    states = [state(view)]
+    view.add_node()
+    states.append(state(view))
+    for step in range(steps):
+        nodes = live_nodes(view)
+        others = [node for node in nodes if node is not view.root_node]
+        operation = rng.choice(["add", "add", "add", "delete", "move", "color", "restyle", "text", "collapse",
+                                "link"])
+        count = view.history.count()
+        if operation == "add":
+            view.add_child_node(rng.choice(nodes), "n%d" % step)
+        elif operation == "delete" and others:
+            node = rng.choice(others)
+            snapshot = view.branch_snapshot(node)
+            node.delete_node(snapshot["index"])
+            view.record_edit(app.BranchCommand(view, node, "Delete Node", snapshot))
+        elif operation == "move":
+            node = rng.choice(nodes)
+            start = {node: node.pos()}
+            node.setPos(node.pos() + QPointF(rng.uniform(-50, 50), rng.uniform(-50, 50)))
+            view.record_edit(app.MoveCommand(view, start, {node: node.pos()}, carry_branches=True))
+        elif operation == "color":
+            node = rng.choice(nodes)
+            old, new = node.style.fill, QColor(rng.randrange(0xffffff))
+            node.set_color(new)
+            view.record_edit(app.PropertyCommand(view, node, "color", old, new))
+        elif operation == "restyle":
+            node = rng.choice(nodes)
+            fill = QColor(rng.randrange(0xffffff)) if rng.random() < 0.7 else None
+            if rng.random() < 0.5:
+                view.restyle_branch(node, fill)
+            else:
+                view.restyle_level(node.level, fill)
+        elif operation == "text":
+            node = rng.choice(nodes)
+            old = node.text_item.toPlainText()
+            node.text_item.setPlainText("t%d" % step)
+            view.record_edit(app.PropertyCommand(view, node, "text", old, "t%d" % step))
+        elif operation == "collapse":
+            parents = [node for node in nodes if node.children and node.isVisible()]
+            if parents:
+                node = rng.choice(parents)
+                node.toggle_collapse()
+                view.record_edit(app.CollapseCommand(view, node))
+        elif operation == "link" and len(nodes) > 1:
+            node1, node2 = rng.sample(nodes, 2)
+            if node2 not in node1.connections.values():
+                view.link_nodes(node1, node2)
+                view.record_edit(app.LinkCommand(view, node1, node2))
+        app.qt_app.processEvents()
+        view.flush_line_updates()
+        if view.history.count() > count:
+            states.append(state(view))
+    assert view.history.count() == len(states) - 1
+    return states
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_undo_and_redo_retrace_every_edit(app, view, seed):
+    states = random_edits(app, view, random.Random(seed), 150)
+    for expected in reversed(states[:-1]):
+        view.history.undo()
+        assert state(view) == expected
+    for expected in states[1:]:
+        view.history.redo()
+        assert state(view) == expected
+
+
+def test_commands_apply_and_revert_through_the_history(app, view):
+    calls = []
+    rename = type("Rename", (app.EditCommand,), {"apply": lambda self: calls.append("apply"),
+                                                 "revert": lambda self: calls.append("revert")})
+    view.record_edit(rename(view, "Rename"))
+    assert calls == []  # Already done when recorded
+    view.history.undo()
+    view.history.redo()
+    assert calls == ["revert", "apply"]
+    assert view.history.text(view.history.count() - 1) == "Rename"
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_autosave_recovers_the_map(app, view, tmp_path, seed):
+    path = str(tmp_path / "map.json")
+    view.enable_autosave(path)
+    random_edits(app, view, random.Random(seed), 60)
+    view.history.undo()
+    view.history.undo()
+    view.disable_autosave()
+    assert canonical(read_autosave(path)) == canonical(view.mindmap_data())
+
+
+def test_deleted_branches_leave_the_registry(app, view):
+    view.add_node()
+    root = view.root_node
+    children = [view.add_child_node(root, "c%d" % i) for i in range(5)]
+    for child in children:
+        view.add_child_node(child, "leaf")
+    view.link_nodes(children[2].children[0], children[4])
+    node = children[2]
+    snapshot = view.branch_snapshot(node, 2)
+    node.delete_node(snapshot["index"])
+    view.record_edit(app.BranchCommand(view, node, "Delete Node", snapshot))
+    assert len(view.nodes) == 9 and node.node_id not in view.nodes
+    assert root.children == children[:2] + children[3:]
+    assert not children[4].connections
+    view.history.undo()
+    assert len(view.nodes) == 11 and root.children == children
+    assert children[2].children[0] in children[4].connections.values()
+    view.history.redo()
+    view.history.undo()
+    assert root.children == children
+
+
+def test_children_added_to_collapsed_nodes_stay_folded(app, view, tmp_path):
+    path = str(tmp_path / "map.json")
+    view.enable_autosave(path)
+    view.add_node()
+    parent = view.add_child_node(view.root_node, "parent")
+    view.add_child_node(parent, "first")
+    parent.toggle_collapse()
+    count = view.history.count()
+    child = view.add_child_node(parent, "Hidden idea")
+    assert view.history.count() == count + 1  # Just the new node, the parent stays collapsed
+    assert parent.collapsed and child.scene() is None and child.node_id not in view.nodes
+    assert [record.text for record in parent.record.children] == ["first", "Hidden idea"]
+    assert view.find("hidden") == [child.node_id]
+    view.history.undo()
+    assert child.node_id not in view.model.records and view.find("hidden") == []
+    view.history.redo()
+    assert child.node_id in view.model.records and view.find("hidden") == [child.node_id]
+    view.disable_autosave()
+    assert canonical(read_autosave(path)) == canonical(view.mindmap_data())
+    parent.toggle_collapse()
+    assert view.nodes[child.node_id] is child and child.isVisible()
+
+
+def test_search_finds_and_reveals_folded_nodes(app, view):
+    view.add_node()
+    root = view.root_node
+    branch = view.add_child_node(root, "Budget")
+    middle = view.add_child_node(branch, "Quarterly plan")
+    leaf = view.add_child_node(middle, "Hire a designer")
+    middle.notes = "see the hiring roadmap"
+    view.index_text(middle)
+    middle.toggle_collapse()
+    branch.toggle_collapse()
+    assert leaf.node_id not in view.nodes
+    assert view.find("hir") == [leaf.node_id, middle.node_id]
+    assert view.find("desinger", fuzzy=True) == [leaf.node_id]
+    view.nodes[root.node_id].text_item.setPlainText("Company roadmap")
+    assert view.find("roadmap") == [root.node_id, middle.node_id]
+    count = view.history.count()
+    assert view.find_next("designer") == leaf.node_id
+    assert view.history.count() == count + 1  # Both expands in one step
+    shown = view.nodes[leaf.node_id]
+    assert shown.isSelected() and not branch.collapsed
+    view.history.undo()
+    assert branch.collapsed and leaf.node_id not in view.nodes
+    snapshot = view.branch_snapshot(branch)
+    branch.delete_node(snapshot["index"])
+    assert view.find("hire") == [] and view.find_next() is None
+    view.restore_branch(snapshot)
+    assert view.find("hire designer") == [leaf.node_id]
+
+
+def test_search_in_virtualized_mode(app, view, tmp_path):
+    path = str(tmp_path / "map.json")
+    data = write_map(path, 2000, seed=8)
+    view.load_mindmap(path)
+    view.set_virtualized(True)
+    hidden = data["nodes"][1]["children"][0]
+    found = view.find("idea %d" % hidden)  # Also "Idea %d0" and so on, after it
+    assert found[0].text == "Idea %d" % hidden and found[0].hidden
+    assert view.find_next("idea %d" % hidden) is found[0]
+    assert not found[0].hidden and not found[0].parent.collapsed
+
+
+@pytest.mark.parametrize("mode", ["balanced", "radial"])
+def test_headless_arrange_matches_the_view(app, view, tmp_path, mode):
+    from mindmap_model import MindMap
+    path = str(tmp_path / "map.json")
+    write_map(path, 500, seed=9)
+    view.load_mindmap(path)
+    view.auto_arrange_nodes(mode)
+    mindmap = MindMap.load(path)
+    mindmap.arrange(mode)
+    assert canonical(mindmap.to_data()) == canonical(view.mindmap_data())
+
+
+def test_headless_render_matches_the_view(app, view):
+    from PyQt5.QtCore import QRectF
+    from PyQt5.QtGui import QImage, QPainter
+    from mindmap_render import MapRenderer
+    root = view.add_node()
+    branch = view.add_child_node(root, "A label long enough to wrap")
+    other = view.add_child_node(root, "Other")
+    view.link_nodes(view.add_child_node(branch, "Leaf"), other)
+    other.set_shape("rectangle")
+    view.store_nodes(view.nodes.values())
+    renderer = MapRenderer(view.model, view.theme)
+    x, y, width, height = renderer.rect
+    rendered, shown = (QImage(int(width), int(height), QImage.Format_RGB32) for _ in range(2))
+    renderer._paint_band(rendered, 1.0, 0)
+    shown.fill(renderer.background())
+    painter = QPainter(shown)
+    painter.setRenderHint(QPainter.Antialiasing)
+    view.render_scene_rect(painter, QRectF(0, 0, width, height), QRectF(x, y, width, height))
+    painter.end()
+    assert rendered == shown
+
+
+def test_scene_rect_follows_far_away_nodes(app, view):
+    from PyQt5.QtCore import QPointF
+    view.show()
+    view.add_node()
+    far = view.add_child_node(view.root_node, "far")
+    far.setPos(3e6, -2e6)
+    app.qt_app.processEvents()
+    assert view.scene.sceneRect().contains(far.sceneBoundingRect())
+    assert view.scene.sceneRect().contains(view.root_node.sceneBoundingRect())
+    for node in (far, view.root_node):
+        view.centerOn(node)
+        center = view.mapToScene(view.viewport().rect().center())
+        assert (center - node.sceneBoundingRect().center()).manhattanLength() < 4  # Viewport pixels are whole
+    snapshot = view.branch_snapshot(far)
+    far.delete_node(snapshot["index"])
+    app.qt_app.processEvents()
+    assert view.scene.sceneRect().width() < 1e5
+    # Panning keeps making room
+    before = view.scene.sceneRect()
+    view.horizontalScrollBar().setValue(view.horizontalScrollBar().maximum())
+    app.qt_app.processEvents()
+    assert view.scene.sceneRect().right() > before.right()
+    view.set_unbounded_canvas(False)
+    assert view.scene.sceneRect() == app.QRectF(*app.FIXED_SCENE_RECT)
+
+
+def test_scene_rect_survives_a_cleared_scene(app, view):
+    view.show()
+    view.add_node()
+    child = view.add_child_node(view.root_node, "child")
+    child.setPos(500, 300)
+    assert view.unindexed
+    view.scene.clear()  # Deletes the nodes behind the view's back
+    app.qt_app.processEvents()
+    view.sync_node_index()
+    assert not view.unindexed and len(view.node_index) == 0
+
+
+def test_profiling_times_the_hot_paths(app, view, tmp_path):
+    path = str(tmp_path / "map.json")
+    write_map(path, 300, seed=3)
+    view.load_mindmap(path)
+    view.show()
+    app.qt_app.processEvents()
+    item_change = app.MindMapNode.itemChange
+    try:
+        view.set_performance_overlay(True)
+        assert app.PROFILER.enabled and app.MindMapNode.itemChange is not item_change
+        node = next(node for node in live_nodes(view) if node.children)
+        view.centerOn(node)
+        for _ in range(5):
+            node.moveBy(10, 0)
+            app.qt_app.processEvents()
+        view.viewport().repaint()
+        labels = {row[0]: row[1] for row in app.PROFILER.summary()}
+        assert labels["itemChange"] >= 5 and labels["move_children"] >= 5
+        assert labels["frame"] >= 1 and "paint node" in labels and "paint lines" in labels
+        assert app.PROFILER.frame_stats() is not None
+
+        view.export_trace(str(tmp_path / "trace.json"))
+        with open(str(tmp_path / "trace.json")) as f:
+            names = {event["name"] for event in json.load(f)["traceEvents"]}
+        assert {"itemChange", "frame"} <= names
+    finally:
+        view.set_profiling(False)
+    assert not app.PROFILER.enabled and not view.profile_overlay
+    assert app.MindMapNode.itemChange is item_change
+
+
+def test_overview_redraws_changed_tiles_and_navigates(app, view, tmp_path):
+    from PyQt5.QtCore import QEvent, QPoint, QPointF, Qt
+    from PyQt5.QtGui import QMouseEvent
+    path = str(tmp_path / "map.json")
+    write_map(path, 300, seed=5)
+    view.load_mindmap(path)
+    view.show()
+    view.set_overview(True)
+    overview = view.overview
+    overview.tile_pixels = 64  # Several tiles, even for this small map
+
+    def settle():
+        deadline = time.monotonic() + 10
+        while (overview.refresh_timer.isActive() or overview.dirty or not overview.tiles) \
+                and time.monotonic() < deadline:
+            app.qt_app.processEvents()
+        overview.repaint()
+
+    settle()
+    assert overview.isVisible() and len(overview.tiles) > 4
+    tiles = dict(overview.tiles)
+    node = next(node for node in live_nodes(view) if not node.children)
+    node.moveBy(50, 0)
+    settle()
+    size = overview.tile_pixels * overview.unit
+    redrawn = {tile for tile, image in overview.tiles.items() if tiles.get(tile) is not image}
+    assert redrawn and len(redrawn) < len(tiles)
+    rect = node.sceneBoundingRect()
+    assert (int(rect.center().x() // size), int(rect.center().y() // size)) in redrawn
+
+    def send(kind, pos, button, buttons):
+        app.qt_app.sendEvent(overview, QMouseEvent(kind, QPointF(pos), button, buttons, Qt.NoModifier))
+
+    # A click away from the visible area centres the view there, a drag moves it along
+    frame = overview.map_frame()
+    target = QPoint(overview.width() // 4, overview.height() // 4)
+    send(QEvent.MouseButtonPress, target, Qt.LeftButton, Qt.LeftButton)
+    center = view.mapToScene(view.viewport().rect().center())
+    expected = overview.to_scene(target, frame)
+    assert abs(center.x() - expected.x()) < 4 and abs(center.y() - expected.y()) < 4
+    scale = overview.scene_transform(frame)[0]
+    send(QEvent.MouseMove, target + QPoint(20, 10), Qt.NoButton, Qt.LeftButton)
+    send(QEvent.MouseButtonRelease, target + QPoint(20, 10), Qt.LeftButton, Qt.NoButton)
+    moved = view.mapToScene(view.viewport().rect().center()) - center
+    assert abs(moved.x() - 20 / scale) < 4 and abs(moved.y() - 10 / scale) < 4
+
+    view.set_virtualized(True)
+    assert not overview.tiles or overview.dirty
+    settle()
+    assert len(overview.tiles) > 4 and not overview.dirty
+    view.set_overview(False)
+    assert not overview.isVisible()
+
+
+def test_themes_and_restyles_are_bulk_edits(app, view, tmp_path):
+    from mindmap_style import CLASSIC, NIGHT
+    view.add_node()
+    root = view.root_node
+    children = [view.add_child_node(root, "c%d" % i) for i in range(3)]
+    leaves = [view.add_child_node(child, "leaf") for child in children for _ in range(2)]
+    assert {id(leaf.style) for leaf in leaves} == {id(CLASSIC.level_style(2))}
+    assert root.style.pen is leaves[0].style.pen and root.text_item.font() == leaves[0].text_item.font()
+
+    # Folded nodes are restyled through their records, in one undoable edit
+    children[0].toggle_collapse()
+    count = view.history.count()
+    view.restyle_level(2, "#123456")
+    assert view.history.count() == count + 1
+    children[0].toggle_collapse()
+    assert {view.nodes[leaf.node_id].style.fill for leaf in leaves} == {"#123456"}
+    assert {child.style.fill for child in children} == {CLASSIC.fill_for(1)}
+    view.history.undo()
+    assert {view.nodes[leaf.node_id].style.fill for leaf in leaves} == {CLASSIC.fill_for(2)}
+
+    view.restyle_branch(children[1], "#654321")
+    assert [node.style.fill for node in [children[1]] + children[1].children] == ["#654321"] * 3
+    view.restyle_branch(children[1])
+    assert children[1].style.fill == CLASSIC.fill_for(1)
+    assert view.history.text(view.history.count() - 1) == "Reset Colors"
+
+    # Manual-mode highlighting leaves the fill alone
+    view.selected_nodes = children[:2]
+    for child in children[:2]:
+        child.set_highlighted(True)
+    view.connection_mode = "manual"
+    view.connect_nodes()
+    assert not children[0].highlighted and children[0].style.fill == CLASSIC.fill_for(1)
+
+    view.set_theme("Night", recolor=True)
+    assert view.history.text(view.history.count() - 1) == "Apply Theme"
+    assert root.style is NIGHT.level_style(0) and view.edge_layer.theme is NIGHT
+    assert view.nodes[leaves[0].node_id].style is NIGHT.level_style(2)
+    added = view.add_child_node(leaves[0], "new")
+    assert added.style is NIGHT.level_style(3)
+    view.history.undo()
+    view.history.undo()
+    assert root.style is NIGHT.style(CLASSIC.fill_for(0))
+
+    path = str(tmp_path / "map.json")
+    view.restyle_level(1, "#abcdef")
+    view.save_mindmap(path)
+    fills = {node.node_id: node.style.fill for node in live_nodes(view)}
+    view.load_mindmap(path)
+    assert sorted(node.style.fill for node in live_nodes(view)) == sorted(fills.values())
+    assert all(node.style.theme is NIGHT for node in live_nodes(view))
+
+
+def test_restyle_in_virtualized_mode(app, view, tmp_path):
+    path = str(tmp_path / "map.json")
+    write_map(path, 2000, seed=6)
+    view.load_mindmap(path)
+    view.set_virtualized(True)
+    view.restyle_level(3, "#0000ff")
+    records = view.virtualizer.records
+    assert {record.color for record in records if record.level == 3} == {"#0000ff"}
+    assert all(record.item.style.fill == record.color for record in records if record.item is not None)
+    assert {node["color"] for node in view.mindmap_data()["nodes"] if node["level"] == 3} == {"#0000ff"}
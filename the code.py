@@ -1,194 +1,751 @@
 from PyQt5.QtWidgets import (QApplication, QGraphicsView, QGraphicsScene, QGraphicsEllipseItem, 
                          QGraphicsLineItem, QGraphicsTextItem, QGraphicsItem, QPushButton, QVBoxLayout, 
                          QWidget, QHBoxLayout, QColorDialog, QFontDialog, QMenu, QAction, QInputDialog,
-                         QToolBar, QMainWindow, QFileDialog, QGraphicsRectItem)
-from PyQt5.QtGui import QPainter, QBrush, QPen, QFont, QColor, QIcon, QPixmap, QImage
-from PyQt5.QtCore import Qt, QPointF, QRectF, QBuffer, QByteArray, QIODevice
+                         QToolBar, QMainWindow, QFileDialog, QGraphicsRectItem, QStyle, QRubberBand,
+                         QStyleOptionGraphicsItem, QUndoStack, QUndoCommand)
+from PyQt5.QtGui import (QPainter, QPen, QFont, QColor, QIcon, QPixmap, QImage, QPicture, QPainterPath,
+                         QPdfWriter, QPageSize, QKeySequence, QPaintEngine, QPixmapCache)
+from PyQt5.QtCore import (Qt, QPointF, QRectF, QLineF, QBuffer, QByteArray, QIODevice, QTimer, QObject,
+                          QThread, pyqtSignal, QRect, QSize, QSizeF, QMarginsF, QEvent)
+from PyQt5.QtSvg import QSvgGenerator
+from PyQt5 import sip
 import sys
+import array
+import atexit
 import json
 import os
-import random
+import collections
+import math
+import re
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+from mindmap_export import PngStreamWriter, encode_rows
+from mindmap_geometry import edge_lines, edge_point
+from mindmap_format import is_binary_path, read_binary_mindmap, read_mindmap_file, write_mindmap_file
+from mindmap_journal import AutosaveWriter, read_autosave
+from mindmap_layout import LAYOUT_MODES
+from mindmap_model import ExtentGrid, MindMap, NodeRecord, SpatialGrid, new_node_id
+from mindmap_profile import Profiler
+from mindmap_search import SearchIndex
+from mindmap_style import DEFAULT_THEME, TEXT_INSET, THEMES
+
+try:
+    from mindmap_force import ForceLayout
+except ImportError:  # NumPy is only needed for the force-directed layout
+    ForceLayout = None
+
+# Scene rect of a view whose canvas does not follow the nodes, see MindMapView.set_unbounded_canvas
+FIXED_SCENE_RECT = (-5000, -5000, 10000, 10000)
+
+# Zoom levels (view scale) below which drawing is simplified
+DEFAULT_LOD_THRESHOLDS = {
+    "text": 0.6,  # Node text is drawn from a cached bitmap
+    "text_hidden": 0.3,  # Node text is not drawn at all
+    "shapes": 0.4,  # Nodes are plain filled rects without outline or antialiasing
+    "edges": 0.5,  # Connection lines are drawn thin, without antialiasing or dashes
+}
+
+
+def level_of_detail(painter):
+    """Zoom level the painter currently draws at"""
+    return QStyleOptionGraphicsItem.levelOfDetailFromTransform(painter.worldTransform())
+
+
+def lod_thresholds(scene, widget):
+    """Thresholds of the view an item paints in, see MindMapView.set_lod_thresholds.
+    
+    widget is the viewport handed to paint(), None when the scene is
+    rendered to an export, which then follows the scene's first view.
+    """
+    view = widget.parent() if widget is not None else None
+    if not isinstance(view, MindMapView):
+        views = scene.views() if scene is not None else []
+        view = views[0] if views else None
+    return view.lod_thresholds if isinstance(view, MindMapView) else DEFAULT_LOD_THRESHOLDS
+
+
+class NodeTextItem(QGraphicsTextItem):
+    """Text of a MindMapNode, drawn from a shared bitmap or not at all when zoomed out.
+    
+    Bitmaps of the text live in QPixmapCache, keyed by everything that
+    changes how the text looks, so every node with the same label, font,
+    width and colour shares one and a changed text simply looks up a new
+    one. They are used at middle zoom levels, and at every zoom level when
+    render caching is on (see MindMapView.set_render_caching), in steps of
+    pixmap_scale_step so zooming does not fill the cache with near copies.
+    Vector output (PDF and SVG exports) always gets the real text.
+    """
+    pixmap_scale_step = 0.25
+    
+    def __init__(self, text, parent=None):
+        super().__init__(text, parent)
+        self.cache_key = None  # Key prefix in QPixmapCache, None until next needed
+        self.text_before_edit = None  # Text when editing started, for the undo history
+        self.document().contentsChanged.connect(self.contents_changed)
+    
+    def clear_cache(self):
+        self.cache_key = None
+    
+    def contents_changed(self):
+        self.clear_cache()
+        node = self.parentItem()
+        view = node.owning_view() if node else None
+        if view:
+            view.index_text(node)
+            view.note_change(node)
+    
+    def setFont(self, font):
+        super().setFont(font)
+        self.clear_cache()
+    
+    def setTextWidth(self, width):
+        super().setTextWidth(width)
+        self.clear_cache()
+    
+    def setDefaultTextColor(self, color):
+        super().setDefaultTextColor(color)
+        self.clear_cache()
+    
+    def focusInEvent(self, event):
+        super().focusInEvent(event)
+        self.text_before_edit = self.toPlainText()
+        # The cursor and selection change all the time while editing
+        self.setCacheMode(QGraphicsItem.NoCache)
+    
+    def focusOutEvent(self, event):
+        super().focusOutEvent(event)
+        node = self.parentItem()
+        self.setCacheMode(node.cacheMode() if node else QGraphicsItem.NoCache)
+        # One undo step per editing session, not per keystroke
+        before, self.text_before_edit = self.text_before_edit, None
+        text = self.toPlainText()
+        view = node.owning_view() if node else None
+        if view and before is not None and text != before:
+            view.record_edit(PropertyCommand(view, node, "text", before, text))
+    
+    def text_pixmap(self, scale):
+        """Return the shared bitmap of this text drawn at the given scale"""
+        if self.cache_key is None:
+            self.cache_key = "mindmap-text\0%s\0%g\0%s\0%s" % (
+                self.font().key(), self.textWidth(), self.defaultTextColor().name(QColor.HexArgb),
+                self.toPlainText())
+        key = "%s\0%g" % (self.cache_key, scale)
+        pixmap = QPixmapCache.find(key)
+        if pixmap is None:
+            rect = self.boundingRect()
+            pixmap = QPixmap(max(1, math.ceil(rect.width() * scale)), max(1, math.ceil(rect.height() * scale)))
+            pixmap.fill(Qt.transparent)
+            pixmap_painter = QPainter(pixmap)
+            pixmap_painter.setRenderHint(QPainter.Antialiasing)
+            pixmap_painter.scale(scale, scale)
+            super().paint(pixmap_painter, QStyleOptionGraphicsItem(), None)
+            pixmap_painter.end()
+            QPixmapCache.insert(key, pixmap)
+        return pixmap
+    
+    def paint(self, painter, option, widget=None):
+        lod = level_of_detail(painter)
+        thresholds = lod_thresholds(self.scene(), widget)
+        full = lod >= thresholds["text"]
+        if self.hasFocus() or (full and (self.cacheMode() == QGraphicsItem.NoCache
+                                         or painter.paintEngine().type() != QPaintEngine.Raster)):
+            super().paint(painter, option, widget)
+            return
+        if full:
+            step = self.pixmap_scale_step
+            scale = math.ceil(lod / step) * step
+        elif lod >= thresholds["text_hidden"]:
+            scale = 1.0
+        else:
+            return
+        rect = self.boundingRect()
+        pixmap = self.text_pixmap(scale)
+        painter.setRenderHint(QPainter.SmoothPixmapTransform)
+        painter.drawPixmap(QRectF(0, 0, rect.width(), rect.height()), pixmap, QRectF(pixmap.rect()))
+
+
+class Edge:
+    """Handle for one connection line stored in an EdgeLayer.
+    
+    Offers the part of the QGraphicsLineItem API the nodes use, so lines in
+    MindMapNode.connections and parent_connection can be Edges. Edges
+    compare by identity, so they can be dict keys.
+    """
+    __slots__ = ("layer", "index")
+    
+    def __init__(self, layer, index):
+        self.layer = layer
+        self.index = index  # Slot in the layer arrays, None once removed
+    
+    def line(self):
+        coords = self.layer.coords
+        i = self.index * 4
+        return QLineF(coords[i], coords[i + 1], coords[i + 2], coords[i + 3])
+    
+    def setLine(self, *line):
+        if len(line) == 1:
+            line = (line[0].x1(), line[0].y1(), line[0].x2(), line[0].y2())
+        self.layer.set_line(self.index, *line)
+    
+    def translate(self, dx, dy):
+        coords = self.layer.coords
+        i = self.index * 4
+        self.layer.set_line(self.index, coords[i] + dx, coords[i + 1] + dy, coords[i + 2] + dx, coords[i + 3] + dy)
+    
+    def setVisible(self, visible):
+        self.layer.set_visible(self.index, visible)
+    
+    def isVisible(self):
+        return bool(self.layer.visible[self.index])
+    
+    def is_dashed(self):
+        return self.layer.styles[self.index] == EdgeLayer.DASHED
+    
+    def alive(self):
+        return self.index is not None
+    
+    def remove(self):
+        if self.index is not None:
+            self.layer.remove(self)
+
+
+class EdgeLayer(QGraphicsItem):
+    """One scene item holding and painting every connection line.
+    
+    Line coordinates, styles and visibility are kept in flat arrays indexed
+    by Edge handles, with a SpatialGrid to find the lines in the exposed
+    area.  Paint draws solid and dashed lines in one call each (one thin
+    cosmetic pass each below the "edges" level of detail), and moving lines
+    only repaints the area they were and are in, once per event-loop pass.
+    When a large share of the lines changes between two paints (a layout
+    frame, say) the grid is rebuilt once at the next paint instead of being
+    updated line by line.
+    """
+    SOLID, DASHED = 0, 1
+    bounds_margin = 1000  # Grow the bounding rect in steps to limit geometry changes
+    max_cells = 16  # Lines crossing more grid cells are kept in long_lines instead
+    bulk_changes = 256  # Line changes between paints after which the grid is rebuilt instead
+    
+    def __init__(self, theme=DEFAULT_THEME):
+        super().__init__()
+        self.theme = theme  # Its pens draw the lines
+        self.setZValue(-1)  # Below the nodes
+        self.setFlag(QGraphicsItem.ItemUsesExtendedStyleOption)
+        self.setAcceptedMouseButtons(Qt.NoButton)
+        self.coords = array.array('d')  # x1, y1, x2, y2 per slot
+        self.styles = array.array('b')
+        self.visible = array.array('b')
+        self.handles = []  # Edge per slot, None for free slots
+        self.free = []
+        self.grid = SpatialGrid(1024.0)
+        self.long_lines = set()  # Slots checked on every paint rather than indexed
+        self.changes = 0  # Lines moved since the last paint
+        self.index_stale = False  # Grid to be rebuilt at the next paint
+        self.bounds = QRectF()
+        self.dirty = QRectF()
+        self.flush_scheduled = False
+    
+    def __len__(self):
+        return len(self.handles) - len(self.free)
+    
+    def add(self, style=SOLID):
+        if self.free:
+            index = self.free.pop()
+            self.styles[index] = style
+            self.visible[index] = 1
+        else:
+            index = len(self.handles)
+            self.coords.extend((0.0, 0.0, 0.0, 0.0))
+            self.styles.append(style)
+            self.visible.append(1)
+            self.handles.append(None)
+        edge = Edge(self, index)
+        self.handles[index] = edge
+        self.coords[index * 4:index * 4 + 4] = array.array('d', (0.0, 0.0, 0.0, 0.0))
+        self.grid.insert(index, 0.0, 0.0, 0.0, 0.0)
+        return edge
+    
+    def remove(self, edge):
+        index = edge.index
+        self.mark_dirty(index)
+        self.grid.remove(index)
+        self.long_lines.discard(index)
+        self.handles[index] = None
+        self.free.append(index)
+        edge.index = None
+    
+    def set_line(self, index, x1, y1, x2, y2):
+        self.mark_dirty(index)
+        coords = self.coords
+        i = index * 4
+        coords[i], coords[i + 1], coords[i + 2], coords[i + 3] = x1, y1, x2, y2
+        left, top = min(x1, x2), min(y1, y2)
+        width, height = abs(x2 - x1), abs(y2 - y1)
+        if not self.bounds.contains(QRectF(left, top, width, height)):
+            margin = self.bounds_margin
+            self.prepareGeometryChange()
+            self.bounds = self.bounds.united(QRectF(left - margin, top - margin,
+                                                    width + 2 * margin, height + 2 * margin))
+        if self.index_stale:
+            return
+        self.changes += 1
+        if self.changes > max(self.bulk_changes, len(self.handles) // 8):
+            self.index_stale = True
+            self.mark_dirty(index)
+            return
+        self.index_line(index, left, top, width, height)
+        self.mark_dirty(index)
+    
+    def set_lines(self, edges, lines):
+        """Set many lines at once, lines holding (x1, y1, x2, y2) per edge.
+        
+        Past the bulk_changes limit the coordinates are just stored, with
+        one bounds check for all of them, and the grid is rebuilt at the
+        next paint.
+        """
+        if not self.index_stale and self.changes + len(edges) <= max(self.bulk_changes, len(self.handles) // 8):
+            for edge, line in zip(edges, lines):
+                self.set_line(edge.index, *line)
+            return
+        self.index_stale = True  # The whole layer is repainted as well
+        coords = self.coords
+        for edge, (x1, y1, x2, y2) in zip(edges, lines):
+            i = edge.index * 4
+            coords[i], coords[i + 1], coords[i + 2], coords[i + 3] = x1, y1, x2, y2
+        xs = [line[0] for line in lines] + [line[2] for line in lines]
+        ys = [line[1] for line in lines] + [line[3] for line in lines]
+        left, top, right, bottom = min(xs), min(ys), max(xs), max(ys)
+        if not self.bounds.contains(QRectF(left, top, right - left, bottom - top)):
+            margin = self.bounds_margin
+            self.prepareGeometryChange()
+            self.bounds = self.bounds.united(QRectF(left - margin, top - margin,
+                                                    right - left + 2 * margin, bottom - top + 2 * margin))
+        self.mark_dirty(edges[0].index)
+    
+    def index_line(self, index, left, top, width, height):
+        size = self.grid.cell_size
+        if (width // size + 2) * (height // size + 2) > self.max_cells:
+            self.grid.remove(index)
+            self.long_lines.add(index)
+        else:
+            self.long_lines.discard(index)
+            self.grid.move(index, left, top, width, height)
+    
+    def reindex(self):
+        """Rebuild the grid from the line arrays"""
+        self.grid.clear()
+        self.long_lines.clear()
+        coords = self.coords
+        for index, edge in enumerate(self.handles):
+            if edge is not None:
+                i = index * 4
+                x1, y1, x2, y2 = coords[i], coords[i + 1], coords[i + 2], coords[i + 3]
+                self.index_line(index, min(x1, x2), min(y1, y2), abs(x2 - x1), abs(y2 - y1))
+        self.index_stale = False
+    
+    def set_visible(self, index, visible):
+        if self.visible[index] != bool(visible):
+            self.visible[index] = 1 if visible else 0
+            self.mark_dirty(index)
+    
+    def mark_dirty(self, index):
+        if not self.index_stale:  # Otherwise everything is repainted anyway
+            coords = self.coords
+            i = index * 4
+            x1, y1, x2, y2 = coords[i], coords[i + 1], coords[i + 2], coords[i + 3]
+            self.dirty = self.dirty.united(QRectF(min(x1, x2) - 2, min(y1, y2) - 2,
+                                                  abs(x2 - x1) + 4, abs(y2 - y1) + 4))
+        if not self.flush_scheduled:
+            self.flush_scheduled = True
+            QTimer.singleShot(0, self.flush)
+    
+    def flush(self):
+        """Repaint the area of the lines changed since the last flush"""
+        self.flush_scheduled = False
+        if self.index_stale:
+            self.update()
+            self.notify_views(None)
+            self.dirty = QRectF()
+        elif not self.dirty.isNull():
+            self.update(self.dirty)
+            self.notify_views(self.dirty)
+            self.dirty = QRectF()
+    
+    def notify_views(self, rect):
+        for view in self.scene().views() if self.scene() else ():
+            if isinstance(view, MindMapView):
+                view.overview_changed(rect)
+    
+    def boundingRect(self):
+        return self.bounds
+    
+    def shape(self):
+        # Never the target of hit-tests
+        return QPainterPath()
+    
+    def lines_in(self, rect):
+        """Return the solid and the dashed visible lines crossing a scene rect's bounding box, as QLineFs"""
+        if self.index_stale:
+            self.reindex()
+        coords, styles, visible = self.coords, self.styles, self.visible
+        solid, dashed = [], []
+        left, top, right, bottom = rect.left(), rect.top(), rect.right(), rect.bottom()
+        candidates = self.grid.query(left, top, rect.width(), rect.height())
+        for index in self.long_lines:
+            # Far apart nodes on an unbounded canvas make many long lines, most of them off screen
+            i = index * 4
+            x1, y1, x2, y2 = coords[i], coords[i + 1], coords[i + 2], coords[i + 3]
+            if (min(x1, x2) <= right and max(x1, x2) >= left
+                    and min(y1, y2) <= bottom and max(y1, y2) >= top):
+                candidates.add(index)
+        for index in candidates:
+            if visible[index]:
+                i = index * 4
+                line = QLineF(coords[i], coords[i + 1], coords[i + 2], coords[i + 3])
+                (dashed if styles[index] == self.DASHED else solid).append(line)
+        return solid, dashed
+    
+    def paint(self, painter, option, widget=None):
+        self.changes = 0
+        rect = option.exposedRect
+        if painter.hasClipping():
+            # scene.render() exposes the whole item, the clip says what is really drawn
+            rect = rect.intersected(painter.clipBoundingRect())
+        solid, dashed = self.lines_in(rect)
+        
+        pens, thin_pens = self.theme.pens()
+        if level_of_detail(painter) < lod_thresholds(self.scene(), widget)["edges"]:
+            # Zoomed out, thin lines without antialiasing and dash patterns
+            painter.setRenderHint(QPainter.Antialiasing, False)
+            pens = thin_pens
+        painter.setPen(pens[0])
+        painter.drawLines(solid)
+        painter.setPen(pens[1])
+        painter.drawLines(dashed)
+
 
 class MindMapNode(QGraphicsEllipseItem):
     def __init__(self, x, y, text="New Idea", color=Qt.yellow, node_type="ellipse", width=100, height=60):
         super().__init__(0, 0, width, height)
+        self.node_id = new_node_id()  # Key in MindMapView.nodes, stable across edits
         self.width = width
         self.height = height
         self.node_type = node_type
-        self.setBrush(QBrush(color))
-        self.setPen(QPen(Qt.black, 2))
+        self.style = None  # NodeStyle shared with the nodes drawn alike, see set_style
+        self.highlighted = False  # Picked for a manual connection, filled in the theme's highlight
         self.setFlag(QGraphicsItem.ItemIsMovable)
         self.setFlag(QGraphicsItem.ItemIsSelectable)
         self.setFlag(QGraphicsItem.ItemSendsGeometryChanges)
-        self.setPos(x, y)
         
-        # For rectangular nodes
-        if node_type == "rectangle":
-            self.rect_item = QGraphicsRectItem(0, 0, width, height, self)
-            self.rect_item.setBrush(QBrush(color))
-            self.rect_item.setPen(QPen(Qt.black, 2))
-            self.setRect(0, 0, 0, 0)  # Hide the ellipse
-        
-        # Center text in the node
-        self.text_item = QGraphicsTextItem(text, self)
-        self.text_item.setFont(QFont("Arial", 10))
-        self.text_item.setDefaultTextColor(Qt.black)
-        self.text_item.setTextWidth(width - 20)
-        # Center the text
-        text_x = -self.text_item.boundingRect().width() / 2 + width / 2
-        text_y = -self.text_item.boundingRect().height() / 2 + height / 2
-        self.text_item.setPos(text_x, text_y)
+        # Center text in the node, cached once in a view (see set_cache_mode)
+        self.text_item = NodeTextItem(text, self)
+        self.set_style(DEFAULT_THEME.style(color))  # The view's theme once in one, see itemChange
+        self.text_item.setTextWidth(width - 2 * TEXT_INSET)
+        self.center_text()
         self.text_item.setTextInteractionFlags(Qt.TextEditorInteraction)
         
-        self.connections = []  # Store connected lines and nodes
+        self.connections = {}  # Dashed line -> node at its other end
         self.parent_connection = None  # Reference to parent connection
         self.level = 0  # Hierarchy level
-        self.children = []  # Child nodes
         self.collapsed = False  # For collapsing/expanding subtrees
         self.notes = ""  # For storing additional notes
+        self.in_subtree_move = False  # Set while an ancestor moves this branch
+        self.record = None  # NodeRecord of the view's MindMap shown by this node, see bind_record
         
+        # Position last, itemChange relies on the attributes above
+        self.setPos(x, y)
+        
+    @classmethod
+    def from_record(cls, record):
+        """Create a node showing a NodeRecord"""
+        node = cls(record.x, record.y, record.text, QColor(record.color), record.node_type,
+                   record.width, record.height)
+        node.node_id = record.node_id
+        node.level = record.level
+        node.notes = record.notes
+        node.collapsed = record.collapsed
+        node.record = record
+        record.item = node
+        return node
+    
+    @property
+    def children(self):
+        """The nodes showing the children of this node's record, none while it is collapsed"""
+        record = self.record
+        if record is None or record.collapsed:
+            return []
+        return [child.item for child in record.children if child.item is not None]
+    
+    def center_text(self):
+        """Center the text item inside the node"""
+        text_rect = self.text_item.boundingRect()
+        self.text_item.setPos(-text_rect.width() / 2 + self.width / 2,
+                              -text_rect.height() / 2 + self.height / 2)
+    
+    def set_size(self, width, height):
+        self.width = width
+        self.height = height
+        self.setRect(0, 0, width, height)
+        self.center_text()
+        view = self.owning_view()
+        if view:
+            view.index_node(self)
+            view.note_change(self)
+    
+    def set_style(self, style):
+        """Draw this node with a NodeStyle, see mindmap_style.
+        
+        Only what differs from the old style is handed to Qt, restyling a
+        node in the same theme just swaps the brush it paints with.
+        """
+        old, self.style = self.style, style
+        if old is None or style.pen != old.pen:
+            self.setPen(style.pen)  # Its width is part of the bounding rect
+        if old is None or style.text_color != old.text_color:
+            self.text_item.setDefaultTextColor(style.text_color)
+        if old is None or style.font != old.font:
+            self.text_item.setFont(style.font)
+            if old is not None:
+                self.center_text()
+        self.update()
+    
+    def set_color(self, color):
+        """Fill this node with a colour, in the style of its theme"""
+        self.set_style(self.style.theme.style(color))
+        view = self.owning_view()
+        if view:
+            view.note_change(self)
+            view.overview_changed(self.sceneBoundingRect())
+    
+    def set_shape(self, node_type):
+        """Switch between the "ellipse" and "rectangle" shapes"""
+        if node_type != self.node_type:
+            self.node_type = node_type
+            self.update()
+            view = self.owning_view()
+            if view:
+                view.note_change(self)
+                # Lines end on the outline
+                view.update_lines(self.connection_lines())
+            else:
+                for line, from_node, to_node in self.connection_lines():
+                    self.update_connection_line(line, from_node, to_node)
+    
+    def shape(self):
+        if self.node_type == "rectangle":
+            path = QPainterPath()
+            path.addRect(self.rect())
+            return path
+        return super().shape()
+    
+    def set_highlighted(self, highlighted):
+        if highlighted != self.highlighted:
+            self.highlighted = highlighted
+            self.update()
+    
+    def paint(self, painter, option, widget=None):
+        style = self.style
+        brush = style.highlight if self.highlighted else style.brush
+        if level_of_detail(painter) < lod_thresholds(self.scene(), widget)["shapes"]:
+            # Zoomed far out, a plain filled rect is indistinguishable and much cheaper
+            painter.setRenderHint(QPainter.Antialiasing, False)
+            painter.fillRect(self.rect(), brush)
+            return
+        style.paint_shape(painter, self.rect(), self.node_type, brush)
+        if option.state & QStyle.State_Selected:
+            painter.setPen(QPen(Qt.black, 0, Qt.DashLine))
+            painter.setBrush(Qt.NoBrush)
+            painter.drawRect(self.boundingRect())
+    
+    def bind_record(self, record):
+        """Show a NodeRecord with this node, a pooled one or one shown before (see MindMapView.bind_records)"""
+        self.record = None
+        self.node_id = record.node_id
+        self.text_item.setPlainText(record.text)
+        self.set_shape(record.node_type)
+        self.set_size(record.width, record.height)
+        self.set_color(record.color)
+        self.level = record.level
+        self.notes = record.notes
+        self.collapsed = record.collapsed
+        self.setPos(record.x, record.y)
+        self.record = record
+        record.item = self
+    
+    def store_record(self):
+        """Copy edits made through this node back into its NodeRecord, apart from the position"""
+        record = self.record
+        record.text = self.text_item.toPlainText()
+        record.color = self.style.fill
+        record.node_type = self.node_type
+        record.width = self.width
+        record.height = self.height
+        record.notes = self.notes
+    
     def itemChange(self, change, value):
         if change == QGraphicsItem.ItemPositionChange:
-            # Update all connected lines
-            for line, other_node in self.connections:
-                self.update_connection_line(line, self, other_node)
-            
-            # If this node has a parent connection, update it
-            if self.parent_connection and self.parent_connection[0]:
-                parent_line, parent_node = self.parent_connection
-                self.update_connection_line(parent_line, parent_node, self)
-                
-            # Move all children recursively
+            # Moved as part of an ancestor's branch, the ancestor handles the lines
+            if self.in_subtree_move:
+                self.prev_pos = value
+                return super().itemChange(change, value)
+
+            # In virtualized mode the branch lives in NodeRecords
+            view = self.owning_view()
+            if view and view.virtualizer:
+                if self.record is not None:
+                    view.virtualizer.move_branch(self.record, value.x() - self.record.x, value.y() - self.record.y)
+                self.prev_pos = value
+                return super().itemChange(change, value)
+
+            # Move the whole branch by the same delta in one batch
             if hasattr(self, 'prev_pos') and self.children:
                 delta_x = value.x() - self.prev_pos.x()
                 delta_y = value.y() - self.prev_pos.y()
                 self.move_children(delta_x, delta_y)
-            
+            else:
+                self.queue_line_updates(self.connection_lines())
+
             # Store the position for next time
             self.prev_pos = value
-            
+        
+        elif change in (QGraphicsItem.ItemPositionHasChanged, QGraphicsItem.ItemSceneChange,
+                        QGraphicsItem.ItemSceneHasChanged):
+            # Moved, or leaving or joining a scene
+            view = self.owning_view()
+            if view:
+                view.index_node(self)
+                view.note_change(self, branch=change != QGraphicsItem.ItemSceneChange)
+                if change != QGraphicsItem.ItemPositionHasChanged:
+                    view.index_text(self)
+                if change == QGraphicsItem.ItemSceneHasChanged:
+                    # Created, unfolded or loaded into a view, cached and themed as it says
+                    self.set_cache_mode(view.node_cache_mode)
+                    if self.style.theme is not view.theme:
+                        self.set_style(view.theme.style(self.style.fill))
+
         return super().itemChange(change, value)
 
+    def connection_lines(self):
+        """Yield (line, from_node, to_node) for every line attached to this node"""
+        for line, other_node in self.connections.items():
+            yield line, self, other_node
+        if self.parent_connection and self.parent_connection[0]:
+            parent_line, parent_node = self.parent_connection
+            yield parent_line, parent_node, self
+
+    def set_cache_mode(self, mode):
+        """Cache this node and, unless it is being edited, its text in a QGraphicsItem.CacheMode"""
+        self.setCacheMode(mode)
+        if not self.text_item.hasFocus():
+            self.text_item.setCacheMode(mode)
+    
+    def owning_view(self):
+        """Return the view showing this node, if any"""
+        scene = self.scene()
+        if scene and scene.views():
+            return scene.views()[0]
+        return None
+
+    def queue_line_updates(self, lines):
+        """Recompute the given (line, from_node, to_node) once the current frame is done"""
+        view = self.owning_view()
+        for line, from_node, to_node in lines:
+            if view:
+                view.queue_line_update(line, from_node, to_node)
+            else:
+                self.update_connection_line(line, from_node, to_node)
+
     def update_connection_line(self, line, from_node, to_node):
-        # Calculate better connection points based on node shapes
-        if from_node.node_type == "ellipse":
-            start_point = self.calculate_ellipse_edge_point(from_node, to_node)
-        else:
-            start_point = self.calculate_rectangle_edge_point(from_node, to_node)
-            
-        if to_node.node_type == "ellipse":
-            end_point = self.calculate_ellipse_edge_point(to_node, from_node)
-        else:
-            end_point = self.calculate_rectangle_edge_point(to_node, from_node)
-            
-        line.setLine(start_point.x(), start_point.y(), end_point.x(), end_point.y())
+        """Run a line between the outlines of two nodes, see mindmap_geometry"""
+        x1, y1, a1, b1, ellipse1 = from_node.outline()
+        x2, y2, a2, b2, ellipse2 = to_node.outline()
+        line.setLine(*(edge_point(x1, y1, a1, b1, ellipse1, x2, y2) + edge_point(x2, y2, a2, b2, ellipse2, x1, y1)))
     
-    def calculate_ellipse_edge_point(self, ellipse_node, target_node):
-        # Calculate the point on the edge of the ellipse that intersects with the line to target
-        ellipse_center = ellipse_node.scenePos() + QPointF(ellipse_node.width/2, ellipse_node.height/2)
-        target_center = target_node.scenePos() + QPointF(target_node.width/2, target_node.height/2)
-        
-        # Vector from ellipse center to target
-        dx = target_center.x() - ellipse_center.x()
-        dy = target_center.y() - ellipse_center.y()
-        
-        # Normalize the vector
-        length = (dx**2 + dy**2)**0.5
-        if length == 0:
-            return ellipse_center
-            
-        dx, dy = dx/length, dy/length
-        
-        # Calculate the point on the ellipse edge
-        # Simple approximation: use the semi-major and semi-minor axes
-        a = ellipse_node.width / 2
-        b = ellipse_node.height / 2
-        
-        # Parametric equation approximation
-        t = min(abs(a/dx) if dx != 0 else float('inf'), 
-                abs(b/dy) if dy != 0 else float('inf'))
-        
-        edge_x = ellipse_center.x() + dx * t
-        edge_y = ellipse_center.y() + dy * t
-        
-        return QPointF(edge_x, edge_y)
+    def outline(self):
+        """Return (centre x, centre y, half width, half height, ellipse) in scene coordinates"""
+        pos = self.scenePos()
+        a, b = self.width / 2, self.height / 2
+        return pos.x() + a, pos.y() + b, a, b, self.node_type == "ellipse"
     
-    def calculate_rectangle_edge_point(self, rect_node, target_node):
-        # Calculate the point on the edge of the rectangle that intersects with the line to target
-        rect_center = rect_node.scenePos() + QPointF(rect_node.width/2, rect_node.height/2)
-        target_center = target_node.scenePos() + QPointF(target_node.width/2, target_node.height/2)
-        
-        # Rectangle bounds
-        left = rect_center.x() - rect_node.width/2
-        right = rect_center.x() + rect_node.width/2
-        top = rect_center.y() - rect_node.height/2
-        bottom = rect_center.y() + rect_node.height/2
-        
-        # Calculate intersection with rectangle edges
-        dx = target_center.x() - rect_center.x()
-        dy = target_center.y() - rect_center.y()
-        
-        # Prevent division by zero
-        if dx == 0:
-            return QPointF(rect_center.x(), top if dy < 0 else bottom)
-        if dy == 0:
-            return QPointF(left if dx < 0 else right, rect_center.y())
-        
-        # Calculate intersections with all four sides
-        tx1 = (left - rect_center.x()) / dx
-        tx2 = (right - rect_center.x()) / dx
-        ty1 = (top - rect_center.y()) / dy
-        ty2 = (bottom - rect_center.y()) / dy
-        
-        # Find the relevant intersection point
-        t = min(max(tx1, tx2), max(ty1, ty2))
-        
-        return QPointF(rect_center.x() + dx * t, rect_center.y() + dy * t)
+    def subtree_nodes(self):
+        """Return all descendants of this node (iterative, safe for deep trees)"""
+        nodes = []
+        stack = list(self.children)
+        while stack:
+            node = stack.pop()
+            nodes.append(node)
+            stack.extend(node.children)
+        return nodes
+
+    def hidden_records(self):
+        """The records hidden below this node while it is collapsed"""
+        record = self.record
+        return record.descendants() if record is not None and record.collapsed else []
     
     def move_children(self, delta_x, delta_y):
-        for child in self.children:
-            current_pos = child.pos()
-            child.setPos(current_pos.x() + delta_x, current_pos.y() + delta_y)
+        """Move the whole branch below this node as one unit.
+
+        Descendants are shifted without running their own itemChange cascade.
+        Lines inside the branch are translated by the same delta, and only the
+        lines crossing the branch boundary are recomputed, once per frame.
+        """
+        descendants = self.subtree_nodes()
+        branch = set(descendants)
+        branch.add(self)
+
+        for node in descendants:
+            node.in_subtree_move = True
+            node.moveBy(delta_x, delta_y)
+            node.in_subtree_move = False
+
+        seen = set()
+        boundary = []
+        for node in branch:
+            for line, from_node, to_node in node.connection_lines():
+                if id(line) in seen:
+                    continue
+                seen.add(id(line))
+                if from_node in branch and to_node in branch:
+                    line.translate(delta_x, delta_y)
+                else:
+                    boundary.append((line, from_node, to_node))
+
+        # This node only reaches its new position after itemChange returns
+        self.queue_line_updates(boundary)
     
     def toggle_collapse(self):
         self.collapsed = not self.collapsed
-        for child in self.children:
-            child.setVisible(not self.collapsed)
-            # If expanding and child was collapsed, keep its children hidden
-            if not self.collapsed and child.collapsed:
-                self.hide_all_children(child)
-            
-            # If this child has connections, toggle their visibility too
-            for line, _ in child.connections:
-                line.setVisible(not self.collapsed)
-            
-            # If this child has a parent connection, toggle its visibility
-            if child.parent_connection and child.parent_connection[0]:
-                child.parent_connection[0].setVisible(not self.collapsed)
-    
-    def hide_all_children(self, node):
-        for child in node.children:
-            child.setVisible(False)
-            # Hide connection to parent
-            if child.parent_connection and child.parent_connection[0]:
-                child.parent_connection[0].setVisible(False)
-            # Hide connections to others
-            for line, _ in child.connections:
-                line.setVisible(False)
-            # Recursively hide grandchildren
-            self.hide_all_children(child)
-            
+        view = self.owning_view()
+        if view is None:
+            return  # Not shown, there is nothing to fold yet
+        if view.virtualizer:
+            view.virtualizer.set_collapsed(self.record, self.collapsed)
+            return
+        if self.collapsed:
+            view.fold_children(self)
+        else:
+            view.unfold_children(self)
+        view.mark_layout_dirty(self)
+        view.note_change(self)
+    
     def contextMenuEvent(self, event):
+        view = self.owning_view()
         menu = QMenu()
         
         # Add menu items
         change_color_action = menu.addAction("Change Color")
         change_shape_action = menu.addAction("Toggle Shape")
         change_font_action = menu.addAction("Change Font")
-        add_child_action = menu.addAction("Add Child Node")
+        color_level_action = menu.addAction("Color Level...")
+        color_branch_action = menu.addAction("Color Branch...")
+        reset_colors_action = menu.addAction("Reset Branch Colors")
+        # Virtualized nodes are pooled views of records, structure edits need the full map
+        add_child_action = menu.addAction("Add Child Node") if not view.virtualizer else None
         add_notes_action = menu.addAction("Add/Edit Notes")
         
-        if self.children:
+        if self.record is not None and self.record.children:
             if self.collapsed:
                 collapse_action = menu.addAction("Expand Subtree")
             else:
@@ -196,7 +753,7 @@ class MindMapNode(QGraphicsEllipseItem):
         else:
             collapse_action = None
         
-        delete_action = menu.addAction("Delete Node")
+        delete_action = menu.addAction("Delete Node") if not view.virtualizer else None
         
         # Show the menu and get the selected action
         action = menu.exec_(event.screenPos())
@@ -205,352 +762,1443 @@ class MindMapNode(QGraphicsEllipseItem):
         if action == change_color_action:
             color = QColorDialog.getColor()
             if color.isValid():
-                self.setBrush(QBrush(color))
-                if hasattr(self, 'rect_item') and self.rect_item:
-                    self.rect_item.setBrush(QBrush(color))
+                old_color = self.style.fill
+                self.set_color(color)
+                view.record_edit(PropertyCommand(view, self, "color", old_color, color))
         
         elif action == change_shape_action:
-            if self.node_type == "ellipse":
-                self.node_type = "rectangle"
-                self.rect_item = QGraphicsRectItem(0, 0, self.width, self.height, self)
-                self.rect_item.setBrush(self.brush())
-                self.rect_item.setPen(self.pen())
-                self.setRect(0, 0, 0, 0)  # Hide the ellipse
-            else:
-                self.node_type = "ellipse"
-                if hasattr(self, 'rect_item') and self.rect_item:
-                    self.scene().removeItem(self.rect_item)
-                    self.rect_item = None
-                self.setRect(0, 0, self.width, self.height)
-            
-            # Update connections
-            for line, other_node in self.connections:
-                self.update_connection_line(line, self, other_node)
-            if self.parent_connection and self.parent_connection[0]:
-                parent_line, parent_node = self.parent_connection
-                self.update_connection_line(parent_line, parent_node, self)
+            old_shape = self.node_type
+            self.set_shape("rectangle" if old_shape == "ellipse" else "ellipse")
+            view.record_edit(PropertyCommand(view, self, "shape", old_shape, self.node_type))
         
         elif action == change_font_action:
             font, ok = QFontDialog.getFont(self.text_item.font())
             if ok:
+                old_font = self.text_item.font()
                 self.text_item.setFont(font)
+                view.record_edit(PropertyCommand(view, self, "font", old_font, font))
+        
+        elif action in (color_level_action, color_branch_action):
+            color = QColorDialog.getColor(QColor(self.style.fill))
+            if color.isValid():
+                if action == color_level_action:
+                    view.restyle_level(self.level, color)
+                else:
+                    view.restyle_branch(self, color)
         
-        elif action == add_child_action:
-            view = self.scene().views()[0]
+        elif action == reset_colors_action:
+            view.restyle_branch(self)
+        
+        elif add_child_action and action == add_child_action:
             view.add_child_node(self)
         
         elif action == add_notes_action:
             text, ok = QInputDialog.getMultiLineText(None, "Node Notes", 
                                            "Enter notes for this node:", self.notes)
-            if ok:
+            if ok and text != self.notes:
+                old_notes = self.notes
                 self.notes = text
+                view.index_text(self)
+                view.note_change(self)
+                view.record_edit(PropertyCommand(view, self, "notes", old_notes, text))
         
         elif collapse_action and action == collapse_action:
             self.toggle_collapse()
+            view.record_edit(CollapseCommand(view, self))
         
-        elif action == delete_action:
-            self.delete_node()
+        elif delete_action and action == delete_action:
+            snapshot = view.branch_snapshot(self)
+            self.delete_node(snapshot["index"])
+            view.record_edit(BranchCommand(view, self, "Delete Node", snapshot))
     
-    def delete_node(self):
-        # Delete connections
-        for line, other_node in self.connections:
-            # Remove this connection from the other node's list
-            other_node.connections = [(l, n) for l, n in other_node.connections if n != self]
-            self.scene().removeItem(line)
-        
-        # Delete parent connection if it exists
-        if self.parent_connection and self.parent_connection[0]:
-            parent_line, parent_node = self.parent_connection
-            # Remove this node from parent's children list
-            parent_node.children.remove(self)
-            self.scene().removeItem(parent_line)
-        
-        # Delete all children recursively
-        for child in list(self.children):  # Use list to avoid modification during iteration
-            child.delete_node()
-        
-        # Finally remove this node
-        self.scene().removeItem(self)
+    def delete_node(self, index=None):
+        """Remove this node and its whole branch from the map, see MindMapView.remove_branch"""
+        self.owning_view().remove_branch(self, index)
+
+
+class EditCommand(QUndoCommand):
+    """An edit in MindMapView's undo history, holding only what the edit changed.
+    
+    Commands are recorded once their edit is done, so the redo() that
+    QUndoStack.push() runs straight away has nothing to do.  Subclasses
+    define apply(), which makes the edit again after an undo, and
+    revert(), which undoes it; redo() and undo() call them and then
+    redraw the lines the edit moved. The view owns the history, so
+    commands only keep a weak reference to it.
+    """
+    
+    def __init__(self, view, text):
+        super().__init__(text)
+        self.view_ref = weakref.ref(view)
+        self.done = False
+    
+    @property
+    def view(self):
+        return self.view_ref()
+    
+    def redo(self):
+        if self.done:
+            self.apply()
+            self.view.flush_line_updates()
+        self.done = True
+    
+    def undo(self):
+        self.revert()
+        self.view.flush_line_updates()
+
+
+class MoveCommand(EditCommand):
+    """Nodes moved from one set of positions to another.
+    
+    With carry_branches, each node is moved like a drag and takes its
+    branch along, so only the dragged nodes need to be stored; otherwise
+    every moved node is listed, as by a layout, and moved through
+    MindMapView.move_nodes.
+    """
+    
+    def __init__(self, view, before, after, text="Move", carry_branches=False):
+        super().__init__(view, text)
+        self.before = before
+        self.after = after
+        self.carry_branches = carry_branches
+    
+    def move(self, positions):
+        if self.carry_branches:
+            for node, pos in positions.items():
+                node.setPos(pos)
+        else:
+            self.view.move_nodes(positions)
+            self.view.tidy = None  # The kept layout no longer matches
+    
+    def apply(self):
+        self.move(self.after)
+    
+    def revert(self):
+        self.move(self.before)
+
+
+class BranchCommand(EditCommand):
+    """A node and its branch added to or deleted from the map.
+    
+    The nodes themselves are kept, so later commands can still refer to
+    them; snapshot (see MindMapView.branch_snapshot) describes how the
+    branch was attached and is retaken every time it is removed. index
+    remembers where the branch was put among its siblings, so removing it
+    again need not search the parent's children.
+    """
+    
+    def __init__(self, view, node, text, snapshot=None, index=None):
+        super().__init__(view, text)
+        self.node = node
+        self.snapshot = snapshot  # Set while the branch is deleted
+        self.index = index  # Position among its siblings when last attached, if known
+    
+    def remove(self):
+        self.snapshot = self.view.branch_snapshot(self.node, self.index)
+        self.view.remove_branch(self.node, self.snapshot["index"])  # The node may be folded away
+    
+    def restore(self):
+        self.view.restore_branch(self.snapshot)
+        self.index = self.snapshot["index"]
+        self.snapshot = None
+    
+    def apply(self):
+        if self.snapshot is None:
+            self.remove()
+        else:
+            self.restore()
+    
+    def revert(self):
+        self.apply()  # Adding and deleting are each other's inverse
+
+
+class LinkCommand(EditCommand):
+    """A dashed connection added between two nodes"""
+    
+    def __init__(self, view, node1, node2):
+        super().__init__(view, "Connect Nodes")
+        self.node1 = node1
+        self.node2 = node2
+    
+    def apply(self):
+        self.view.link_nodes(self.node1, self.node2)
+    
+    def revert(self):
+        self.view.unlink_nodes(self.node1, self.node2)
+
+
+class CollapseCommand(EditCommand):
+    """A branch collapsed or expanded"""
+    
+    def __init__(self, view, node):
+        super().__init__(view, "Expand Subtree" if not node.collapsed else "Collapse Subtree")
+        self.node = node
+    
+    def apply(self):
+        self.node.toggle_collapse()
+    
+    def revert(self):
+        self.node.toggle_collapse()
+
+
+class PropertyCommand(EditCommand):
+    """One property of a node changed: "text", "color", "shape", "font" or "notes" """
+    
+    def __init__(self, view, node, name, old, new):
+        super().__init__(view, "Change %s" % name.capitalize())
+        self.node = node
+        self.name = name
+        self.old = old
+        self.new = new
+    
+    def set(self, value):
+        node = self.node
+        if self.name == "text":
+            node.text_item.setPlainText(value)
+        elif self.name == "color":
+            node.set_color(value)
+        elif self.name == "shape":
+            node.set_shape(value)
+        elif self.name == "font":
+            node.text_item.setFont(value)
+        else:
+            setattr(node, self.name, value)
+            self.view.index_text(node)
+        self.view.note_change(node)
+    
+    def apply(self):
+        self.set(self.new)
+    
+    def revert(self):
+        self.set(self.old)
+
+
+class RestyleCommand(EditCommand):
+    """Nodes filled anew at once, their old and new fills by node id, see MindMapView.restyle"""
+    
+    def __init__(self, view, old, new, text="Restyle"):
+        super().__init__(view, text)
+        self.old = old
+        self.new = new
+    
+    def apply(self):
+        self.view.set_fills(self.new)
+    
+    def revert(self):
+        self.view.set_fills(self.old)
+
 
 class MindMapView(QGraphicsView):
+    undo_limit = 1000  # Edits kept in the undo history
+    scene_margin = 0.5  # Room added around the nodes when the scene rect grows, as a fraction of its size
+    scene_shrink = 4.0  # The scene rect shrinks once it is this many times the area it would grow to
+    
     def __init__(self, parent=None):
         super().__init__(parent)
-        self.scene = QGraphicsScene(-5000, -5000, 10000, 10000)
+        self.scene = QGraphicsScene(*FIXED_SCENE_RECT)
         self.setScene(self.scene)
+        self.theme = DEFAULT_THEME  # How nodes and lines look, see set_theme
+        self.edge_layer = EdgeLayer(self.theme)  # Holds every connection line
+        self.scene.addItem(self.edge_layer)
         self.setRenderHint(QPainter.Antialiasing)
         self.setDragMode(QGraphicsView.ScrollHandDrag)
         self.setTransformationAnchor(QGraphicsView.AnchorUnderMouse)
         self.scale_factor = 1.0
         
-        self.nodes = []
+        self.nodes = {}  # node_id -> MindMapNode for every node in the map, in the order added
+        self.node_index = ExtentGrid(256.0)  # Node -> scene bounding box, for hit-tests and the scene rect
+        self.unbounded = True  # The scene rect follows the nodes, see update_scene_rect
+        self.scene_rect_scheduled = False
+        self.unindexed = set()  # Nodes moved, added or removed since the last hit-test
+        self.rubber_band = None  # QRubberBand while shift-dragging a selection
+        self.rubber_band_origin = None
         self.selected_nodes = []  # Stores selected nodes for connecting
-        self.root_node = None
+        self.model = MindMap()  # The map itself, nodes show its records, see bind_records
         self.last_mouse_pos = None
         self.connection_mode = "automatic"  # Can be "automatic", "manual", or "hierarchical"
+        self.pending_lines = {}  # Lines to recompute at the end of the frame
+        self.loader = None  # Running MindMapLoader, if any
+        self.virtualizer = None  # ViewportVirtualizer while in virtualized mode
+        self.node_cache_mode = QGraphicsItem.NoCache  # Of every node in this view, see set_render_caching
+        self.lod_thresholds = dict(DEFAULT_LOD_THRESHOLDS)  # This view's own, see set_lod_thresholds
+        self.layout_mode = "balanced"  # Used by auto_arrange_nodes, see mindmap_layout
+        self.force_thread = None  # Running ForceLayoutThread, if any
+        self.keep_arranged = False  # Re-lay out edited branches after adding, deleting or collapsing
+        self.tidy = None  # TidyLayout of the last arrangement while keep_arranged is on
+        self.layout_nodes = []  # Records by their index in self.tidy
+        self.layout_index = {}
+        self.layout_widths = []
+        self.layout_heights = []
+        self.layout_dirty = set()  # Records whose children changed since the last update_layout
+        self.history = QUndoStack(self)  # EditCommands, see record_edit
+        self.history.setUndoLimit(self.undo_limit)
+        self.drag_start = None  # Positions of the nodes being dragged, when the drag started
+        self.force_start = None  # Positions before the running force layout
+        self.autosave = None  # AutosaveWriter while autosave is on, see enable_autosave
+        self.autosave_dirty = set()  # Nodes changed since the last flush_autosave
+        self.autosave_root = None  # Node id of the root as last journaled
+        self.autosave_timer = QTimer(self)
+        self.autosave_timer.timeout.connect(self.flush_autosave)
+        self.autosave_branches = set()  # Collapsed nodes whose hidden records moved since the last flush
+        self.retired = weakref.WeakValueDictionary()  # node_id -> MindMapNode of a hidden record still referred to
+        self.search_index = SearchIndex()  # Text and notes by node id, records in virtualized mode, see find
+        self.search_dirty = set()  # Nodes, or records, to reindex at the next search, see index_text
+        self.search_query = ""  # Last query of find_next, with its results
+        self.search_fuzzy = False
+        self.search_results = []
+        self.search_position = -1
+        self.profile_overlay = False  # Draw PROFILER's numbers over the map, see set_performance_overlay
+        self.frame_timer = None  # FrameTimer on the viewport while profiling
+        self.overlay_timer = QTimer(self)  # Keeps the overlay current while nothing else repaints
+        self.update_mode = self.viewportUpdateMode()  # To go back to when the overlay is hidden
+        self.overview = None  # OverviewMap showing this view, see set_overview
+        self.overlay_timer.timeout.connect(self.viewport().update)
         
         self.setContextMenuPolicy(Qt.CustomContextMenu)
         self.customContextMenuRequested.connect(self.show_context_menu)
     
+    @property
+    def root_node(self):
+        """The node showing the model's root, None without one"""
+        root = self.model.root
+        return root.item if root is not None else None
+    
+    def set_render_caching(self, enabled, cache_limit_kb=64 * 1024):
+        """Keep every node and its text in a device-coordinate pixmap cache.
+        
+        Panning and dragging then mostly blit the cached pixmaps; Qt redraws
+        a node's cache when the node changes (text, font, colour, shape,
+        size or selection) and when the zoom level does. Node text is drawn
+        from the bitmaps shared through QPixmapCache, whose limit is raised
+        to cache_limit_kb. Off by default: the caches cost memory for every
+        node shown.
+        """
+        self.node_cache_mode = QGraphicsItem.DeviceCoordinateCache if enabled else QGraphicsItem.NoCache
+        if enabled:
+            QPixmapCache.setCacheLimit(max(QPixmapCache.cacheLimit(), cache_limit_kb))
+        # Nodes joining the view later pick the mode up in itemChange
+        for item in self.scene.items():
+            if isinstance(item, MindMapNode):
+                item.set_cache_mode(self.node_cache_mode)
+        self.scene.update()
+    
+    def set_lod_thresholds(self, **thresholds):
+        """Change the zoom levels at which drawing is simplified, see DEFAULT_LOD_THRESHOLDS"""
+        unknown = set(thresholds) - set(DEFAULT_LOD_THRESHOLDS)
+        if unknown:
+            raise ValueError("Unknown level-of-detail thresholds: %s" % ", ".join(sorted(unknown)))
+        self.lod_thresholds.update(thresholds)
+        self.resetCachedContent()
+        if self.node_cache_mode != QGraphicsItem.NoCache:
+            # Cached nodes were drawn with the old thresholds
+            for item in self.scene.items():
+                if isinstance(item, (MindMapNode, NodeTextItem)):
+                    item.update()
+        self.scene.update()
+    
+    def set_theme(self, theme, recolor=False):
+        """Draw the map in a Theme, or the one of that name in THEMES (see mindmap_style).
+        
+        Nodes keep their fills unless recolor gives every node the fill of
+        its level in the new theme, as one undoable edit. Each node only
+        takes from its new style what differs from the old one, and the
+        view repaints once for all of them.
+        """
+        if isinstance(theme, str):
+            theme = THEMES[theme]
+        self.theme = theme
+        self.edge_layer.theme = theme
+        self.scene.setBackgroundBrush(theme.background_brush())
+        # Pooled items of virtualized mode as well
+        for item in self.scene.items():
+            if isinstance(item, MindMapNode):
+                item.set_style(theme.style(item.style.fill))
+        self.edge_layer.update()
+        if recolor:
+            self.restyle(self.restyle_targets(), text="Apply Theme")
+        elif self.virtualizer:
+            self.virtualizer.invalidate()
+    
+    def restyle_targets(self, nodes=None):
+        """Yield (key, level) for the branches of nodes (the whole map by default), hidden records included.
+        
+        Keys are node ids; in virtualized mode they are the records, nodes
+        being their pooled items.
+        """
+        if nodes is None:
+            records = self.model.records.values()
+        else:
+            records = [record for node in nodes for record in [node.record] + node.record.descendants()]
+        virtualized = bool(self.virtualizer)
+        for record in records:
+            yield record if virtualized else record.node_id, record.level
+    
+    def restyle_level(self, level, fill=None):
+        """Fill every node of a hierarchy level, hidden ones included, or with the theme's fill"""
+        self.restyle(self.restyle_targets(), fill, "Color Level", level)
+    
+    def restyle_branch(self, node, fill=None):
+        """Fill a node and its whole branch, or give each the theme's fill for its level"""
+        self.restyle(self.restyle_targets([node]), fill, "Color Branch" if fill is not None else "Reset Colors")
+    
+    def restyle(self, targets, fill=None, text="Restyle", level=None):
+        """Fill the (key, level) targets of restyle_targets, as one undoable edit.
+        
+        Without a fill each target gets the theme's fill for its level; with
+        a level only the targets on that level are filled.
+        """
+        theme = self.theme
+        if fill is not None:
+            fill = theme.style(fill).fill
+        fills = {key: fill or theme.fill_for(key_level) for key, key_level in targets
+                 if level is None or key_level == level}
+        old = self.set_fills(fills)
+        if old:
+            self.record_edit(RestyleCommand(self, old, {key: fills[key] for key in old}, text))
+    
+    def set_fills(self, fills):
+        """Fill nodes by node id, or records in virtualized mode, and return the old fills of those changed.
+        
+        Hidden records take their fill straight away, the view and the
+        overview repaint once.
+        """
+        theme = self.theme
+        old = {}
+        if self.virtualizer:
+            for record, fill in fills.items():
+                if record.color != fill:
+                    old[record] = record.color
+                    record.color = fill
+                    if record.item is not None:
+                        record.item.set_style(theme.style(fill))
+            self.virtualizer.invalidate()
+        else:
+            records = self.model.records
+            branches = set()  # Shown nodes above the hidden records filled
+            for node_id, fill in fills.items():
+                record = records.get(node_id)
+                if record is None:
+                    continue
+                node = record.item
+                if node is not None:
+                    if node.style.fill != fill:
+                        old[node_id] = node.style.fill
+                        node.set_style(theme.style(fill))
+                        self.note_change(node)
+                elif record.color != fill:
+                    old[node_id] = record.color
+                    record.color = fill
+                    while record is not None and record.item is None:
+                        record = record.parent
+                    if record is not None:
+                        branches.add(record.item)
+            for node in branches:
+                self.note_change(node, branch=True)
+        if old:
+            self.overview_changed(None)
+        return old
+    
+    def set_profiling(self, enabled, tracing=True):
+        """Count and time the editor's hot paths, see PROFILER, and this view's frames.
+        
+        Profiling is shared by every view, as the hot paths are methods of
+        the item and view classes. Switching it on starts from zero.
+        """
+        if enabled:
+            PROFILER.reset()
+            PROFILER.enable(tracing)
+            if self.frame_timer is None:
+                self.frame_timer = FrameTimer(self)
+                self.viewport().installEventFilter(self.frame_timer)
+        else:
+            PROFILER.disable()
+            self.set_performance_overlay(False)
+            if self.frame_timer is not None:
+                self.viewport().removeEventFilter(self.frame_timer)
+                self.frame_timer.deleteLater()
+                self.frame_timer = None
+    
+    def set_performance_overlay(self, visible):
+        """Show the profiling numbers in the corner of the view, profiling as needed.
+        
+        The viewport is repainted whole while the overlay shows, scrolled or
+        partly repainted pixels would smear it, so frames take longer.
+        """
+        if visible and (not PROFILER.enabled or self.frame_timer is None):
+            self.set_profiling(True)
+        if visible != self.profile_overlay:
+            self.profile_overlay = visible
+            if visible:
+                self.update_mode = self.viewportUpdateMode()
+                self.setViewportUpdateMode(QGraphicsView.FullViewportUpdate)
+                self.overlay_timer.start(500)
+            else:
+                self.setViewportUpdateMode(self.update_mode)
+                self.overlay_timer.stop()
+        self.viewport().update()
+    
+    def set_overview(self, visible):
+        """Show an OverviewMap of the whole map in the bottom right corner of the view"""
+        if visible and self.overview is None:
+            OverviewMap(self, self)
+            self.place_overview()
+        if self.overview is not None:
+            self.overview.setVisible(visible)
+    
+    def place_overview(self):
+        if self.overview is not None and self.overview.parent() is self:
+            area = self.viewport().geometry()
+            size = self.overview.size()
+            self.overview.move(area.right() - size.width() - 8, area.bottom() - size.height() - 8)
+    
+    def overview_changed(self, rect):
+        """The map changed inside a scene rect (anywhere for None), redraw that part of the overview"""
+        if self.overview:
+            self.overview.invalidate(rect)
+    
+    def overview_boxes(self, rect):
+        """The shown nodes in a scene rect as {colour: [QRectF]}, for an OverviewMap"""
+        boxes = {}
+        if self.virtualizer:
+            for record in self.virtualizer.grid.query(rect.x(), rect.y(), rect.width(), rect.height()):
+                if not record.hidden:
+                    boxes.setdefault(record.color, []).append(QRectF(record.x, record.y, record.width, record.height))
+            return boxes
+        self.sync_node_index()
+        for node in self.node_index.query(rect.x(), rect.y(), rect.width(), rect.height()):
+            if node.isVisible():
+                boxes.setdefault(node.style.fill, []).append(node.sceneBoundingRect())
+        return boxes
+    
+    def overview_lines(self, rect):
+        """The solid and the dashed connections crossing a scene rect, as QLineFs, for an OverviewMap"""
+        if not self.virtualizer:
+            return self.edge_layer.lines_in(rect)
+        solid, dashed = [], []
+        for edge in self.virtualizer.edges_in(rect.x(), rect.y(), rect.width(), rect.height()):
+            if not edge[0].hidden and not edge[1].hidden:
+                (dashed if edge[2] else solid).append(QLineF(*(edge[0].center() + edge[1].center())))
+        return solid, dashed
+    
+    def export_trace(self, file_path):
+        """Save the calls traced while profiling as a Chrome trace JSON file"""
+        PROFILER.write_trace(file_path)
+    
+    def queue_line_update(self, line, from_node, to_node):
+        """Recompute a connection line once per frame instead of once per move"""
+        if not self.pending_lines:
+            QTimer.singleShot(0, self.flush_line_updates)
+        self.pending_lines[line] = (from_node, to_node)
+    
+    def flush_line_updates(self):
+        """Recompute all queued connection lines"""
+        pending, self.pending_lines = self.pending_lines, {}
+        if sip.isdeleted(self.edge_layer):
+            return  # A scene.clear() took the lines and their nodes with it
+        self.update_lines((line, from_node, to_node) for line, (from_node, to_node) in pending.items())
+        self.edge_layer.flush()
+    
+    def update_lines(self, lines):
+        """Recompute many (line, from_node, to_node) connection lines in one pass.
+        
+        Each node's outline is read once, however many lines it has, and
+        edge_lines computes all the endpoints together.
+        """
+        rows, row_of, pairs, edges = [], {}, [], []
+        for line, from_node, to_node in lines:
+            if not line.alive():
+                continue
+            for node in (from_node, to_node):
+                if node not in row_of:
+                    row_of[node] = len(rows)
+                    rows.append(node.outline())
+            pairs.append((row_of[from_node], row_of[to_node]))
+            edges.append(line)
+        if edges:
+            self.edge_layer.set_lines(edges, edge_lines(rows, pairs))
+    
+    def index_node(self, node):
+        """Note that a node moved or changed scene, node_index catches up at the next query"""
+        self.unindexed.add(node)
+        self.schedule_scene_rect()
+        if self.overview:
+            self.overview.schedule_refresh()  # Which catches node_index up
+    
+    def set_unbounded_canvas(self, enabled):
+        """Let the scene rect follow the nodes (the default), or fix it at FIXED_SCENE_RECT"""
+        self.unbounded = enabled
+        if enabled:
+            self.update_scene_rect()
+        else:
+            self.scene.setSceneRect(*FIXED_SCENE_RECT)
+    
+    def schedule_scene_rect(self):
+        """Fit the scene rect to the nodes once the current event is handled"""
+        if self.unbounded and not self.scene_rect_scheduled:
+            self.scene_rect_scheduled = True
+            QTimer.singleShot(0, self.update_scene_rect)
+    
+    def update_scene_rect(self):
+        """Grow or shrink the scene rect to cover the nodes and the visible area.
+        
+        The node extent comes from node_index (the virtualizer's grid in
+        virtualized mode), which keeps it up to date as nodes move, so this
+        costs the nodes moved since the last hit-test rather than the size
+        of the map. Qt rebuilds its item index for every new scene rect, so
+        the rect grows with scene_margin to spare and only shrinks once it
+        is scene_shrink times too big. Drags are caught up with on release.
+        """
+        self.scene_rect_scheduled = False
+        if not self.unbounded or self.drag_start is not None:
+            return
+        if self.virtualizer:
+            extent = self.virtualizer.grid.extent()
+        else:
+            self.sync_node_index()
+            extent = self.node_index.extent()
+        needed = self.mapToScene(self.viewport().rect()).boundingRect()
+        if extent is not None:
+            needed = needed.united(QRectF(*extent))
+        margin = max(needed.width(), needed.height()) * self.scene_margin
+        needed.adjust(-margin, -margin, margin, margin)
+        current = self.scene.sceneRect()
+        if current.contains(needed) and (current.width() * current.height()
+                                         <= self.scene_shrink * needed.width() * needed.height()):
+            return
+        self.scene.setSceneRect(needed)
+    
+    def centerOn(self, *args):
+        # Nodes may have just moved outside the scene rect, which limits scrolling
+        if self.scene_rect_scheduled:
+            self.update_scene_rect()
+        super().centerOn(*args)
+    
+    def sync_node_index(self):
+        """Bring node_index up to date with the nodes changed since the last query.
+        
+        Each changed node is reindexed once, however often it moved, so
+        dragging a big branch costs nothing here until the next hit-test.
+        Nodes deleted meanwhile, by a scene.clear() for one, just leave it.
+        """
+        index = self.node_index
+        overview = self.overview
+        for node in self.unindexed:
+            if overview and node in index:
+                overview.invalidate(QRectF(*index.boxes[node]))
+            if not sip.isdeleted(node) and node.scene() is self.scene:
+                rect = node.sceneBoundingRect()
+                index.move(node, rect.x(), rect.y(), rect.width(), rect.height())
+                if overview:
+                    overview.invalidate(rect)
+            else:
+                index.remove(node)
+        self.unindexed.clear()
+    
+    def node_at(self, scene_pos):
+        """Return the topmost visible node whose shape contains a scene point, or None.
+        
+        Goes through node_index instead of the scene's item index, so the
+        cost does not depend on the size of the map.
+        """
+        self.sync_node_index()
+        x, y = scene_pos.x(), scene_pos.y()
+        hits = [node for node in self.node_index.query(x, y, 0, 0)
+                if node.isVisible() and node.contains(node.mapFromScene(scene_pos))]
+        # Later nodes are stacked above earlier ones
+        return max(hits, key=lambda node: (node.zValue(), node.node_id), default=None)
+    
+    def nodes_in_rect(self, rect):
+        """Return the visible nodes whose bounding boxes intersect a scene rectangle"""
+        self.sync_node_index()
+        return [node for node in self.node_index.query(rect.x(), rect.y(), rect.width(), rect.height())
+                if node.isVisible()]
+    
+    def nearest_node(self, scene_pos, max_distance=None):
+        """Return the visible node closest to a scene point, or None if none is within max_distance"""
+        self.sync_node_index()
+        return self.node_index.nearest(scene_pos.x(), scene_pos.y(), max_distance,
+                                       accept=lambda node: node.isVisible())
+    
+    def index_text(self, node):
+        """Note that a node's text or notes changed, or that it joined or left the map.
+        
+        search_index catches up at the next search. In virtualized mode
+        the node's record is noted instead, as the pooled node may show
+        another record by then.
+        """
+        if not self.virtualizer:
+            self.search_dirty.add(node)
+        elif node.record is not None:  # Pooled items join the scene unbound
+            self.search_dirty.add(node.record)
+    
+    def sync_search_index(self):
+        """Bring search_index up to date with the nodes noted by index_text.
+        
+        Nodes whose text and notes did not change cost a comparison. Records
+        hidden below a node are indexed when the node joins the index and
+        leave it with the node; folding and unfolding keep the node ids, so
+        the entries stay as they are.
+        """
+        index = self.search_index
+        for item in self.search_dirty:
+            if isinstance(item, NodeRecord):
+                node = item.item  # Newer than the record while bound
+                index.add(item, *((node.text_item.toPlainText(), node.notes) if node else (item.text, item.notes)))
+            elif self.nodes.get(item.node_id) is item:
+                joined = item.node_id not in index
+                index.add(item.node_id, item.text_item.toPlainText(), item.notes)
+                if joined:
+                    for record in item.hidden_records():
+                        index.add(record.node_id, record.text, record.notes)
+            else:
+                # Deleted, with any records hidden below it
+                index.remove(item.node_id)
+                for record in item.hidden_records():
+                    index.remove(record.node_id)
+        self.search_dirty.clear()
+    
+    def find(self, query, fuzzy=False, limit=None):
+        """Return the nodes whose text or notes match query, best first, see mindmap_search.
+        
+        Nodes are given by node id, or as NodeRecords in virtualized mode,
+        and include the ones hidden under collapsed nodes; fuzzy also
+        matches words one typo away. show_search_result brings a node
+        into view.
+        """
+        self.sync_search_index()
+        return self.search_index.search(query, fuzzy, limit)
+    
+    def find_next(self, query=None, fuzzy=False):
+        """Show the next node matching query, or the last query if None.
+        
+        Returns the node id (or record) shown, None when nothing matches.
+        """
+        if query is not None:
+            self.search_query, self.search_fuzzy = query, fuzzy
+            self.search_results = self.find(query, fuzzy)
+            self.search_position = -1
+        # Results deleted since the search are skipped
+        for _ in range(len(self.search_results)):
+            self.search_position = (self.search_position + 1) % len(self.search_results)
+            key = self.search_results[self.search_position]
+            if self.show_search_result(key):
+                return key
+        return None
+    
+    def show_search_result(self, key):
+        """Expand the collapsed ancestors of a node found by find, then select it and centre on it.
+        
+        The expanding is one undo step. Returns False if the node is no
+        longer in the map.
+        """
+        if self.virtualizer:
+            self.virtualizer.reveal(key)
+            self.centerOn(*key.center())
+            self.virtualizer.refresh()
+            node = key.item  # None if too crowded to bind items
+        else:
+            node = self.nodes.get(key)
+            if node is None:
+                path = self.folded_path(key)
+                if path is None:
+                    return False
+                self.history.beginMacro("Show Search Result")
+                for ancestor in path:
+                    item = self.nodes[ancestor.node_id]
+                    if item.collapsed:
+                        item.toggle_collapse()
+                        self.record_edit(CollapseCommand(self, item))
+                self.history.endMacro()
+                node = self.nodes[key]
+            self.centerOn(node)
+        self.scene.clearSelection()
+        if node is not None:
+            node.setSelected(True)
+        return True
+    
+    def folded_path(self, node_id):
+        """The records to expand to show a hidden record, top first, or None if no record has node_id"""
+        record = self.model.records.get(node_id)
+        if record is None:
+            return None
+        path = []
+        while record.hidden:
+            record = record.parent
+            path.append(record)
+        return path[::-1]
+    
+    @staticmethod
+    def ancestor_in(node, nodes):
+        """Whether any ancestor of node is in nodes"""
+        while node.parent_connection:
+            node = node.parent_connection[1]
+            if node in nodes:
+                return True
+        return False
+    
+    def record_edit(self, command):
+        """Add a finished edit to the undo history (virtualized maps keep none)"""
+        if not self.virtualizer:
+            self.history.push(command)
+    
+    def undo(self):
+        self.history.undo()
+    
+    def redo(self):
+        self.history.redo()
+    
+    def branch_snapshot(self, node, index=None):
+        """Describe how a node's branch is attached, for restore_branch after delete_node.
+        
+        See MindMap.branch_snapshot; index is where the node is likely
+        found among its siblings.
+        """
+        return self.model.branch_snapshot(node.record, index)
+    
+    def restore_branch(self, snapshot):
+        """Put a branch removed by delete_node back, as described by branch_snapshot.
+        
+        The branch's nodes are shown again, down to its collapsed nodes.
+        """
+        self.model.restore_branch(snapshot)
+        record, parent = snapshot["record"], snapshot["parent"]
+        if parent is not None and parent.item is not None:
+            self.mark_layout_dirty(parent.item)
+        if record.hidden:
+            self.note_hidden_branch(record)
+        shown = []
+        for member in [record] + record.descendants():
+            if not member.hidden:
+                shown.append(member)
+            elif member.item is not None:
+                # Collapsed above meanwhile
+                self.retired[member.node_id] = member.item
+                member.item = None
+        self.bind_records(shown)
+    
+    def store_nodes(self, nodes):
+        """Copy what was edited through nodes, positions included, back into the model.
+        
+        Hidden records below collapsed nodes move along, see MindMap.move.
+        """
+        move = self.model.move
+        for node in nodes:
+            node.store_record()
+            pos = node.pos()
+            move(node.record, pos.x(), pos.y())
+    
+    def bind_records(self, records):
+        """Show records of the model with MindMapNodes, in any order.
+        
+        Records shown before get the same MindMapNode back, either their
+        item or one retired by fold_children. Lines are drawn to the nodes
+        already shown. Returns the nodes.
+        """
+        retired = self.retired
+        shown = self.nodes
+        nodes = []
+        for record in records:
+            node = record.item
+            if node is None:
+                node = retired.pop(record.node_id, None)
+                if node is None:
+                    node = MindMapNode.from_record(record)
+                else:
+                    node.bind_record(record)
+            node.connections = {}
+            node.parent_connection = None
+            self.scene.addItem(node)
+            shown[record.node_id] = node
+            parent = record.parent
+            if parent is not None and parent.item is not None and shown.get(parent.node_id) is parent.item:
+                self.link_child(parent.item, node)
+            if not record.collapsed:
+                for child in record.children:
+                    if child.item is not None and shown.get(child.node_id) is child.item:
+                        self.link_child(node, child.item)
+            nodes.append(node)
+        self.draw_links(nodes)
+        return nodes
+    
+    def draw_links(self, nodes):
+        """Draw the dashed connections of nodes just bound whose other end is shown"""
+        batch = set(nodes)
+        for node in nodes:
+            for other in node.record.links:
+                other_node = other.item
+                if other_node is None or self.nodes.get(other.node_id) is not other_node:
+                    continue
+                if other_node in batch and other.node_id < node.node_id:
+                    continue  # Drawn from the other end
+                self.draw_link(node, other_node)
+    
+    def fold_children(self, node):
+        """Hide everything shown below a node being collapsed.
+        
+        Costs the number of nodes shown below node, branches that were
+        already collapsed stay as they are. The records stay in the model;
+        their MindMapNodes are dropped unless something else, like the undo
+        history, still refers to them, and unfold_children then brings back
+        those same nodes.
+        """
+        self.flush_autosave()  # Pending edits of the nodes about to go
+        self.sync_search_index()
+        items = node.subtree_nodes()
+        self.store_nodes(items + [node])
+        self.model.set_collapsed(node.record, True)
+        branch = set(items)
+        for item in items:
+            item.parent_connection[0].remove()
+            for line, other_node in item.connections.items():
+                if line.alive():  # Lines inside the branch come up twice
+                    line.remove()
+                    if other_node not in branch:
+                        del other_node.connections[line]
+        for item in items:
+            del self.nodes[item.node_id]
+            self.retired[item.node_id] = item
+            item.record.item = None
+            item.connections, item.parent_connection = {}, None
+            self.scene.removeItem(item)
+            # The records hold the same data
+            self.autosave_dirty.discard(item)
+            self.autosave_branches.discard(item)
+            self.search_dirty.discard(item)
+        self.sync_node_index()  # Lets go of the removed items
+    
+    def unfold_children(self, node):
+        """Show the records below a node being expanded.
+        
+        Only the newly shown nodes are built, down to the next collapsed
+        ones.
+        """
+        self.store_nodes([node])  # The hidden records follow the node's last moves
+        items = self.bind_records(self.model.set_collapsed(node.record, False))
+        moved = node in self.autosave_branches
+        self.autosave_branches.discard(node)
+        for item in items:
+            if moved:
+                # Journal the new nodes where they are now
+                if item.collapsed and item.record.children:
+                    self.autosave_branches.add(item)
+            else:
+                self.autosave_dirty.discard(item)
+                self.autosave_branches.discard(item)
+    
+    def remove_branch(self, node, index=None):
+        """Remove a node, everything below it and every line touching them.
+        
+        Costs O(branch size + lines touching the branch): the model drops
+        the branch's records (see MindMap.remove_branch), lines are dict
+        entries on both ends, and the nodes leave the registry, the
+        hit-test index and the scene in one pass. The nodes keep their
+        records, restore_branch shows them again. Qt has no call to remove
+        many items at once, so the scene still gets one removeItem per node.
+        A node folded away below a collapsed one only leaves the model.
+        """
+        if node.record.hidden:
+            self.note_hidden_branch(node.record, removed=True)
+            self.note_change(node)  # Not in the scene, so journaled as removed
+            self.model.remove_branch(node.record, index)
+            return
+        branch = [node] + node.subtree_nodes()
+        self.store_nodes(branch)
+        parent_node = node.parent_connection[1] if node.parent_connection else None
+        self.model.remove_branch(node.record, index)
+        members = set(branch)
+        if parent_node is not None:
+            node.parent_connection[0].remove()
+            self.mark_layout_dirty(parent_node)
+            self.note_change(parent_node)
+        for member in branch:
+            if member is not node:
+                member.parent_connection[0].remove()
+            for line, other_node in member.connections.items():
+                line.remove()
+                if other_node not in members:
+                    del other_node.connections[line]
+                    self.note_change(other_node)
+        
+        # itemChange takes the nodes out of the hit-test index and into the autosave
+        remove_item = self.scene.removeItem
+        for member in branch:
+            del self.nodes[member.node_id]
+            remove_item(member)
+    
+    def note_hidden_branch(self, record, removed=False):
+        """Journal and index a branch added below a collapsed node, or about to be removed from there.
+        
+        Only the model shows such records. The autosave journals them
+        with the nearest shown ancestor, search_index takes them directly.
+        """
+        shown = record.parent
+        while shown.hidden:
+            shown = shown.parent
+        self.note_change(shown.item, branch=True)
+        for member in [record] + record.descendants():
+            if removed:
+                self.search_index.remove(member.node_id)
+            else:
+                self.search_index.add(member.node_id, member.text, member.notes)
+    
+    def unlink_nodes(self, node1, node2):
+        """Remove the dashed connection between two nodes"""
+        self.model.unlink(node1.record, node2.record)
+        for line, other_node in node1.connections.items():
+            if other_node is node2:
+                del node1.connections[line]
+                del node2.connections[line]
+                line.remove()
+                self.note_change(node1)
+                self.note_change(node2)
+                return
+    
     def add_node(self):
         # Get the center of the current view
         view_center = self.mapToScene(self.viewport().rect().center())
         x, y = view_center.x(), view_center.y()
         
-        node = MindMapNode(x, y)
-        self.scene.addItem(node)
-        self.nodes.append(node)
-        
-        # If no root node exists, set this as the root
-        if not self.root_node:
-            self.root_node = node
+        # If no root node exists, this becomes the root
+        if self.model.root is None:
             # Make the root node a bit special - different color and size
-            node.setBrush(QBrush(Qt.green))
-            node.setRect(0, 0, 120, 80)
-            node.width = 120
-            node.height = 80
-            
-            # Update text position
-            text_x = -node.text_item.boundingRect().width() / 2 + node.width / 2
-            text_y = -node.text_item.boundingRect().height() / 2 + node.height / 2
-            node.text_item.setPos(text_x, text_y)
-            
-            # Set default text for root node
-            node.text_item.setPlainText("Main Topic")
+            record = self.model.add_node(x, y, "Main Topic", color=self.theme.fill_for(0), width=120, height=80)
+        else:
+            record = self.model.add_node(x, y)
+        node, = self.bind_records([record])
         
+        self.record_edit(BranchCommand(self, node, "Add Node"))
         return node
     
     def add_child_node(self, parent_node, text="New Idea"):
         # Calculate position for the new node
         parent_pos = parent_node.scenePos()
+        siblings = len(parent_node.record.children)
         
         # Determine if we should place it horizontally or vertically based on level
         if parent_node.level == 0:  # Root level, place children horizontally
             offset_x = 200
-            offset_y = (len(parent_node.children) - len(parent_node.children) / 2) * 100
+            offset_y = (siblings - siblings / 2) * 100
             x = parent_pos.x() + offset_x
             y = parent_pos.y() + offset_y
         else:  # Non-root level, place children vertically in a cascading manner
             offset_x = 180
-            offset_y = 80 + len(parent_node.children) * 20
+            offset_y = 80 + siblings * 20
             x = parent_pos.x() + offset_x
             y = parent_pos.y() + offset_y
         
-        # Create the new node
-        child_node = MindMapNode(x, y, text)
-        child_node.level = parent_node.level + 1
-        
-        # Make visually distinct based on level
-        color_map = {
-            0: Qt.green,
-            1: Qt.yellow,
-            2: QColor(255, 200, 100),  # Orange
-            3: QColor(100, 200, 255),  # Light blue
-            4: QColor(200, 150, 255),  # Purple
-        }
-        
-        # If level is beyond our map, use a random color
-        if child_node.level >= len(color_map):
-            color = QColor(random.randint(100, 255), random.randint(100, 255), random.randint(100, 255))
-        else:
-            color = color_map[child_node.level]
-        
-        child_node.setBrush(QBrush(color))
-        
-        # Adjust size based on level
-        if child_node.level == 1:
-            width, height = 100, 60
+        # Create the new node, visually distinct based on level and sized by it
+        level = parent_node.level + 1
+        width, height = (100, 60) if level == 1 else (90, 50)
+        record = self.model.add_node(x, y, text, parent_node.record, color=self.theme.fill_for(level),
+                                     width=width, height=height)
+        if record.hidden:
+            # Under a collapsed parent the child stays folded away, like the rest of the branch
+            child_node = MindMapNode.from_record(record)
+            record.item = None
+            self.retired[record.node_id] = child_node
+            self.note_hidden_branch(record)
         else:
-            width, height = 90, 50
-        
-        child_node.setRect(0, 0, width, height)
-        child_node.width = width
-        child_node.height = height
-        
-        # Update text position
-        text_x = -child_node.text_item.boundingRect().width() / 2 + width / 2
-        text_y = -child_node.text_item.boundingRect().height() / 2 + height / 2
-        child_node.text_item.setPos(text_x, text_y)
-        
-        self.scene.addItem(child_node)
-        self.nodes.append(child_node)
-        
-        # Connect to parent
-        line = QGraphicsLineItem()
-        line.setPen(QPen(Qt.black, 2, Qt.SolidLine))
-        self.scene.addItem(line)
-        
-        # Update line position
-        child_node.update_connection_line(line, parent_node, child_node)
-        
-        # Set up parent-child relationship
-        parent_node.children.append(child_node)
-        child_node.parent_connection = (line, parent_node)
-        
-        # If parent is collapsed, hide the child
-        if parent_node.collapsed:
-            child_node.setVisible(False)
-            line.setVisible(False)
+            child_node, = self.bind_records([record])
+        self.mark_layout_dirty(parent_node)
+        self.record_edit(BranchCommand(self, child_node, "Add Child Node", index=siblings))
         
         return child_node
     
+    def create_connection_line(self, from_node, to_node, style=Qt.SolidLine):
+        """Add a connection line between two nodes to the edge layer"""
+        line = self.edge_layer.add(EdgeLayer.DASHED if style == Qt.DashLine else EdgeLayer.SOLID)
+        from_node.update_connection_line(line, from_node, to_node)
+        return line
+    
+    def link_child(self, parent_node, child_node):
+        """Draw the solid line from a node to a child in the model"""
+        line = self.create_connection_line(parent_node, child_node, Qt.SolidLine)
+        child_node.parent_connection = (line, parent_node)
+        self.note_change(parent_node)
+        return line
+    
+    def link_nodes(self, node1, node2):
+        """Add a non-hierarchical (dashed) connection between two nodes"""
+        self.model.link(node1.record, node2.record)
+        return self.draw_link(node1, node2)
+    
+    def draw_link(self, node1, node2):
+        """Draw the dashed line of a connection in the model"""
+        line = self.create_connection_line(node1, node2, Qt.DashLine)
+        node1.connections[line] = node2
+        node2.connections[line] = node1
+        self.note_change(node1)
+        self.note_change(node2)
+        return line
+    
     def connect_nodes(self):
         if self.connection_mode == "manual" and len(self.selected_nodes) == 2:
             node1, node2 = self.selected_nodes
-            line = QGraphicsLineItem()
-            line.setPen(QPen(Qt.black, 2, Qt.DashLine))  # Dashed line for non-hierarchical connections
-            self.scene.addItem(line)
-            
-            # Set the line position
-            node1.update_connection_line(line, node1, node2)
-            
-            # Add to connections
-            node1.connections.append((line, node2))
-            node2.connections.append((line, node1))
+            if self.virtualizer:
+                self.virtualizer.link(node1.record, node2.record)
+            else:
+                self.link_nodes(node1, node2)
+                self.record_edit(LinkCommand(self, node1, node2))
             
+            for node in self.selected_nodes:
+                node.set_highlighted(False)
             self.selected_nodes.clear()
     
     def show_context_menu(self, position):
         # Convert position to scene coordinates
         scene_pos = self.mapToScene(position)
         
-        # Check if there's an item at this position
-        item = self.scene.itemAt(scene_pos, self.transform())
+        # Check if there's a node at this position
+        item = self.node_at(scene_pos)
         
-        # If there's no item, show the scene context menu
-        if not item or not isinstance(item, MindMapNode):
+        # If there's no node, show the scene context menu
+        if item is None:
             menu = QMenu()
-            add_node_action = menu.addAction("Add New Node")
-            add_central_action = menu.addAction("Add Central Topic")
-            
-            if self.nodes:  # Only show if there are nodes to arrange
-                arrange_action = menu.addAction("Auto-Arrange Nodes")
+            if self.virtualizer:
+                add_node_action = add_central_action = None
             else:
-                arrange_action = None
+                add_node_action = menu.addAction("Add New Node")
+                add_central_action = menu.addAction("Add Central Topic")
+            
+            arrange_actions = {}
+            if self.nodes and not self.virtualizer:  # Only show if there are nodes to arrange
+                arrange_menu = menu.addMenu("Auto-Arrange Nodes")
+                for mode, label in zip(LAYOUT_MODES, ("Balanced", "Left to Right", "Radial")):
+                    arrange_action = arrange_menu.addAction(label)
+                    arrange_action.setCheckable(True)
+                    arrange_action.setChecked(mode == self.layout_mode)
+                    arrange_actions[arrange_action] = mode
+                arrange_menu.addSeparator()
+                keep_action = arrange_menu.addAction("Keep Arranged After Edits")
+                keep_action.setCheckable(True)
+                keep_action.setChecked(self.keep_arranged)
+                arrange_actions[keep_action] = "keep"
+                if ForceLayout is not None:
+                    force_action = arrange_menu.addAction("Force-Directed (Untangle Connections)")
+                    arrange_actions[force_action] = None
+            
+            theme_menu = menu.addMenu("Theme")
+            theme_actions = {}
+            for name, theme in THEMES.items():
+                theme_action = theme_menu.addAction(name)
+                theme_action.setCheckable(True)
+                theme_action.setChecked(theme is self.theme)
+                theme_actions[theme_action] = theme
+            
+            virtualize_action = menu.addAction("Virtualized Mode (Large Maps)")
+            virtualize_action.setCheckable(True)
+            virtualize_action.setChecked(self.virtualizer is not None)
+            
+            overlay_action = menu.addAction("Performance Overlay")
+            overlay_action.setCheckable(True)
+            overlay_action.setChecked(self.profile_overlay)
+            trace_action = menu.addAction("Export Performance Trace...") if PROFILER.tracing else None
+            overview_action = menu.addAction("Overview Map")
+            overview_action.setCheckable(True)
+            overview_action.setChecked(self.overview is not None and self.overview.isVisible())
                 
             action = menu.exec_(self.mapToGlobal(position))
             
-            if action == add_node_action:
-                node = MindMapNode(scene_pos.x(), scene_pos.y())
-                self.scene.addItem(node)
-                self.nodes.append(node)
+            if action is None:
+                return
+            
+            if action == virtualize_action:
+                self.set_virtualized(action.isChecked())
+            
+            elif action == overlay_action:
+                self.set_performance_overlay(action.isChecked())
+            
+            elif action == overview_action:
+                self.set_overview(action.isChecked())
+            
+            elif action in theme_actions:
+                self.set_theme(theme_actions[action], recolor=True)
+            
+            elif action == trace_action:
+                file_path, _ = QFileDialog.getSaveFileName(self, "Export Performance Trace", "trace.json",
+                                                           "Chrome Trace (*.json)")
+                if file_path:
+                    self.export_trace(file_path)
+            
+            elif action == add_node_action:
+                node, = self.bind_records([self.model.add_node(scene_pos.x(), scene_pos.y())])
+                self.record_edit(BranchCommand(self, node, "Add Node"))
             
             elif action == add_central_action:
                 # If there's already a root node, just add a normal node
-                if self.root_node:
-                    node = MindMapNode(scene_pos.x(), scene_pos.y(), "New Topic")
+                if self.model.root is not None:
+                    record = self.model.add_node(scene_pos.x(), scene_pos.y(), "New Topic")
                 else:
-                    node = MindMapNode(scene_pos.x(), scene_pos.y(), "Main Topic")
-                    node.setBrush(QBrush(Qt.green))
-                    node.setRect(0, 0, 120, 80)
-                    node.width = 120
-                    node.height = 80
-                    self.root_node = node
-                
-                self.scene.addItem(node)
-                self.nodes.append(node)
+                    record = self.model.add_node(scene_pos.x(), scene_pos.y(), "Main Topic",
+                                                 color=self.theme.fill_for(0), width=120, height=80)
+                node, = self.bind_records([record])
+                self.record_edit(BranchCommand(self, node, "Add Central Topic"))
             
-            elif arrange_action and action == arrange_action:
-                self.auto_arrange_nodes()
+            elif action in arrange_actions:
+                if arrange_actions[action] == "keep":
+                    self.keep_arranged = action.isChecked()
+                    self.tidy = None
+                    if self.keep_arranged:
+                        self.auto_arrange_nodes()
+                elif arrange_actions[action] is None:
+                    self.start_force_layout()
+                else:
+                    self.layout_mode = arrange_actions[action]
+                    self.auto_arrange_nodes()
     
-    def auto_arrange_nodes(self):
+    def auto_arrange_nodes(self, mode=None):
+        """Lay out the visible tree under the root node, keeping the root in place.
+
+        mode is one of mindmap_layout.LAYOUT_MODES, self.layout_mode by
+        default. Collapsed branches move along with their collapsed node.
+        """
         if not self.root_node:
             return
-        
-        # Reset positions
-        self.position_node(self.root_node, 0, 0, 1)
+        moved = self.arrange(mode or self.layout_mode)
+        if moved:
+            self.record_edit(MoveCommand(self, moved, {node: node.pos() for node in moved}, "Auto-Arrange"))
         
         # Center the root node in the view
         self.centerOn(self.root_node)
     
-    def position_node(self, node, x, y, level_spacing):
-        """Recursively position a node and all its children"""
-        node.setPos(x, y)
-        
-        if not node.children:
+    def arrange(self, mode):
+        """Run a full tidy layout, kept in self.tidy for later edits if keep_arranged is on"""
+        self.store_nodes(self.nodes.values())
+        tidy, records, positions = self.model.tidy_layout(mode)
+        # The records breadth-first, as TidyLayout numbers them
+        self.layout_nodes = records
+        self.layout_index = {record: i for i, record in enumerate(records)}
+        self.layout_widths = [record.width for record in records]
+        self.layout_heights = [record.height for record in records]
+        self.layout_dirty.clear()
+        self.tidy = tidy if self.keep_arranged else None
+        return self.move_nodes(self.node_positions(positions))
+    
+    @staticmethod
+    def node_positions(positions):
+        """Map the {record: (x, y)} positions of a layout to {node: QPointF} for move_nodes"""
+        return {record.item: QPointF(x, y) for record, (x, y) in positions.items() if record.item is not None}
+    
+    def layout_id(self, record):
+        """Index of a record in the kept layout, adding it if it is new"""
+        index = self.layout_index.get(record)
+        if index is None:
+            index = self.layout_index[record] = len(self.layout_nodes)
+            self.layout_nodes.append(record)
+            self.layout_widths.append(record.width)
+            self.layout_heights.append(record.height)
+        return index
+    
+    def mark_layout_dirty(self, node):
+        """Note that the children of node changed, the layout follows once the event is handled"""
+        if self.tidy is None:
             return
+        if not self.layout_dirty:
+            QTimer.singleShot(0, self.update_layout)
+        self.layout_dirty.add(node.record)
+    
+    def update_layout(self):
+        """Re-lay out only the branches marked by mark_layout_dirty.
+
+        The marked nodes and their ancestors get new positions, the branches
+        beside them are shifted as a whole, and the rest of the map stays
+        where it is. Falls back to a full arrange when TidyLayout asks for it.
+        """
+        dirty = [self.layout_index[record] for record in self.layout_dirty
+                 if record in self.layout_index and record.item is not None and record.item.scene() is self.scene]
+        self.layout_dirty.clear()
+        if self.tidy is None or not dirty or not self.root_node:
+            return
+        self.store_nodes([self.root_node])  # The layout is relative to its centre
+        records = self.layout_nodes
         
-        # Number of children
-        n = len(node.children)
-        
-        if node.level == 0:  # Root level spacing
-            start_angle = -60
-            end_angle = 60
-            radius = 300
-        else:  # Other levels
-            start_angle = -50
-            end_angle = 50
-            radius = 200
-        
-        # Distribute children in fan/radial layout
-        angle_step = (end_angle - start_angle) / (n - 1) if n > 1 else 0
+        def children_of(index):
+            record = records[index]
+            return [] if record.collapsed else [self.layout_id(child) for child in record.children]
         
-        for i, child in enumerate(node.children):
-            if n == 1:
-                angle = 0  # Single child goes straight out
-            else:
-                angle = start_angle + i * angle_step
-            
-            # Convert angle to radians
-            rad = angle * 3.14159 / 180
-            
-            # Calculate new position
-            child_x = x + radius * level_spacing * 0.8 * (node.level + 1) * (1/1.5) * (1/level_spacing) * (node.level + 1/2) * (1 if angle >= 0 else -1)
-            
-            # Adjust vertical positioning based on level and index
-            if node.level == 0:
-                # For first level, arrange in a semicircle
-                child_x = x + radius * level_spacing * (1/level_spacing) * (node.level + 1) * 0.8 * (1 if i > n//2 else -1)
-                child_y = y + (i - n//2) * 80
-            else:
-                # For deeper levels, cascade down
-                child_y = y + (i + 1) * 70 * level_spacing
-            
-            # Update connection line
-            if child.parent_connection and child.parent_connection[0]:
-                child.update_connection_line(child.parent_connection[0], node, child)
-            
-            # Recursively position the child's children
-            self.position_node(child, child_x, child_y, level_spacing * 0.8)
+        result = self.tidy.update(dirty, children_of, self.layout_widths, self.layout_heights)
+        if result is None:
+            self.arrange(self.tidy.mode)
+            return
+        positions, shifts = result
+        self.move_nodes(self.node_positions(self.model.layout_positions(
+            (records[i], x, y) for i, (x, y) in positions.items())))
+        for i, (dx, dy) in shifts.items():
+            # A plain move, itemChange carries the branch along
+            node = records[i].item
+            node.setPos(node.pos() + QPointF(dx, dy))
+        self.flush_line_updates()
+    
+    def move_nodes(self, positions):
+        """Move many nodes at once, updating every affected line only once.
+
+        positions maps nodes to their new top-left positions. The nodes skip
+        their itemChange cascade; the records hidden under collapsed nodes
+        follow when the nodes are stored (see store_nodes). Returns the old
+        positions of the nodes that moved.
+        """
+        lines = {}
+        old_positions = {}
+        for node, pos in positions.items():
+            if pos == node.pos():
+                continue
+            old_positions[node] = node.pos()
+            node.in_subtree_move = True
+            node.setPos(pos)
+            node.in_subtree_move = False
+            for line, from_node, to_node in node.connection_lines():
+                lines[line] = (from_node, to_node)
+        self.update_lines((line, from_node, to_node) for line, (from_node, to_node) in lines.items())
+        self.edge_layer.flush()
+        return old_positions
+    
+    def start_force_layout(self, iterations=300):
+        """Untangle the visible nodes with a force-directed layout on a worker thread.
+
+        Both the tree and the manual connections act as springs, and the
+        root node stays in place. Positions are applied as they arrive, so
+        the map animates into its new shape; Esc or a click stops it.
+        """
+        self.stop_force_layout()
+        self.tidy = None  # The next edit would undo the result
+        nodes = [node for node in self.nodes.values() if node.isVisible()]
+        if len(nodes) < 2:
+            return
+        index_of = {node: i for i, node in enumerate(nodes)}
+        edges = []
+        for i, node in enumerate(nodes):
+            for child in node.children:
+                if child in index_of:
+                    edges.append((i, index_of[child]))
+            for other_node in node.connections.values():
+                j = index_of.get(other_node)
+                if j is not None and i < j:  # Each connection is listed on both nodes
+                    edges.append((i, j))
+        centers = [(node.x() + node.width / 2, node.y() + node.height / 2) for node in nodes]
+        layout = ForceLayout(centers, edges, index_of.get(self.root_node), iterations=iterations)
+        self.force_start = {node: node.pos() for node in nodes}
+        self.force_thread = ForceLayoutThread(layout, nodes, parent=self)
+        self.force_thread.frame.connect(self._apply_force_frame)
+        self.force_thread.finished.connect(self._force_layout_finished)
+        self.force_thread.finished.connect(self.force_thread.deleteLater)
+        self.force_thread.start()
+    
+    def stop_force_layout(self):
+        """Stop a running force-directed layout, keeping the positions reached so far.
+        
+        Returns at once rather than waiting for the worker, whose step can
+        take long on a big map: it stops after that step, its late frames
+        are ignored and it deletes itself once finished.
+        """
+        if self.force_thread:
+            thread, self.force_thread = self.force_thread, None
+            thread.retire()
+            self._record_force_layout()
+    
+    def _apply_force_frame(self, positions):
+        thread = self.sender()
+        if thread is None or thread is not self.force_thread:
+            return  # Late frame of a stopped layout, possibly deleted since
+        start = time.perf_counter()
+        self.move_nodes({node: QPointF(x - node.width / 2, y - node.height / 2)
+                         for node, (x, y) in zip(thread.nodes, positions.tolist())
+                         if node.scene() is self.scene})  # Skip nodes deleted meanwhile
+        thread.frame_cost = time.perf_counter() - start
+        thread.frame_pending = False
+    
+    def _force_layout_finished(self):
+        if self.sender() is self.force_thread:
+            self.force_thread = None
+            self._record_force_layout()
+    
+    def _record_force_layout(self):
+        # The whole run is one undo step
+        start, self.force_start = self.force_start, None
+        moved = [node for node, pos in start.items() if node.scene() is self.scene and node.pos() != pos]
+        if moved:
+            self.record_edit(MoveCommand(self, {node: start[node] for node in moved},
+                                         {node: node.pos() for node in moved}, "Force-Directed Layout"))
     
     def mousePressEvent(self, event):
+        # Grabbing a node would fight the running layout
+        self.stop_force_layout()
+        
         # Store the current position for use in mouseReleaseEvent
         self.last_mouse_pos = self.mapToScene(event.pos())
         
-        item = self.itemAt(event.pos())
-        if isinstance(item, MindMapNode) and event.button() == Qt.LeftButton:
+        item = self.node_at(self.last_mouse_pos)
+        if (item is None and event.button() == Qt.LeftButton
+                and event.modifiers() & Qt.ShiftModifier):
+            # Shift-drag on the background selects the nodes in a rectangle
+            self.rubber_band_origin = event.pos()
+            if self.rubber_band is None:
+                self.rubber_band = QRubberBand(QRubberBand.Rectangle, self.viewport())
+            self.rubber_band.setGeometry(QRect(event.pos(), QSize()))
+            self.rubber_band.show()
+            return
+        
+        if item is not None and event.button() == Qt.LeftButton:
             # If in manual connection mode, handle node selection
             if self.connection_mode == "manual":
                 if item not in self.selected_nodes:
                     self.selected_nodes.append(item)
-                    item.setBrush(QBrush(Qt.cyan))  # Highlight selected node
+                    item.set_highlighted(True)
                 
                 if len(self.selected_nodes) > 2:
                     # Deselect the oldest node
-                    old_node = self.selected_nodes.pop(0)
-                    old_node.setBrush(QBrush(Qt.yellow))  # Reset color
+                    self.selected_nodes.pop(0).set_highlighted(False)
         
         super().mousePressEvent(event)
+        
+        if item is not None and event.button() == Qt.LeftButton:
+            # Note where the nodes Qt may now drag start from, their branches follow them
+            dragged = {node for node in self.scene.selectedItems() if isinstance(node, MindMapNode)}
+            dragged.add(item)
+            self.drag_start = {node: node.pos() for node in dragged if not self.ancestor_in(node, dragged)}
+    
+    def mouseMoveEvent(self, event):
+        if self.rubber_band_origin is not None:
+            self.rubber_band.setGeometry(QRect(self.rubber_band_origin, event.pos()).normalized())
+            return
+        super().mouseMoveEvent(event)
+        # A drag may have queued line updates, draw them with this frame
+        if self.pending_lines:
+            self.flush_line_updates()
     
     def mouseReleaseEvent(self, event):
+        if self.rubber_band_origin is not None:
+            self.rubber_band_origin = None
+            self.rubber_band.hide()
+            rect = self.mapToScene(self.rubber_band.geometry()).boundingRect()
+            self.scene.clearSelection()
+            for node in self.nodes_in_rect(rect):
+                node.setSelected(True)
+            return
+        
+        if self.drag_start:
+            # The whole drag is one undo step
+            start, self.drag_start = self.drag_start, None
+            self.schedule_scene_rect()
+            moved = {node: pos for node, pos in start.items()
+                     if node.scene() is self.scene and node.pos() != pos}
+            if moved:
+                self.record_edit(MoveCommand(self, moved, {node: node.pos() for node in moved},
+                                             carry_branches=True))
+        
         # If in automatic connection mode, check if we're connecting nodes
         if self.connection_mode == "automatic" and event.button() == Qt.LeftButton:
-            item = self.itemAt(event.pos())
-            if isinstance(item, MindMapNode):
+            item = self.node_at(self.mapToScene(event.pos()))
+            if item is not None:
                 # Check if we started the drag on a different node
                 if self.last_mouse_pos:
-                    start_item = self.scene.itemAt(self.last_mouse_pos, self.transform())
-                    if isinstance(start_item, MindMapNode) and start_item != item:
+                    start_item = self.node_at(self.last_mouse_pos)
+                    if start_item is not None and start_item != item:
                         # Connect these two nodes
-                        line = QGraphicsLineItem()
-                        line.setPen(QPen(Qt.black, 2, Qt.DashLine))
-                        self.scene.addItem(line)
-                        
-                        # Set line position
-                        start_item.update_connection_line(line, start_item, item)
-                        
-                        # Add to connections
-                        start_item.connections.append((line, item))
-                        item.connections.append((line, start_item))
+                        if self.virtualizer:
+                            self.virtualizer.link(start_item.record, item.record)
+                        else:
+                            self.link_nodes(start_item, item)
+                            self.record_edit(LinkCommand(self, start_item, item))
         
         super().mouseReleaseEvent(event)
     
@@ -564,127 +2212,1227 @@ class MindMapView(QGraphicsView):
         else:
             self.scale(zoom_out_factor, zoom_out_factor)
             self.scale_factor *= zoom_out_factor
+            self.schedule_scene_rect()  # More of the canvas is in view
+        
+        if self.virtualizer:
+            self.virtualizer.schedule_refresh()
+        if self.overview:
+            self.overview.update()
+    
+    def scrollContentsBy(self, dx, dy):
+        super().scrollContentsBy(dx, dy)
+        self.schedule_scene_rect()  # Panning towards the edge makes room beyond it
+        if self.virtualizer:
+            self.virtualizer.schedule_refresh()
+        if self.overview:
+            self.overview.update()  # Its viewport rectangle
+    
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.schedule_scene_rect()
+        if self.virtualizer:
+            self.virtualizer.schedule_refresh()
+        if self.overview:
+            self.place_overview()
+            self.overview.update()
+    
+    def drawBackground(self, painter, rect):
+        super().drawBackground(painter, rect)
+        if self.virtualizer:
+            self.virtualizer.paint_background(painter, rect)
+    
+    def drawForeground(self, painter, rect):
+        super().drawForeground(painter, rect)
+        if self.profile_overlay:
+            self.paint_overlay(painter)
+    
+    def paint_overlay(self, painter, rows=10):
+        """Draw the frame rate and the labels taking the most time in the top left corner"""
+        lines = []
+        frames = PROFILER.frame_stats()
+        if frames:
+            lines.append("%.0f fps, frame %.1f ms avg, %.1f ms max" % (frames[0], frames[1] * 1e3, frames[2] * 1e3))
+        lines.append("%-24s %8s %10s %9s %9s" % ("", "calls", "total ms", "avg us", "max ms"))
+        for label, calls, total, mean, longest in PROFILER.summary()[:rows]:
+            lines.append("%-24s %8d %10.1f %9.1f %9.2f" % (label[:24], calls, total * 1e3, mean * 1e6, longest * 1e3))
+        
+        painter.save()
+        painter.resetTransform()  # Viewport coordinates
+        painter.setRenderHint(QPainter.Antialiasing, False)
+        font = QFont("Monospace", 8)
+        font.setStyleHint(QFont.TypeWriter)
+        painter.setFont(font)
+        metrics = painter.fontMetrics()
+        height = metrics.height()
+        width = max(metrics.horizontalAdvance(line) for line in lines)
+        painter.fillRect(QRectF(4, 4, width + 12, height * len(lines) + 8), QColor(0, 0, 0, 170))
+        painter.setPen(Qt.white)
+        for i, line in enumerate(lines):
+            painter.drawText(10, 8 + metrics.ascent() + i * height, line)
+        painter.restore()
     
-    def export_to_image(self, file_path):
-        """Export the current mind map to an image file"""
-        # Create a new scene that only contains nodes visible in our view
+    def export_to_image(self, file_path, scale=1.0, dpi=96, tile_size=1024, threads=0,
+                        memory_limit=64 << 20):
+        """Export the whole mind map to an image file, chosen by extension.
+        
+        .svg and .pdf give vector output.  .png is rendered in bands of
+        tile_size wide tiles and streamed into the file, so memory stays
+        around memory_limit bytes however large the map is; other raster
+        formats are rendered in one piece and must fit in memory_limit.
+        scale is the number of pixels per scene unit and dpi the resolution
+        recorded in the file (it sets the page size of vector output).
+        With threads > 0, PNG bands are compressed on that many worker
+        threads while the next band renders (the scene itself can only be
+        painted on the GUI thread).
+        """
+        # Cover the map and, as before, at least the visible area
         visible_rect = self.mapToScene(self.viewport().rect()).boundingRect()
-        
-        # Get the scene rect that contains all items
-        items_rect = self.scene.itemsBoundingRect()
-        
-        # Use the larger of the two
-        export_rect = items_rect.united(visible_rect)
-        
-        # Create a new image with the appropriate size
-        image = QImage(export_rect.width(), export_rect.height(), QImage.Format_ARGB32)
+        export_rect = self.content_rect().united(visible_rect)
+        width = max(1, int(math.ceil(export_rect.width() * scale)))
+        height = max(1, int(math.ceil(export_rect.height() * scale)))
+        extension = os.path.splitext(file_path)[1].lower()
+        
+        try:
+            if extension in (".svg", ".pdf"):
+                self._export_vector(file_path, extension, export_rect, width, height, dpi)
+            elif extension == ".png":
+                self._export_png(file_path, export_rect, scale, width, height, dpi, tile_size, threads,
+                                 memory_limit)
+            else:
+                if width * height * 4 > memory_limit:
+                    raise ValueError("A %dx%d image does not fit in the memory limit, export to "
+                                     "PNG, SVG or PDF instead" % (width, height))
+                image = QImage(width, height, QImage.Format_ARGB32)
+                image.fill(Qt.white)
+                image.setDotsPerMeterX(int(round(dpi / 0.0254)))
+                image.setDotsPerMeterY(int(round(dpi / 0.0254)))
+                painter = QPainter(image)
+                painter.setRenderHint(QPainter.Antialiasing)
+                self.render_scene_rect(painter, QRectF(0, 0, width, height), export_rect)
+                painter.end()
+                if not image.save(file_path):
+                    raise OSError("Could not write %s" % file_path)
+        finally:
+            if self.virtualizer:
+                self.virtualizer.refresh()  # Back to the items around the viewport
+    
+    def content_rect(self):
+        """Scene rectangle covering every visible node"""
+        if self.virtualizer:
+            return self.virtualizer.content_rect()
+        rect = QRectF()
+        for node in self.nodes.values():
+            if node.isVisible():
+                rect = rect.united(node.sceneBoundingRect())
+        return rect.adjusted(-20, -20, 20, 20) if not rect.isNull() else rect
+    
+    def render_scene_rect(self, painter, target, source):
+        """Render part of the scene, with what virtualized mode paints as background"""
+        if self.virtualizer:
+            self.virtualizer.refresh(source)
+            painter.save()
+            painter.setClipRect(target)
+            painter.translate(target.x(), target.y())
+            painter.scale(target.width() / source.width(), target.height() / source.height())
+            painter.translate(-source.x(), -source.y())
+            self.virtualizer.paint_background(painter, source)
+            painter.restore()
+        self.scene.render(painter, target, source, Qt.IgnoreAspectRatio)
+    
+    def _export_vector(self, file_path, extension, export_rect, width, height, dpi):
+        if extension == ".svg":
+            device = QSvgGenerator()
+            device.setFileName(file_path)
+            device.setSize(QSize(width, height))
+            device.setViewBox(QRect(0, 0, width, height))
+            device.setResolution(dpi)
+        else:
+            device = QPdfWriter(file_path)
+            device.setResolution(dpi)
+            device.setPageSize(QPageSize(QSizeF(width * 72.0 / dpi, height * 72.0 / dpi), QPageSize.Point))
+            device.setPageMargins(QMarginsF(0, 0, 0, 0))
+        painter = QPainter(device)
+        painter.setRenderHint(QPainter.Antialiasing)
+        target = QRectF(0, 0, painter.device().width(), painter.device().height())
+        if not self.virtualizer:
+            self.render_scene_rect(painter, target, export_rect)
+        else:
+            # Items only exist around one area at a time, go tile by tile
+            tile = 1024.0
+            sx, sy = target.width() / export_rect.width(), target.height() / export_rect.height()
+            y = 0.0
+            while y < export_rect.height():
+                x = 0.0
+                while x < export_rect.width():
+                    source = QRectF(export_rect.x() + x, export_rect.y() + y,
+                                    min(tile, export_rect.width() - x), min(tile, export_rect.height() - y))
+                    self.render_scene_rect(painter, QRectF(x * sx, y * sy, source.width() * sx,
+                                                           source.height() * sy), source)
+                    x += tile
+                y += tile
+        painter.end()
+    
+    def _export_png(self, file_path, export_rect, scale, width, height, dpi, tile_size, threads,
+                    memory_limit):
+        # Band copies in memory at once: the tile images, rows and filtered
+        # rows of the band being rendered, plus one band per worker thread
+        band_height = max(1, min(tile_size, memory_limit // (width * 3 * (threads + 3))))
+        pool = ThreadPoolExecutor(threads) if threads > 0 else None
+        encoding = collections.deque()
+        try:
+            with PngStreamWriter(file_path, width, height, dpi) as writer:
+                for top in range(0, height, band_height):
+                    rows = min(band_height, height - top)
+                    tiles = []
+                    for left in range(0, width, tile_size):
+                        columns = min(tile_size, width - left)
+                        source = QRectF(export_rect.x() + left / scale, export_rect.y() + top / scale,
+                                        columns / scale, rows / scale)
+                        tiles.append(self._rasterize_tile(QRectF(0, 0, columns, rows), source))
+                    band = _band_rows(tiles, rows)
+                    del tiles
+                    if pool:
+                        # Compress on a worker while the next band renders
+                        encoding.append(pool.submit(encode_rows, band, writer.level))
+                        while len(encoding) > threads:
+                            writer.write_band(encoding.popleft().result())
+                    else:
+                        writer.write_rows(band)
+                while encoding:
+                    writer.write_band(encoding.popleft().result())
+        finally:
+            if pool:
+                pool.shutdown(cancel_futures=True)
+    
+    def _rasterize_tile(self, target, source):
+        """Render one export tile into an RGB image, returns (pixel bytes, bytes per line, width)"""
+        image = QImage(int(target.width()), int(target.height()), QImage.Format_RGB888)
         image.fill(Qt.white)
-        
-        # Create a painter to render the scene to the image
         painter = QPainter(image)
         painter.setRenderHint(QPainter.Antialiasing)
-        
-        # Render the scene
-        self.scene.render(painter, QRectF(), export_rect)
+        self.render_scene_rect(painter, target, source)
         painter.end()
-        
-        # Save the image to the specified file
-        image.save(file_path)
+        bits = image.constBits()
+        bits.setsize(image.byteCount())
+        return bytes(bits), image.bytesPerLine(), image.width()
+    
+    def mindmap_data(self):
+        """Build the JSON-compatible dict describing the mind map.
+
+        The model's, once the edits made through the nodes are stored in
+        it; linear in the number of nodes and connections.
+        """
+        self.store_nodes(self.virtualizer.live.values() if self.virtualizer else self.nodes.values())
+        return self.model.to_data()
     
     def save_mindmap(self, file_path):
-        """Save the mind map to a JSON file"""
-        data = {
-            "nodes": [],
-            "connections": [],
-            "root_node_index": -1
-        }
-        
-        # Save nodes
-        for i, node in enumerate(self.nodes):
-            if node == self.root_node:
-                data["root_node_index"] = i
-            
-            node_data = {
-                "id": i,
-                "x": node.scenePos().x(),
-                "y": node.scenePos().y(),
-                "text": node.text_item.toPlainText(),
-                "color": node.brush().color().name(),
-                "node_type": node.node_type,
-                "width": node.width,
-                "height": node.height,
-                "level": node.level,
-                "notes": node.notes,
-                "collapsed": node.collapsed,
-                "children": [self.nodes.index(child) for child in node.children]
-            }
-            data["nodes"].append(node_data)
-        
-        # Save connections (excluding parent-child connections which are saved in children lists)
-        for i, node in enumerate(self.nodes):
-            for _, connected_node in node.connections:
-                j = self.nodes.index(connected_node)
-                if i < j:  # Save each connection only once
-                    data["connections"].append([i, j])
-        
-        # Write to file
-        with open(file_path, 'w') as f:
-            json.dump(data, f)
+        """Save the mind map, as JSON or in the binary format for .mmb files"""
+        data = self.mindmap_data()
+        write_mindmap_file(data, file_path)
+        if self.autosave and file_path == self.autosave.file_path:
+            # Nothing left to recover, the autosave starts over at the next change
+            self.reset_autosave(data, saved=True)
     
-    def load_mindmap(self, file_path):
-        """Load a mind map from a JSON file"""
-        with open(file_path, 'r') as f:
-            data = json.load(f)
+    def enable_autosave(self, file_path, interval=2000):
+        """Keep an autosave of the map next to file_path, see mindmap_journal.
+        
+        Nodes are only marked as they change; every interval milliseconds
+        the changed ones are handed to an AutosaveWriter, which appends them
+        to the journal and compacts it on its own thread. load_mindmap
+        recovers the map from the autosave after a crash. Edits made in
+        virtualized mode are not journaled.
+        """
+        self.start_autosave(file_path, interval, self.mindmap_data(), saved=False)
+    
+    def start_autosave(self, file_path, interval, data, saved, ids=None):
+        """enable_autosave for a mind map dict of the map as it is now, see reset_autosave for ids"""
+        self.disable_autosave()
+        self.autosave = AutosaveWriter(file_path, data, ids or self.autosave_ids(data), saved)
+        self.autosave_dirty.clear()
+        self.autosave_root = self.model.root.node_id if self.model.root else None
+        self.autosave_timer.start(interval)
+    
+    def disable_autosave(self, discard=False):
+        """Stop autosaving after writing out the last changes; discard removes the autosave"""
+        if self.autosave is None:
+            return
+        self.flush_autosave()
+        self.autosave_timer.stop()
+        autosave, self.autosave = self.autosave, None
+        autosave.close(discard)
+    
+    def autosave_ids(self, data):
+        """Node ids for the nodes of a mind map dict of the whole map"""
+        if self.virtualizer:
+            # Their edits are not journaled, the ids are of no use
+            return list(range(-len(data["nodes"]), 0))
+        # In the order of mindmap_data
+        return list(self.model.records)
+    
+    def reset_autosave(self, data, saved, ids=None):
+        """Restart the autosave from a mind map dict of the whole map.
+        
+        ids are the node ids of the nodes in data, as build_mindmap returns
+        them; without them data must be in the order of mindmap_data.
+        """
+        self.autosave.reset(data, ids or self.autosave_ids(data), saved)
+        self.autosave_dirty.clear()
+        self.autosave_root = self.model.root.node_id if self.model.root else None
+    
+    def note_change(self, node, branch=False):
+        """Note that a node changed, flush_autosave journals it with the next batch.
+        
+        branch says the node moved or joined the map, so the records hidden
+        below it are journaled again as well.
+        """
+        if self.autosave is not None and not self.virtualizer:
+            self.autosave_dirty.add(node)
+            if branch and node.collapsed and node.record is not None and node.record.children:
+                self.autosave_branches.add(node)
+    
+    def flush_autosave(self):
+        """Hand the nodes changed since the last flush to the autosave writer.
         
-        # Clear current scene
+        Only builds the batch, a few dicts per changed node; the writer
+        thread does the encoding and the file work.
+        """
+        if self.autosave is None or self.virtualizer:
+            return
+        dirty, self.autosave_dirty = self.autosave_dirty, set()
+        branches, self.autosave_branches = self.autosave_branches, set()
+        shown = [node for node in dirty | branches if node.scene() is self.scene]
+        self.store_nodes(shown)
+        batch = {}
+        for node in dirty:
+            if node.scene() is self.scene:
+                batch.setdefault("set", []).append(self.autosave_entry(node.record))
+            else:
+                # Deleted, with any records hidden below it
+                batch.setdefault("remove", []).append(node.node_id)
+                batch["remove"].extend(record.node_id for record in node.hidden_records())
+        for node in branches:
+            if node.scene() is self.scene:
+                batch.setdefault("set", []).extend(self.autosave_entry(record) for record in node.hidden_records())
+        root = self.model.root.node_id if self.model.root else None
+        if root != self.autosave_root:
+            batch["root"] = self.autosave_root = root
+        if batch:
+            self.autosave.append(batch)
+    
+    @staticmethod
+    def autosave_entry(record):
+        """The journal entry of a record, see mindmap_journal"""
+        node_data = record.to_data()
+        node_data["id"] = record.node_id
+        node_data["children"] = [child.node_id for child in record.children]
+        node_data["links"] = [other.node_id for other in record.links]
+        return node_data
+    
+    def clear_mindmap(self):
+        """Remove every node and line from the view"""
+        self.stop_force_layout()
+        self.tidy = None
+        self.layout_nodes, self.layout_index = [], {}
+        self.layout_dirty.clear()
+        self.history.clear()
         self.scene.clear()
+        self.node_index.clear()
+        self.unindexed.clear()
+        self.schedule_scene_rect()
+        self.autosave_dirty.clear()
+        self.autosave_branches.clear()
+        self.retired.clear()
+        self.search_index.clear()
+        self.search_dirty.clear()
+        self.search_results = []
+        self.search_position = -1
+        self.edge_layer = EdgeLayer(self.theme)
+        self.scene.addItem(self.edge_layer)
+        self.pending_lines.clear()
         self.nodes.clear()
         self.selected_nodes.clear()
-        self.root_node = None
-        
-        # Create nodes
-        for node_data in data["nodes"]:
-            node = MindMapNode(
-                node_data["x"], 
-                node_data["y"], 
-                node_data["text"],
-                QColor(node_data["color"]),
-                node_data["node_type"],
-                node_data["width"],
-                node_data["height"]
-            )
-            node.level = node_data["level"]
-            node.notes = node_data["notes"]
-            node.collapsed = node_data["collapsed"]
-            self.scene.addItem(node)
-            self.nodes.append(node)
-        
-        # Set root node
-        if data["root_node_index"] >= 0:
-            self.root_node = self.nodes[data["root_node_index"]]
-        
-        # Set up parent-child relationships
-        for i, node_data in enumerate(data["nodes"]):
-            for child_idx in node_data["children"]:
-                self.nodes[i].children.append(self.nodes[child_idx])
-                
-                # Create the connection line
-                line = QGraphicsLineItem()
-                line.setPen(QPen(Qt.black, 2, Qt.SolidLine))
-                self.scene.addItem(line)
-                
-                # Set parent connection for the child
-                self.nodes[child_idx].parent_connection = (line, self.nodes[i])
-                
-                # Update line position
-                self.nodes[child_idx].update_connection_line(
-                    line, self.nodes[i], self.nodes[child_idx]
-                )
-                
-                # Apply collapsed state
-                if self.nodes[i].collapsed:
-                    self.nodes[child_idx].setVisible(False)
-                    line.setVisible(False)
+        self.model = MindMap()
+        if self.virtualizer:
+            self.virtualizer.reset()
+        self.overview_changed(None)
+    
+    def load_mindmap(self, file_path):
+        """Load a mind map from a JSON or binary (.mmb) file.
+        
+        If the file has an autosave (see enable_autosave), the map is
+        recovered from its snapshot and journal instead. Returns whether it
+        was. A running autosave moves on to the loaded file.
+        """
+        data = read_autosave(file_path)
+        recovered = data is not None
+        if not recovered:
+            data = read_mindmap_file(file_path)
+        self.cancel_loading()
+        self.clear_mindmap()
+        ids = None
+        if self.virtualizer:
+            self.model = MindMap.from_data(data)
+            self.virtualizer.load()
+        else:
+            ids = self.build_mindmap(data)
+        if self.autosave:
+            # Node ids are new, a recovered autosave is rewritten with them
+            if file_path == self.autosave.file_path:
+                self.reset_autosave(data, saved=not recovered, ids=ids)
+            else:
+                self.start_autosave(file_path, self.autosave_timer.interval(), data, saved=not recovered, ids=ids)
+        return recovered
+    
+    def set_virtualized(self, enabled):
+        """Switch between building every node and only the nodes near the viewport"""
+        if enabled == (self.virtualizer is not None):
+            return
+        self.flush_autosave()
+        data = self.mindmap_data()
+        self.cancel_loading()
+        self.clear_mindmap()
+        if enabled:
+            self.virtualizer = ViewportVirtualizer(self)
+            self.setCacheMode(QGraphicsView.CacheBackground)
+            self.model = MindMap.from_data(data)
+            self.virtualizer.load()
+        else:
+            self.virtualizer.refresh_timer.deleteLater()
+            self.virtualizer = None
+            self.setCacheMode(QGraphicsView.CacheNone)
+            ids = self.build_mindmap(data)
+            self.viewport().update()
+            if self.autosave:
+                # Catches up with the edits made while virtualized
+                self.reset_autosave(data, saved=False, ids=ids)
+    
+    def build_mindmap(self, data):
+        """Make a mind map dict the model and show it in an empty scene.
+        
+        Only records outside collapsed branches get MindMapNodes. Returns
+        the node id of every node in data, in order.
+        """
+        self.model = MindMap.from_data(data)
+        self.bind_records(self.model.shown())
+        return list(self.model.records)
+    
+    def load_mindmap_async(self, file_path):
+        """Load a mind map without blocking the GUI thread.
+        
+        Returns the MindMapLoader, whose progress and finished signals report
+        on the load and whose cancel() aborts it.
+        """
+        self.cancel_loading()
+        self.loader = MindMapLoader(self, file_path)
+        self.loader.finished.connect(self._loading_finished)
+        self.loader.start()
+        return self.loader
+    
+    def cancel_loading(self):
+        """Abort a running load_mindmap_async"""
+        if self.loader:
+            self.loader.cancel()
+    
+    def _loading_finished(self, completed):
+        self.loader = None
+    
+    def keyPressEvent(self, event):
+        if event.matches(QKeySequence.Find):
+            query, ok = QInputDialog.getText(self, "Find", "Find in node text and notes:", text=self.search_query)
+            if ok and query.strip():
+                self.find_next(query, fuzzy=True)
+            return
+        if event.matches(QKeySequence.FindNext):
+            self.find_next()
+            return
+        # While a node's text is being edited, its editor has its own undo
+        if self.scene.focusItem() is None:
+            if event.matches(QKeySequence.Undo):
+                self.undo()
+                return
+            if event.matches(QKeySequence.Redo):
+                self.redo()
+                return
+        if event.key() == Qt.Key_F12:
+            self.set_performance_overlay(not self.profile_overlay)
+            return
+        if event.key() == Qt.Key_Escape and self.loader:
+            self.cancel_loading()
+            return
+        if event.key() == Qt.Key_Escape and self.force_thread:
+            self.stop_force_layout()
+            return
+        super().keyPressEvent(event)
+
+
+_json_decoder = json.JSONDecoder()
+_json_whitespace = re.compile(r'[ \t\n\r]*')
+
+
+def parse_mindmap_json(text):
+    """Parse a saved mind map one array element at a time.
+    
+    json.loads holds the GIL for the whole document.  Decoding the top-level
+    arrays element by element lets a parsing thread give way to the GUI
+    thread between nodes.
+    """
+    decode = _json_decoder.raw_decode
+    skip = _json_whitespace.match
+    try:
+        idx = skip(text, 0).end()
+        if text[idx] != '{':
+            return json.loads(text)
+        data = {}
+        idx = skip(text, idx + 1).end()
+        while text[idx] != '}':
+            key, idx = decode(text, idx)
+            idx = skip(text, idx).end()
+            if text[idx] != ':':
+                raise ValueError("Expecting ':' at position %d" % idx)
+            idx = skip(text, idx + 1).end()
+            if text[idx] == '[':
+                value = []
+                idx = skip(text, idx + 1).end()
+                while text[idx] != ']':
+                    item, idx = decode(text, idx)
+                    value.append(item)
+                    idx = skip(text, idx).end()
+                    if text[idx] == ',':
+                        idx = skip(text, idx + 1).end()
+                idx += 1
+            else:
+                value, idx = decode(text, idx)
+            data[key] = value
+            idx = skip(text, idx).end()
+            if text[idx] == ',':
+                idx = skip(text, idx + 1).end()
+    except IndexError:
+        raise ValueError("Unexpected end of mind map file")
+    return data
+
+
+class LoadPlan:
+    """A mind map read into a MindMap, and the order to show its records in"""
+    
+    def __init__(self, mindmap, order):
+        self.mindmap = mindmap
+        self.order = order  # The records not hidden, closest to the root first
+
+
+class RetiringThread(QThread):
+    """A worker thread its owner can let go of while it is still running"""
+    
+    def retire(self):
+        """Stop after the current step without waiting for it.
+        
+        The application owns the thread from then on, so the object that
+        started it may go away before it finishes; wait_retired catches
+        the ones still finishing when Python exits.
+        """
+        self.requestInterruption()
+        self.setParent(QApplication.instance())
+    
+    @staticmethod
+    def wait_retired():
+        app = QApplication.instance()
+        for thread in app.findChildren(RetiringThread) if app else ():
+            thread.wait()
+
+
+# Destroying a running QThread aborts the process
+atexit.register(RetiringThread.wait_retired)
+
+
+class MindMapParseThread(RetiringThread):
+    """Read and parse a mind map file off the GUI thread"""
+    parsed = pyqtSignal(object, object)
+    failed = pyqtSignal(str)
+    
+    def __init__(self, file_path, parent=None):
+        super().__init__(parent)
+        self.file_path = file_path
+    
+    def run(self):
+        try:
+            if is_binary_path(self.file_path):
+                data = read_binary_mindmap(self.file_path)
+            else:
+                with open(self.file_path, 'r') as f:
+                    text = f.read()
+                data = parse_mindmap_json(text)
+            if self.isInterruptionRequested():
+                return
+            plan = MindMapLoader.plan(data)
+        except Exception as e:  # A broken file fails the load, not the thread
+            self.failed.emit(str(e))
+            return
+        if not self.isInterruptionRequested():
+            self.parsed.emit(data, plan)
+
+
+def _band_rows(tiles, rows):
+    """Join the tiles of one band, left to right, into a list of full-width RGB rows"""
+    return [b"".join(data[row * stride:row * stride + width * 3] for data, stride, width in tiles)
+            for row in range(rows)]
+
+
+class ForceLayoutThread(RetiringThread):
+    """Run a ForceLayout off the GUI thread and stream its positions as frames.
+    
+    A frame is sent at most every frame_ms milliseconds, and only once the
+    view has taken the previous one (it clears frame_pending), so a slow
+    repaint never queues up stale frames.  The view also reports how long
+    applying a frame took (frame_cost, in seconds), and frames are spaced at
+    least twice that far apart so the GUI stays free for input most of the
+    time on big maps.  The final positions are always sent.
+    """
+    frame = pyqtSignal(object)  # (n, 2) array of node centres, in the order of nodes
+    
+    def __init__(self, layout, nodes, frame_ms=33, parent=None):
+        super().__init__(parent)
+        self.layout = layout
+        self.nodes = nodes
+        self.frame_ms = frame_ms
+        self.frame_pending = False
+        self.frame_cost = 0.0
+    
+    def run(self):
+        last_frame = time.perf_counter()
+        while not self.layout.done() and not self.isInterruptionRequested():
+            moved = self.layout.step()
+            if moved < 0.5:  # Settled
+                break
+            now = time.perf_counter()
+            interval = max(self.frame_ms / 1000, 2 * self.frame_cost)
+            if not self.frame_pending and now - last_frame >= interval:
+                self.frame_pending = True
+                last_frame = now
+                self.frame.emit(self.layout.positions.copy())
+        if not self.isInterruptionRequested():
+            self.frame.emit(self.layout.positions.copy())
+
+
+class MindMapLoader(QObject):
+    """Load a mind map in the background and build it in time slices.
+    
+    The file is parsed on a worker thread.  The scene is then filled from the
+    GUI thread in slices of at most slice_ms milliseconds, nodes closest to
+    the root first, so the first screenful appears almost at once and the
+    window stays responsive.  Cancelling discards the partially built map.
+    """
+    progress = pyqtSignal(int, int)  # Nodes built, total nodes
+    finished = pyqtSignal(bool)  # True if the map was fully loaded
+    
+    def __init__(self, view, file_path, slice_ms=15):
+        super().__init__(view)
+        self.view = view
+        self.slice_ms = slice_ms
+        self.data = None
+        self.plan = None
+        self.next_index = 0
+        self.cancelled = False
+        self.error = None
+        
+        self.thread = MindMapParseThread(file_path, self)
+        self.thread.parsed.connect(self._start_building)
+        self.thread.failed.connect(self._parse_failed)
+        self.thread.finished.connect(self.thread.deleteLater)
+        self.thread.destroyed.connect(self._thread_destroyed)
+        # The view closing mid-parse takes the loader with it, and its
+        # children with it unless the thread is let go of first
+        self.destroyed.connect(self.thread.retire)
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self._build_slice)
+    
+    @staticmethod
+    def plan(data, by_distance=True):
+        """Build the MindMap of a mind map dict and the order to show it in, on the worker thread"""
+        mindmap = MindMap.from_data(data)
+        # Nearest to the root first, so the area around it fills in first
+        order = mindmap.shown()
+        root = mindmap.root
+        if by_distance and root is not None:
+            rx, ry = root.x, root.y
+            order.sort(key=lambda record: (record.x - rx) ** 2 + (record.y - ry) ** 2)
+        return LoadPlan(mindmap, order)
+    
+    def start(self):
+        self.thread.start()
+    
+    def cancel(self):
+        if self.cancelled:
+            return
+        self.cancelled = True
+        self.timer.stop()
+        if self.thread is not None:
+            self.thread.retire()
+        if self.data is not None:
+            self.view.clear_mindmap()
+        self.finished.emit(False)
+    
+    def _thread_destroyed(self):
+        self.thread = None
+    
+    def _parse_failed(self, message):
+        if not self.cancelled:
+            self.error = message
+            self.cancelled = True
+            self.finished.emit(False)
+    
+    def _start_building(self, data, plan):
+        if self.cancelled:
+            return
+        self.view.clear_mindmap()
+        self.view.model = plan.mindmap
+        if self.view.virtualizer:
+            # Only the nodes around the viewport get built, no need to slice
+            self.view.virtualizer.load()
+            self.finished.emit(True)
+            return
+        self.data = data
+        self.plan = plan
+        self.timer.start(0)
+    
+    def _build_slice(self):
+        view = self.view
+        order = self.plan.order
+        root = self.plan.mindmap.root
+        records = view.model.records
+        deadline = time.perf_counter() + self.slice_ms / 1000
+        
+        while self.next_index < len(order):
+            record = order[self.next_index]
+            self.next_index += 1
+            # Deleted, collapsed away or expanded into view meanwhile
+            if record.hidden or records.get(record.node_id) is not record or record.node_id in view.nodes:
+                continue
+            
+            # Linked to whatever neighbours are already shown, the rest link back later
+            node, = view.bind_records([record])
+            if record is root:
+                view.centerOn(node)
+            
+            if time.perf_counter() >= deadline:
+                break
         
-        # Create non-hierarchical connections
-        for i,
+        self.progress.emit(self.next_index, len(order))
+        if self.next_index >= len(order):
+            self.timer.stop()
+            self.finished.emit(True)
+
+
+class ViewportVirtualizer:
+    """Virtualized mode of MindMapView for very large maps.
+    
+    Node data lives in the view's MindMap, its records indexed by a SpatialGrid.  MindMapNode
+    items are only created, from a recycled pool, for visible records in or
+    near the viewport, and connections are painted straight from the records
+    in the view background, which the view caches while virtualized so that
+    panning only paints the newly exposed strips.  When too many records are
+    in view (zoomed far out), no items are created at all and nodes are
+    painted as plain filled rectangles from a QPicture cached per grid cell.
+    """
+    margin = 0.5  # Extra area around the viewport, as a fraction of its size
+    max_live_items = 2000
+    max_pool_size = 500
+    max_edge_cells = 64  # Edges covering more grid cells are kept in a plain list
+    
+    def __init__(self, view):
+        self.view = view
+        self.grid = ExtentGrid()  # Node boxes, their extent sets the scene rect
+        self.edge_grid = SpatialGrid()  # Edge bounding boxes, keyed by (record, record, dashed)
+        self.long_edges = {}  # Edges too long for the grid -> bounding box
+        self.cell_pictures = {}  # Grid cell -> QPicture of its nodes for crowded painting
+        self.live = {}  # NodeRecord -> MindMapNode
+        self.pool = []  # Hidden MindMapNodes ready for reuse
+        self.crowded = False
+        # Owned by the view, so a refresh still pending when it is deleted never runs
+        self.refresh_timer = QTimer(view)
+        self.refresh_timer.setSingleShot(True)
+        self.refresh_timer.timeout.connect(self.refresh)
+    
+    @property
+    def records(self):
+        return list(self.view.model.records.values())
+    
+    def reset(self):
+        """Forget all records, the scene items are gone already"""
+        self.grid.clear()
+        self.edge_grid.clear()
+        self.long_edges.clear()
+        self.cell_pictures.clear()
+        self.live.clear()
+        self.pool = []
+        self.crowded = False
+    
+    def load(self):
+        """Index the records of the view's model, which it was just given"""
+        self.reset()
+        records = self.records
+        self.view.search_dirty.update(records)  # Indexed at the first search
+        for record in records:
+            self.grid.insert(record, record.x, record.y, record.width, record.height)
+        for record in records:
+            for edge in self.record_edges(record):
+                self.index_edge(edge)
+        self.view.schedule_scene_rect()
+        self.view.overview_changed(None)
+        root = self.view.model.root
+        if root:
+            self.view.centerOn(*root.center())
+        self.refresh()
+    
+    @staticmethod
+    def record_edges(record):
+        """Edge keys touching a record, dashed links keyed in a stable order"""
+        if record.parent is not None:
+            yield (record.parent, record, False)
+        for child in record.children:
+            yield (record, child, False)
+        for other in record.links:
+            yield (record, other, True) if id(record) < id(other) else (other, record, True)
+    
+    def index_edge(self, edge):
+        (x1, y1), (x2, y2) = edge[0].center(), edge[1].center()
+        box = (min(x1, x2), min(y1, y2), abs(x2 - x1), abs(y2 - y1))
+        cell = self.edge_grid.cell_size
+        if (box[2] // cell + 1) * (box[3] // cell + 1) > self.max_edge_cells:
+            self.edge_grid.remove(edge)
+            self.long_edges[edge] = box
+        else:
+            self.long_edges.pop(edge, None)
+            self.edge_grid.move(edge, *box)
+    
+    def schedule_refresh(self):
+        if not self.refresh_timer.isActive():
+            self.refresh_timer.start(0)
+    
+    def content_rect(self):
+        """Scene rectangle covering every visible record"""
+        rect = self.view.model.content_rect()
+        return QRectF(*rect) if rect is not None else QRectF()
+    
+    def visible_scene_rect(self):
+        rect = self.view.mapToScene(self.view.viewport().rect()).boundingRect()
+        dx, dy = rect.width() * self.margin, rect.height() * self.margin
+        return rect.adjusted(-dx, -dy, dx, dy)
+    
+    def refresh(self, rect=None):
+        """Bind items to the records near the viewport (or in rect) and release the rest"""
+        self.refresh_timer.stop()
+        if rect is None:
+            rect = self.visible_scene_rect()
+        wanted = {record for record in self.grid.query(rect.x(), rect.y(), rect.width(), rect.height())
+                  if not record.hidden}
+        crowded = len(wanted) > self.max_live_items
+        if crowded:
+            wanted = set()
+        for record in [record for record in self.live if record not in wanted]:
+            self.release(record)
+        for record in wanted:
+            if record not in self.live:
+                self.bind(record)
+        if crowded != self.crowded:
+            self.crowded = crowded
+            self.invalidate()
+    
+    def invalidate(self):
+        """Records changed, repaint connections and drop the crowded-mode caches"""
+        self.cell_pictures.clear()
+        self.view.resetCachedContent()
+        self.view.viewport().update()
+    
+    def invalidate_region(self, rect):
+        """Records inside a scene rect changed, drop the cell pictures there and repaint only rect"""
+        size = self.grid.cell_size
+        first_column, first_row = int(rect.left() // size), int(rect.top() // size)
+        last_column, last_row = int(rect.right() // size), int(rect.bottom() // size)
+        if (last_column - first_column + 1) * (last_row - first_row + 1) > len(self.cell_pictures):
+            stale = [cell for cell in self.cell_pictures
+                     if first_column <= cell[0] <= last_column and first_row <= cell[1] <= last_row]
+        else:
+            stale = [(column, row) for column in range(first_column, last_column + 1)
+                     for row in range(first_row, last_row + 1)]
+        for cell in stale:
+            self.cell_pictures.pop(cell, None)
+        # Connections are drawn with 2 wide pens, their caps may reach past the node boxes
+        self.view.invalidateScene(rect.adjusted(-2, -2, 2, 2), QGraphicsScene.BackgroundLayer)
+        self.view.overview_changed(rect)
+    
+    def bind(self, record):
+        if self.pool:
+            item = self.pool.pop()
+        else:
+            item = MindMapNode(record.x, record.y)
+            self.view.scene.addItem(item)
+        item.bind_record(record)
+        item.setVisible(True)
+        self.live[record] = item
+    
+    def release(self, record):
+        item = self.live.pop(record)
+        item.store_record()
+        item.record = None
+        record.item = None
+        item.setSelected(False)
+        item.setVisible(False)
+        if len(self.pool) < self.max_pool_size:
+            self.pool.append(item)
+        else:
+            self.view.scene.removeItem(item)
+    
+    def move_branch(self, record, delta_x, delta_y):
+        """Move a record and everything below it, the record's own item is moving already"""
+        branch = [record] + record.descendants()
+        region = self.branch_region(branch)
+        for moved in branch:
+            moved.x += delta_x
+            moved.y += delta_y
+            self.grid.move(moved, moved.x, moved.y, moved.width, moved.height)
+            if moved is not record and moved.item:
+                moved.item.in_subtree_move = True
+                moved.item.moveBy(delta_x, delta_y)
+                moved.item.in_subtree_move = False
+        for moved in branch:
+            for edge in self.record_edges(moved):
+                self.index_edge(edge)
+        # Called for every frame of a drag, so only the old and new place repaint
+        self.invalidate_region(region.united(self.branch_region(branch)))
+        self.schedule_refresh()
+        self.view.schedule_scene_rect()
+    
+    def branch_region(self, records):
+        """Scene QRectF covering some records and the other ends of their connections"""
+        boxes = [(other.x, other.y, other.width, other.height)
+                 for record in records for edge in self.record_edges(record) for other in edge[:2]]
+        boxes.extend((record.x, record.y, record.width, record.height) for record in records)
+        left = min(box[0] for box in boxes)
+        top = min(box[1] for box in boxes)
+        right = max(box[0] + box[2] for box in boxes)
+        bottom = max(box[1] + box[3] for box in boxes)
+        return QRectF(left, top, right - left, bottom - top)
+    
+    def set_collapsed(self, record, collapsed):
+        self.view.model.set_collapsed(record, collapsed)
+        self.invalidate()
+        self.view.overview_changed(self.branch_region([record] + record.descendants()))
+        self.refresh()
+    
+    def reveal(self, record):
+        """Expand every collapsed ancestor of a record"""
+        expanded = []
+        parent = record.parent
+        while parent is not None:
+            if parent.collapsed:
+                expanded.append(parent)
+            parent = parent.parent
+        if expanded:
+            # Top first, each shows the next
+            for parent in reversed(expanded):
+                self.view.model.set_collapsed(parent, False)
+                if parent.item:
+                    parent.item.collapsed = False
+            self.invalidate()
+            self.view.overview_changed(self.branch_region([expanded[-1]] + expanded[-1].descendants()))
+    
+    def link(self, record1, record2):
+        """Add a non-hierarchical connection between two records"""
+        if record2 in record1.links or record1 is record2:
+            return
+        self.view.model.link(record1, record2)
+        edge = (record1, record2, True) if id(record1) < id(record2) else (record2, record1, True)
+        self.index_edge(edge)
+        self.invalidate()
+        self.view.overview_changed(self.branch_region([record1, record2]))
+    
+    def paint_background(self, painter, rect):
+        """Paint connections, and the nodes themselves when too crowded for items"""
+        if self.crowded:
+            self.paint_crowded(painter, rect)
+            return
+        x, y, width, height = rect.x(), rect.y(), rect.width(), rect.height()
+        solid, dashed = [], []
+        for from_record, to_record, is_dashed in self.edges_in(x, y, width, height):
+            if from_record.hidden or to_record.hidden:
+                continue
+            (x1, y1), (x2, y2) = from_record.center(), to_record.center()
+            (dashed if is_dashed else solid).append(QLineF(x1, y1, x2, y2))
+        # Lines run center to center, the node items are painted over the ends
+        painter.save()
+        pens, thin_pens = self.view.theme.pens()
+        if level_of_detail(painter) < self.view.lod_thresholds["edges"]:
+            painter.setRenderHint(QPainter.Antialiasing, False)
+            pens = thin_pens
+        painter.setPen(pens[0])
+        painter.drawLines(solid)
+        painter.setPen(pens[1])
+        painter.drawLines(dashed)
+        painter.restore()
+    
+    def edges_in(self, x, y, width, height):
+        edges = self.edge_grid.query(x, y, width, height)
+        edges.update(edge for edge, box in self.long_edges.items()
+                     if box[0] <= x + width and box[0] + box[2] >= x and box[1] <= y + height and box[1] + box[3] >= y)
+        return edges
+    
+    def paint_crowded(self, painter, rect):
+        # Include neighbouring cells, their connections may reach into rect
+        cell = self.grid.cell_size
+        painter.save()
+        painter.setRenderHint(QPainter.Antialiasing, False)
+        for key in self.grid.occupied_cells(rect.x() - cell, rect.y() - cell,
+                                            rect.width() + 2 * cell, rect.height() + 2 * cell):
+            painter.drawPicture(0, 0, self.cell_picture(key))
+        long_edges = [QLineF(*(edge[0].center() + edge[1].center())) for edge in self.long_edges
+                      if not edge[0].hidden and not edge[1].hidden]
+        painter.setPen(self.view.theme.pens()[1][0])
+        painter.drawLines(long_edges)
+        painter.restore()
+    
+    def cell_picture(self, key):
+        """Cosmetic-pen connections and filled rectangles for records starting in a grid cell"""
+        picture = self.cell_pictures.get(key)
+        if picture is not None:
+            return picture
+        spans = self.grid.spans
+        records = [record for record in self.grid.cells[key]
+                   if spans[record][:2] == key and not record.hidden]
+        solid, dashed, by_color = [], [], {}
+        for record in records:
+            for edge in self.record_edges(record):
+                # Each edge once, from its first record, long ones are painted separately
+                if edge[0] is record and not edge[1].hidden and edge not in self.long_edges:
+                    (dashed if edge[2] else solid).append(QLineF(*(record.center() + edge[1].center())))
+            by_color.setdefault(record.color, []).append(QRectF(record.x, record.y, record.width, record.height))
+        
+        picture = QPicture()
+        painter = QPainter(picture)
+        # Dash patterns cost a lot and vanish at this zoom, links are fainter instead
+        thin_pens = self.view.theme.pens()[1]
+        painter.setPen(thin_pens[0])
+        painter.drawLines(solid)
+        painter.setPen(thin_pens[1])
+        painter.drawLines(dashed)
+        painter.setPen(Qt.NoPen)
+        for color, rects in by_color.items():
+            painter.setBrush(QColor(color))
+            painter.drawRects(rects)
+        painter.end()
+        self.cell_pictures[key] = picture
+        return picture
+
+
+class OverviewMap(QWidget):
+    """The whole map at a glance, with the visible part of the view as a rectangle to drag.
+    
+    The map is drawn as coloured boxes and thin lines into tiles of
+    tile_pixels square, cached at a power of two scene units per pixel, so
+    resizing or a growing map only redraws them past a factor of two.
+    Changes reported through MindMapView.overview_changed redraw just the
+    tiles they touch, a few per repaint, and navigating only moves the
+    rectangle and calls centerOn, so the view never has to draw the whole
+    map. Made visible in the corner of the view by set_overview; it can
+    also be put in a dock, as OverviewMap(view), a view feeds one overview.
+    """
+    tile_pixels = 256
+    tiles_per_paint = 16  # Tiles drawn per repaint, more follow in the next event-loop passes
+    refresh_delay = 100  # ms to collect changes in before tiles are redrawn
+    
+    def __init__(self, view, parent=None):
+        super().__init__(parent)
+        self.view = view
+        view.overview = self
+        self.tiles = {}  # (column, row) -> QImage
+        self.unit = None  # Scene units per pixel of the tiles
+        self.dirty = set()  # Tiles to draw again
+        self.frame = None  # Scene rect shown, fixed while the rectangle is dragged
+        self.grab_offset = None  # From the pointer to the centre of the rectangle while it is dragged
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.setSingleShot(True)
+        self.refresh_timer.timeout.connect(self.refresh)
+        self.setAttribute(Qt.WA_OpaquePaintEvent)  # Over the view, which need not repaint below it
+        self.resize(200, 150)
+        self.setMinimumSize(80, 60)
+        self.setCursor(Qt.PointingHandCursor)
+    
+    def invalidate(self, rect=None):
+        """Draw the tiles over a scene rect again, every tile for None"""
+        if rect is None:
+            self.tiles.clear()
+            self.dirty.clear()
+        elif self.tiles:
+            size = self.tile_pixels * self.unit
+            # Lines are drawn a pixel wide, their ends may reach past the rect
+            first_column, first_row = int((rect.left() - self.unit) // size), int((rect.top() - self.unit) // size)
+            last_column, last_row = int((rect.right() + self.unit) // size), int((rect.bottom() + self.unit) // size)
+            if (last_column - first_column + 1) * (last_row - first_row + 1) > len(self.tiles):
+                self.dirty.update(tile for tile in self.tiles
+                                  if first_column <= tile[0] <= last_column and first_row <= tile[1] <= last_row)
+            else:
+                self.dirty.update(tile for tile in ((column, row) for column in range(first_column, last_column + 1)
+                                                    for row in range(first_row, last_row + 1))
+                                  if tile in self.tiles)
+        self.schedule_refresh()
+    
+    def schedule_refresh(self, delay=None):
+        if not self.refresh_timer.isActive():
+            self.refresh_timer.start(self.refresh_delay if delay is None else delay)
+    
+    def refresh(self):
+        if not self.view.virtualizer:
+            self.view.sync_node_index()  # Which reports the nodes moved
+            self.refresh_timer.stop()
+        self.update()
+    
+    def map_frame(self):
+        """Scene rect to show, the nodes' extent or the visible area of an empty map"""
+        if self.frame is not None:
+            return self.frame
+        view = self.view
+        if view.virtualizer:
+            extent = view.virtualizer.grid.extent()
+        else:
+            view.sync_node_index()
+            extent = view.node_index.extent()
+        if extent is None:
+            return view.mapToScene(view.viewport().rect()).boundingRect()
+        frame = QRectF(*extent)
+        margin = max(frame.width(), frame.height()) * 0.02
+        return frame.adjusted(-margin, -margin, margin, margin)
+    
+    def scene_transform(self, frame):
+        """Return (scale, x offset, y offset) mapping a scene rect centred into the widget"""
+        scale = min(self.width() / frame.width(), self.height() / frame.height())
+        return (scale, (self.width() - frame.width() * scale) / 2 - frame.left() * scale,
+                (self.height() - frame.height() * scale) / 2 - frame.top() * scale)
+    
+    def to_scene(self, pos, frame):
+        scale, dx, dy = self.scene_transform(frame)
+        return QPointF((pos.x() - dx) / scale, (pos.y() - dy) / scale)
+    
+    def render_tiles(self, tiles):
+        """Draw some tiles, with the connections of all of them looked up at once"""
+        unit, pixels = self.unit, self.tile_pixels
+        size = pixels * unit
+        columns, rows = [tile[0] for tile in tiles], [tile[1] for tile in tiles]
+        left, top = min(columns) * size - unit, min(rows) * size - unit
+        solid, dashed = self.view.overview_lines(QRectF(left, top, (max(columns) + 1) * size + unit - left,
+                                                        (max(rows) + 1) * size + unit - top))
+        for column, row in tiles:
+            image = QImage(pixels, pixels, QImage.Format_ARGB32_Premultiplied)
+            image.fill(Qt.transparent)
+            painter = QPainter(image)
+            painter.scale(1 / unit, 1 / unit)
+            painter.translate(-column * size, -row * size)
+            painter.setPen(QPen(Qt.darkGray, 0))
+            painter.drawLines(solid)  # Clipped to the tile by Qt
+            painter.setPen(QPen(Qt.lightGray, 0))
+            painter.drawLines(dashed)
+            boxes = self.view.overview_boxes(QRectF(column * size - unit, row * size - unit,
+                                                    size + 2 * unit, size + 2 * unit))
+            for color, rects in boxes.items():
+                color = QColor(color)
+                painter.setPen(QPen(color, 0))  # At least a pixel, or small nodes would vanish
+                painter.setBrush(color)
+                painter.drawRects(rects)
+            painter.end()
+            self.tiles[(column, row)] = image
+            self.dirty.discard((column, row))
+    
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), QColor(250, 250, 250))
+        frame = self.map_frame()
+        if frame.width() <= 0 or frame.height() <= 0:
+            return
+        scale, dx, dy = self.scene_transform(frame)
+        # The finest power of two at least as fine as the widget, tiles are only ever shrunk
+        unit = 2.0 ** math.floor(math.log2(1 / scale))
+        if unit != self.unit:
+            self.unit = unit
+            self.tiles.clear()
+            self.dirty.clear()
+        size = self.tile_pixels * unit
+        
+        painter.save()
+        painter.translate(dx, dy)
+        painter.scale(scale, scale)
+        painter.setRenderHint(QPainter.SmoothPixmapTransform)
+        shown = [(column, row) for column in range(int(frame.left() // size), int(frame.right() // size) + 1)
+                 for row in range(int(frame.top() // size), int(frame.bottom() // size) + 1)]
+        stale = [tile for tile in shown if tile not in self.tiles or tile in self.dirty]
+        if stale:
+            self.render_tiles(stale[:self.tiles_per_paint])
+            if len(stale) > self.tiles_per_paint:
+                self.schedule_refresh(0)
+        for column, row in shown:
+            image = self.tiles.get((column, row))
+            if image is not None:
+                painter.drawImage(QRectF(column * size, row * size, size, size), image)
+        
+        visible = self.view.mapToScene(self.view.viewport().rect()).boundingRect()
+        painter.setPen(QPen(Qt.red, 0))
+        painter.setBrush(QColor(255, 0, 0, 40))
+        painter.drawRect(visible)
+        painter.restore()
+        painter.setPen(QPen(Qt.gray, 0))
+        painter.setBrush(Qt.NoBrush)
+        painter.drawRect(self.rect().adjusted(0, 0, -1, -1))
+    
+    def mousePressEvent(self, event):
+        if event.button() != Qt.LeftButton:
+            return
+        self.frame = self.map_frame()
+        point = self.to_scene(event.pos(), self.frame)
+        visible = self.view.mapToScene(self.view.viewport().rect()).boundingRect()
+        # Grabbing the rectangle drags it from there, a click elsewhere jumps
+        self.grab_offset = visible.center() - point if visible.contains(point) else QPointF()
+        self.view.centerOn(point + self.grab_offset)
+    
+    def mouseMoveEvent(self, event):
+        if self.grab_offset is not None:
+            self.view.centerOn(self.to_scene(event.pos(), self.frame) + self.grab_offset)
+    
+    def mouseReleaseEvent(self, event):
+        self.grab_offset = self.frame = None
+        self.update()
+
+
+class FrameTimer(QObject):
+    """Times the paint events of a view's viewport as PROFILER frames while it filters them.
+    
+    Qt calls paintEvent from C++, and PyQt only looks for a Python version
+    of it the first time, so a wrapper set once the view has painted would
+    never run. The filter paints the viewport itself, through the view's
+    viewportEvent, between its two clock readings.
+    """
+    
+    def __init__(self, view):
+        super().__init__(view)
+        self.view = view
+    
+    def eventFilter(self, watched, event):
+        if event.type() != QEvent.Paint or not PROFILER.enabled:
+            return False
+        start = time.perf_counter()
+        self.view.viewportEvent(event)
+        PROFILER.record_frame("frame", start, time.perf_counter())
+        return True
+
+
+# The hot paths timed while profiling, see MindMapView.set_profiling
+PROFILER = Profiler()
+for _cls, _name, _label in (
+        (MindMapNode, "itemChange", "itemChange"),
+        (MindMapNode, "move_children", "move_children"),
+        (MindMapNode, "update_connection_line", "update_connection_line"),
+        (MindMapView, "update_lines", "update_lines"),
+        (MindMapView, "sync_node_index", "sync_node_index"),
+        (MindMapView, "update_layout", "update_layout"),
+        (MindMapNode, "center_text", "text layout"),
+        (NodeTextItem, "setTextWidth", "text layout"),
+        (MindMapNode, "paint", "paint node"),
+        (NodeTextItem, "paint", "paint text"),
+        (EdgeLayer, "paint", "paint lines"),
+        (MindMapView, "drawBackground", "paint background")):
+    PROFILER.instrument(_cls, _name, _label)